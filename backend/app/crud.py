@@ -1,18 +1,303 @@
-from sqlalchemy import select
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, exists, func, insert, literal, select, text, update
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
-from . import models
+from . import models, queries
+
+# rows per staging load / MERGE; also keeps IN-lists under SQL Server's
+# 2100 parameter limit on the portable path
+UPSERT_CHUNK = 1000
+
+_STAGE_CREATE = """
+IF OBJECT_ID('tempdb..#items_stage') IS NOT NULL DROP TABLE #items_stage;
+CREATE TABLE #items_stage (
+    sku NVARCHAR(64) COLLATE DATABASE_DEFAULT NOT NULL PRIMARY KEY,
+    name NVARCHAR(MAX) COLLATE DATABASE_DEFAULT NOT NULL,
+    barcode NVARCHAR(64) COLLATE DATABASE_DEFAULT NULL,
+    price FLOAT NOT NULL
+);
+"""
+
+# EXCEPT gives a NULL-safe "did anything change" check
+_STAGE_MERGE = """
+MERGE items WITH (HOLDLOCK) AS t
+USING #items_stage AS s ON t.sku = s.sku
+WHEN MATCHED AND EXISTS (
+    SELECT t.name, t.barcode, t.price EXCEPT SELECT s.name, s.barcode, s.price
+) THEN
+    UPDATE SET name = s.name, barcode = s.barcode, price = s.price
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT (sku, name, barcode, price) VALUES (s.sku, s.name, s.barcode, s.price)
+OUTPUT $action, inserted.id;
+"""
+
 
-async def upsert_items(session: AsyncSession, items: list[dict]):
+def _dedupe(items: list[dict]) -> list[dict]:
+    # last row wins for a repeated SKU (MERGE rejects duplicate source keys); case-insensitive
+    # like the database collation, or "AB-1" and "ab-1" collide on #items_stage's primary key
+    by_sku: dict[str, dict] = {}
     for it in items:
-        res = await session.execute(select(models.Item).where(models.Item.sku == it["sku"]))
-        row = res.scalar_one_or_none()
-        if row:
-            row.name = it["name"]
-            row.barcode = it.get("barcode")
-            row.price = it["price"]
+        by_sku[it["sku"].casefold()] = {
+            "sku": it["sku"],
+            "name": it["name"],
+            "barcode": it.get("barcode"),
+            "price": it["price"],
+        }
+    return list(by_sku.values())
+
+
+async def _merge_chunk_mssql(session: AsyncSession, rows: list[dict]) -> tuple[int, list[int]]:
+    conn = await session.connection()
+    await conn.exec_driver_sql("TRUNCATE TABLE #items_stage")
+    # executemany -> pyodbc fast_executemany when enabled on the engine
+    await conn.execute(
+        text("INSERT INTO #items_stage (sku, name, barcode, price) VALUES (:sku, :name, :barcode, :price)"),
+        rows,
+    )
+    actions = (await conn.exec_driver_sql(_STAGE_MERGE)).all()
+    return (
+        sum(1 for action, _ in actions if action == "INSERT"),
+        [id_ for action, id_ in actions if action == "UPDATE"],
+    )
+
+
+async def _merge_chunk_generic(session: AsyncSession, rows: list[dict]) -> tuple[int, list[int]]:
+    res = await session.execute(
+        select(models.Item.id, models.Item.sku, models.Item.name, models.Item.barcode, models.Item.price)
+        .where(models.Item.sku.in_([r["sku"] for r in rows]))
+    )
+    existing = {sku: (id_, name, barcode, price) for id_, sku, name, barcode, price in res.all()}
+    inserts, updates = [], []
+    for r in rows:
+        cur = existing.get(r["sku"])
+        if cur is None:
+            inserts.append(r)
+        elif cur[1:] != (r["name"], r["barcode"], r["price"]):
+            updates.append({"id": cur[0], "name": r["name"], "barcode": r["barcode"], "price": r["price"]})
+    if inserts:
+        # render_nulls: a missing barcode must not split the executemany into per-shape batches
+        await session.execute(insert(models.Item).execution_options(render_nulls=True), inserts)
+    if updates:
+        await session.execute(update(models.Item), updates)
+    return len(inserts), [u["id"] for u in updates]
+
+
+async def upsert_items(session: AsyncSession, items: list[dict]) -> dict:
+    """
+    Set-based upsert by SKU, one transaction.
+
+    On SQL Server each chunk is bulk-loaded into a #temp staging table and
+    applied with a single MERGE; other dialects (SQLite for benchmarks) use one
+    lookup + one executemany per chunk. Rows whose name/barcode/price did not
+    change are not written. Returns inserted/updated/unchanged counts.
+    """
+    rows = _dedupe(items)
+    mssql = session.bind.dialect.name == "mssql"
+    inserted, updated_ids = 0, []
+    if mssql and rows:
+        conn = await session.connection()
+        await conn.exec_driver_sql(_STAGE_CREATE)
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        chunk = rows[i:i + UPSERT_CHUNK]
+        if mssql:
+            ins, upd = await _merge_chunk_mssql(session, chunk)
         else:
-            session.add(models.Item(**it))
+            ins, upd = await _merge_chunk_generic(session, chunk)
+        inserted += ins
+        updated_ids += upd
+    if mssql and rows:
+        await conn.exec_driver_sql("DROP TABLE #items_stage")
+    # new items have no approved match yet; changed ones carry our price into the comparison
+    await refresh_comparisons(session, item_ids=updated_ids)
+    updated = len(updated_ids)
+    if inserted or updated:
+        await bump_data_version(session)
     await session.commit()
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": len(rows) - inserted - updated,
+    }
+
+async def record_prices(session: AsyncSession, prices: dict[int, float]) -> dict:
+    """
+    Store scraped prices ({competitor_product_id: price}) in `competitor_prices`.
+
+    A snapshot row is only inserted when the price differs from the latest one;
+    unchanged prices get their `checked_at` bumped in one UPDATE per chunk.
+    Does not commit.
+    """
+    now = datetime.now(timezone.utc)
+    changed = unchanged = 0
+    ids = list(prices)
+    for i in range(0, len(ids), UPSERT_CHUNK):
+        chunk = ids[i:i + UPSERT_CHUNK]
+        res = await session.execute(
+            select(
+                models.CompetitorPrice.id,
+                models.CompetitorPrice.competitor_product_id,
+                models.CompetitorPrice.price,
+            )
+            .join(
+                models.CompetitorProduct,
+                models.CompetitorPrice.id == queries.latest_price_id(models.CompetitorProduct.id),
+            )
+            .where(models.CompetitorProduct.id.in_(chunk))
+        )
+        latest = {cp_id: (snap_id, price) for snap_id, cp_id, price in res.all()}
+        same, new = [], []
+        for cp_id in chunk:
+            cur = latest.get(cp_id)
+            if cur is not None and abs(cur[1] - prices[cp_id]) < 0.005:
+                same.append(cur[0])
+            else:
+                new.append(
+                    {"competitor_product_id": cp_id, "price": prices[cp_id], "fetched_at": now, "checked_at": now}
+                )
+        if new:
+            await session.execute(insert(models.CompetitorPrice), new)
+        if same:
+            await session.execute(
+                update(models.CompetitorPrice)
+                .where(models.CompetitorPrice.id.in_(same))
+                .values(checked_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        changed += len(new)
+        unchanged += len(same)
+    if ids:
+        # checked_at moved even when no price did
+        await refresh_comparisons(session, competitor_product_ids=ids)
+        await bump_data_version(session)
+    return {"changed": changed, "unchanged": unchanged}
+
+async def upsert_competitor_products(session: AsyncSession, competitor_id: int, products: list[dict]) -> dict:
+    """
+    Set-based upsert of scraped products (sku, name, url, barcode, price) by
+    (competitor_id, sku): one lookup, one bulk INSERT and one bulk UPDATE per
+    chunk; a stored barcode is kept when the new row has none. Prices go
+    through record_prices. Does not commit.
+    """
+    by_sku = {p["sku"]: p for p in products if p.get("sku")}
+    skus = list(by_sku)
+    CP = models.CompetitorProduct
+    inserted, updated_ids = 0, []
+    prices: dict[int, float] = {}
+    for i in range(0, len(skus), UPSERT_CHUNK):
+        chunk = skus[i:i + UPSERT_CHUNK]
+        res = await session.execute(
+            select(CP.id, CP.sku, CP.name, CP.url, CP.barcode)
+            .where(CP.competitor_id == competitor_id, CP.sku.in_(chunk))
+        )
+        existing = {sku: (id_, name, url, barcode) for id_, sku, name, url, barcode in res.all()}
+        inserts, updates = [], []
+        for sku in chunk:
+            p = by_sku[sku]
+            cur = existing.get(sku)
+            if cur is None:
+                inserts.append({
+                    "competitor_id": competitor_id,
+                    "sku": sku,
+                    "name": p["name"],
+                    "url": p["url"],
+                    "barcode": p.get("barcode"),
+                })
+                continue
+            barcode = p.get("barcode") or cur[3]
+            if cur[1:] != (p["name"], p["url"], barcode):
+                updates.append({"id": cur[0], "name": p["name"], "url": p["url"], "barcode": barcode})
+        if inserts:
+            await session.execute(insert(CP).execution_options(render_nulls=True), inserts)
+            res = await session.execute(
+                select(CP.sku, CP.id).where(
+                    CP.competitor_id == competitor_id, CP.sku.in_([r["sku"] for r in inserts])
+                )
+            )
+            existing.update({sku: (id_,) for sku, id_ in res.all()})
+        if updates:
+            await session.execute(update(CP), updates)
+        inserted += len(inserts)
+        updated_ids += [u["id"] for u in updates]
+        prices.update(
+            {existing[sku][0]: by_sku[sku]["price"] for sku in chunk if by_sku[sku].get("price") is not None}
+        )
+    counts = await record_prices(session, prices)
+    # record_prices refreshed the priced ones; renamed / moved products without a price too
+    await refresh_comparisons(session, competitor_product_ids=[i for i in updated_ids if i not in prices])
+    if (inserted or updated_ids) and not prices:
+        await bump_data_version(session)  # record_prices bumps it otherwise
+    return {
+        "inserted": inserted,
+        "updated": len(updated_ids),
+        "unchanged": len(skus) - inserted - len(updated_ids),
+        "prices_changed": counts["changed"],
+    }
+
+async def refresh_comparisons(
+    session: AsyncSession,
+    item_ids=(),
+    competitor_product_ids=(),
+) -> int:
+    """
+    Recompute the `price_comparisons` rows of the given items and of the items
+    with an approved match to the given competitor products: per chunk one
+    DELETE and one INSERT ... SELECT (queries.comparison_source). Call it in
+    the transaction of the write that changed them; does not commit. Returns
+    the number of rows written.
+    """
+    items = set(item_ids)
+    cp_ids = list(competitor_product_ids)
+    for i in range(0, len(cp_ids), UPSERT_CHUNK):
+        res = await session.execute(
+            select(models.Match.item_id).where(
+                models.Match.competitor_product_id.in_(cp_ids[i:i + UPSERT_CHUNK]),
+                models.Match.approved.is_(True),
+            )
+        )
+        items.update(res.scalars().all())
+    ids = sorted(items)
+    PC = models.PriceComparison
+    written = 0
+    for i in range(0, len(ids), UPSERT_CHUNK):
+        chunk = ids[i:i + UPSERT_CHUNK]
+        await session.execute(delete(PC).where(PC.item_id.in_(chunk)))
+        res = await session.execute(
+            insert(PC).from_select(
+                queries.COMPARISON_COLUMNS,
+                queries.comparison_source().where(models.Match.item_id.in_(chunk)),
+            )
+        )
+        written += res.rowcount
+    return written
+
+async def rebuild_comparisons(session: AsyncSession) -> int:
+    """Recompute the whole `price_comparisons` table in one statement; does not commit."""
+    await session.execute(delete(models.PriceComparison))
+    res = await session.execute(
+        insert(models.PriceComparison).from_select(queries.COMPARISON_COLUMNS, queries.comparison_source())
+    )
+    return res.rowcount
+
+DATA_SCOPE = "catalog"
+
+async def bump_data_version(session: AsyncSession) -> None:
+    """Invalidate cached views; runs in the caller's transaction (no commit)."""
+    res = await session.execute(
+        update(models.DataVersion)
+        .where(models.DataVersion.scope == DATA_SCOPE)
+        .values(version=models.DataVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount == 0:
+        session.add(models.DataVersion(scope=DATA_SCOPE, version=1))
+        await session.flush()
+
+async def get_data_version(session: AsyncSession) -> int:
+    res = await session.execute(
+        select(models.DataVersion.version).where(models.DataVersion.scope == DATA_SCOPE)
+    )
+    return res.scalar_one_or_none() or 0
 
 async def create_tag(session: AsyncSession, name: str, email: str | None):
     tag = models.Tag(name=name, email=email)
@@ -20,3 +305,86 @@ async def create_tag(session: AsyncSession, name: str, email: str | None):
     await session.commit()
     await session.refresh(tag)
     return tag
+
+
+# ---------- tag membership ----------
+
+UNKNOWN_SKU_SAMPLE = 100  # unknown SKUs listed back to the caller
+
+
+def _add_members(tag_id: int, *where):
+    """INSERT … SELECT the items matching `where` that are not in the tag yet."""
+    it = aliased(models.ItemTag, name="cur")
+    # UPDLOCK/HOLDLOCK: a concurrent add cannot slip in between the check and the insert
+    member = select(it.id).where(it.item_id == models.Item.id, it.tag_id == tag_id).with_hint(
+        it, "WITH (UPDLOCK, HOLDLOCK)", "mssql"
+    )
+    return insert(models.ItemTag).from_select(
+        ["item_id", "tag_id"],
+        select(models.Item.id, literal(tag_id)).where(*where, ~exists(member)),
+    )
+
+
+def _remove_members(tag_id: int, *where):
+    return delete(models.ItemTag).where(
+        models.ItemTag.tag_id == tag_id,
+        models.ItemTag.item_id.in_(select(models.Item.id).where(*where)),
+    )
+
+
+async def _change_members(session, tag_id, statement, skus, filters) -> dict:
+    if skus is None:
+        matched = (
+            await session.execute(select(func.count()).select_from(models.Item).where(*filters))
+        ).scalar_one()
+        changed = (await session.execute(statement(tag_id, *filters))).rowcount
+        counts = {"matched": matched, "changed": changed}
+    else:
+        skus = list(dict.fromkeys(s.strip() for s in skus if s and s.strip()))
+        matched, changed, unknown = 0, 0, []
+        for i in range(0, len(skus), UPSERT_CHUNK):
+            chunk = skus[i:i + UPSERT_CHUNK]
+            found = (
+                await session.execute(select(models.Item.sku).where(models.Item.sku.in_(chunk)))
+            ).scalars().all()
+            matched += len(found)
+            # SQL Server compares SKUs case-insensitively
+            known = {s.casefold() for s in found}
+            unknown += [s for s in chunk if s.casefold() not in known]
+            changed += (await session.execute(statement(tag_id, models.Item.sku.in_(chunk)))).rowcount
+        counts = {
+            "requested": len(skus),
+            "matched": matched,
+            "changed": changed,
+            "unknown": len(unknown),
+            "unknown_skus": unknown[:UNKNOWN_SKU_SAMPLE],
+        }
+    if changed:
+        await bump_data_version(session)
+    await session.commit()
+    return counts
+
+
+async def add_tag_items(
+    session: AsyncSession, tag_id: int, skus: list[str] | None = None, filters: list | None = None
+) -> dict:
+    """
+    Add items to a tag, by SKU (chunks of UPSERT_CHUNK) or by `queries.item_filters`
+    clauses (an empty list is every item), one transaction. Set-based: one INSERT … SELECT per chunk that skips
+    items already in the tag (uq_item_tag). Returns matched/added/already_tagged,
+    plus requested/unknown counts and a sample of unknown SKUs for a SKU list.
+    """
+    counts = await _change_members(session, tag_id, _add_members, skus, filters or [])
+    counts["added"] = counts.pop("changed")
+    counts["already_tagged"] = counts["matched"] - counts["added"]
+    return counts
+
+
+async def remove_tag_items(
+    session: AsyncSession, tag_id: int, skus: list[str] | None = None, filters: list | None = None
+) -> dict:
+    """Counterpart of add_tag_items: one DELETE per chunk; returns removed/not_tagged."""
+    counts = await _change_members(session, tag_id, _remove_members, skus, filters or [])
+    counts["removed"] = counts.pop("changed")
+    counts["not_tagged"] = counts["matched"] - counts["removed"]
+    return counts
@@ -1,9 +1,29 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import Integer
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.sql.functions import FunctionElement
 from .config import settings
 
-engine = create_async_engine(settings.MSSQL_DSN, echo=False, pool_pre_ping=True)
+def _engine(dsn: str):
+    kwargs = {}
+    if dsn.startswith("mssql"):
+        # pyodbc array binding for executemany (bulk upserts into #staging tables)
+        kwargs["fast_executemany"] = settings.MSSQL_FAST_EXECUTEMANY
+    if not dsn.startswith("sqlite"):  # SQLite files get a NullPool: nothing to size
+        kwargs.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return create_async_engine(dsn, echo=False, pool_pre_ping=True, **kwargs)
+
+engine = _engine(settings.MSSQL_DSN)
+# read-only endpoints (get_read_session) use the replica when one is configured
+read_engine = _engine(settings.MSSQL_READ_DSN) if settings.MSSQL_READ_DSN else engine
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+ReadSessionLocal = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
 
 class Base(DeclarativeBase):
     pass
@@ -11,3 +31,58 @@ class Base(DeclarativeBase):
 async def get_session() -> AsyncSession:
     async with SessionLocal() as session:
         yield session
+
+async def get_read_session() -> AsyncSession:
+    """
+    For endpoints that only read: the read replica (MSSQL_READ_DSN) when set,
+    else the primary. Replica data can lag the primary by a little; writes
+    always go through get_session.
+    """
+    async with ReadSessionLocal() as session:
+        yield session
+
+def engines() -> dict[str, AsyncEngine]:
+    """Pool name -> engine; "replica" only when it is a separate one."""
+    out = {"primary": engine}
+    if read_engine is not engine:
+        out["replica"] = read_engine
+    return out
+
+def pool_stats() -> dict[str, dict]:
+    """Connections per pool (pools without a size, e.g. SQLite's NullPool, are left out)."""
+    out = {}
+    for name, eng in engines().items():
+        pool = eng.pool
+        if not hasattr(pool, "size"):
+            continue
+        size, checked_out = pool.size(), pool.checkedout()
+        capacity = size + max(0, settings.DB_MAX_OVERFLOW)
+        out[name] = {
+            "size": size,
+            "checked_out": checked_out,
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "utilisation": round(checked_out / capacity, 4) if capacity else 0.0,
+        }
+    return out
+
+
+# ---------- Dialect-specific SQL helpers ----------
+
+class seconds_since(FunctionElement):
+    """Whole seconds between a UTC timestamp column and now, computed in SQL."""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(seconds_since, "mssql")
+def _seconds_since_mssql(element, compiler, **kw):
+    return "DATEDIFF_BIG(second, %s, SYSDATETIMEOFFSET())" % compiler.process(element.clauses, **kw)
+
+
+@compiles(seconds_since, "sqlite")
+def _seconds_since_sqlite(element, compiler, **kw):
+    # SQLite (benchmarks / local runs) stores timestamps as UTC text
+    return "CAST((julianday('now') - julianday(%s)) * 86400 AS INTEGER)" % compiler.process(
+        element.clauses, **kw
+    )
@@ -0,0 +1,67 @@
+"""
+Structured logging: one JSON object per line on stderr, tagged with the
+request id of the HTTP request (or scheduler job) being served.
+
+    log = logging.getLogger(__name__)
+    log.info("price refresh finished", extra={"competitor": code, **report})
+
+Keys passed via `extra=` become top-level fields. LOG_FORMAT=text switches to
+plain lines for local development.
+"""
+import contextvars
+import datetime as dt
+import json
+import logging
+import sys
+
+from .config import settings
+
+request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+
+# attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": dt.datetime.fromtimestamp(record.created, dt.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        rid = request_id.get()
+        if rid:
+            out["request_id"] = rid
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.rid = request_id.get() or "-"
+        return True
+
+
+def setup() -> None:
+    """Install the root handler once; safe to call from every entry point."""
+    root = logging.getLogger()
+    if any(getattr(h, "_pricecompare", False) for h in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler._pricecompare = True
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.addFilter(_RequestIdFilter())
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(rid)s] %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    # uvicorn's access log duplicates the request line we emit in main.py;
+    # httpx logs every scraper request at INFO (they are in /metrics instead)
+    logging.getLogger("uvicorn.access").disabled = True
+    logging.getLogger("httpx").setLevel(logging.WARNING)
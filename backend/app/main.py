@@ -2,40 +2,99 @@ from __future__ import annotations
 
 import os
 import pathlib
+import tempfile
 import contextlib
+import functools
+import logging
+import time
+import uuid
 from typing import AsyncIterator
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 
 from .config import settings
-from .db import Base, engine, SessionLocal
-from . import models
-from .services.excel import write_comparison_xlsx
-from .services.emailer import send_email_with_attachment
-from starlette.requests import Request
-from starlette.responses import Response
-import time
+from .db import engine, engines, pool_stats, SessionLocal
+from . import crud, logs, metrics, migrations, models, sqltrace
+from .services import (
+    catalogue, http_client, outbox, parsing, price_refresh, response_cache, scheduler, scrapers,
+)
+
+logs.setup()
+log = logging.getLogger(__name__)
+for _engine in engines().values():  # primary, and the read replica when configured
+    sqltrace.instrument(_engine.sync_engine)
 
 app = FastAPI(title=settings.APP_NAME)
 
-@app.middleware("http")
-async def _log_requests(request: Request, call_next):
-    start = time.perf_counter()
-    try:
-        response: Response = await call_next(request)
-        return response
-    finally:
-        dur_ms = int((time.perf_counter() - start) * 1000)
-        print(f"{request.method} {request.url.path} -> {dur_ms}ms")
+
+class _RequestMetrics:
+    """
+    Pure ASGI (unlike @app.middleware) so streamed bodies are timed to the
+    last chunk and the handler's context vars stay visible to the DB hooks.
+    Sets the request id (X-Request-ID in, or a new one; echoed back), records
+    latency and per-request SQL totals (N+1 suspects are logged by
+    sqltrace), and logs one line per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        rid = incoming or uuid.uuid4().hex[:16]
+        rid_token = logs.request_id.set(rid)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-request-id", rid.encode())]
+            await send(message)
+
+        # set up front: the finally below must not depend on the request getting anywhere
+        route = "unmatched"
+        db = sqltrace.QueryStats()
+        try:
+            with sqltrace.track(stats=db):
+                try:
+                    await self.app(scope, receive, send_with_id)
+                finally:
+                    # route template (FastAPI sets scope["route"]), never the raw path: bounded label values
+                    route = getattr(scope.get("route"), "path", None) or "unmatched"
+                    db.label = f"{scope['method']} {route}"
+        finally:
+            elapsed = time.perf_counter() - start
+            method = scope["method"]
+            metrics.http_requests.observe(elapsed, method=method, route=route, status=status)
+            metrics.http_db_queries.observe(db.count, method=method, route=route)
+            metrics.http_db_seconds.observe(db.seconds, method=method, route=route)
+            log.info(
+                "request",
+                extra={
+                    "method": method,
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "db_queries": db.count,
+                    "db_ms": round(db.seconds * 1000, 1),
+                },
+            )
+            logs.request_id.reset(rid_token)
+
+
+app.add_middleware(_RequestMetrics)
 
 # ---------- CORS ----------
 app.add_middleware(
@@ -55,7 +114,7 @@ app.include_router(schedules.router)
 
 # ---------- Static UI ----------
 FRONTEND_DIST = pathlib.Path(__file__).resolve().parents[1].parent / "frontend" / "dist"
-print("Serving UI from:", FRONTEND_DIST)
+log.info("serving UI", extra={"path": str(FRONTEND_DIST), "built": FRONTEND_DIST.exists()})
 
 if FRONTEND_DIST.exists():
     app.mount("/ui", StaticFiles(directory=str(FRONTEND_DIST), html=True), name="ui")
@@ -81,17 +140,63 @@ async def root():
 async def health():
     return {"status": "ok"}
 
-# ---------- Scheduler ----------
-scheduler = AsyncIOScheduler()
+@app.get("/health/scraper")
+async def health_scraper():
+    """Scraper HTTP client counters (connection reuse, retries) and cache stats."""
+    return {
+        **http_client.stats(),
+        "scrapers": {sc.code: sc.stats() for sc in scrapers.all_scrapers()},
+        "response_cache": response_cache.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text format; counters are per process (scrape each worker)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@metrics.collector
+def _cache_metrics():
+    for sc in scrapers.all_scrapers():
+        st = sc.cache.stats()
+        for result in ("hits", "negative_hits", "misses", "coalesced"):
+            yield (
+                "barcode_cache_lookups_total", "counter", "Barcode cache lookups by result",
+                {"competitor": sc.code, "result": result}, st[result],
+            )
+        yield "barcode_cache_hit_ratio", "gauge", "Barcode cache hit ratio", {"competitor": sc.code}, st["hit_ratio"]
+        yield "barcode_cache_entries", "gauge", "Barcode cache size", {"competitor": sc.code}, st["size"]
+        yield "scraper_in_flight", "gauge", "Scraper requests in flight", {"competitor": sc.code}, sc.stats()["in_flight"]
+    st = response_cache.stats()
+    for result in ("hits", "not_modified", "misses"):
+        yield "response_cache_requests_total", "counter", "Response cache lookups by result", {"result": result}, st[result]
+    yield "response_cache_hit_ratio", "gauge", "Response cache hit ratio (304s count as hits)", {}, st["hit_ratio"]
+    yield "response_cache_entries", "gauge", "Response cache size", {}, st["size"]
+    st = http_client.stats()
+    yield "scraper_tcp_connects_total", "counter", "New scraper connections opened", {}, st["tcp_connects"]
+    yield "scraper_retries_total", "counter", "Scraper request retries", {}, st["retries"]
+
+
+@metrics.collector
+def _pool_metrics():
+    # size with these: utilisation near 1 means requests queue for up to DB_POOL_TIMEOUT
+    for pool, st in pool_stats().items():
+        labels = {"pool": pool}
+        yield "db_pool_size", "gauge", "Connections kept in the pool", labels, st["size"]
+        yield "db_pool_checked_out", "gauge", "Connections in use", labels, st["checked_out"]
+        yield "db_pool_overflow", "gauge", "Connections open beyond the pool size", labels, st["overflow"]
+        yield (
+            "db_pool_utilisation", "gauge", "Connections in use / (pool size + max overflow)",
+            labels, st["utilisation"],
+        )
+
 
+# ---------- Startup ----------
 
 async def _ensure_schema_and_seed() -> None:
-    """Create schema if missing (idempotent) and seed competitor (upsert)."""
-    print("DB: creating schema if missing …")
-    async with engine.begin() as conn:
-        # MetaData.create_all is already checkfirst=True internally.
-        await conn.run_sync(Base.metadata.create_all)
-    print("DB: schema ready.")
+    """Bring the schema to the current version (app/migrations) and seed competitor (upsert)."""
+    # one version lookup when nothing is pending; no table reflection
+    await migrations.upgrade(engine)
 
     # Seed competitor with merge-like behavior
     async with SessionLocal() as s:  # type: AsyncSession
@@ -108,88 +213,123 @@ async def _ensure_schema_and_seed() -> None:
                 )
             )
             await s.commit()
-            print("DB: seeded competitor 'praktiker'.")
+            log.info("DB: seeded competitor", extra={"competitor": "praktiker"})
         else:
             # keep name/url up to date without creating duplicates
             comp.name = "Praktiker"
             comp.base_url = "https://praktiker.bg"
             await s.commit()
-            print("DB: competitor 'praktiker' up-to-date.")
+            log.info("DB: competitor up-to-date", extra={"competitor": "praktiker"})
 
+        # the response-cache version row must exist before concurrent bumps
+        if await s.get(models.DataVersion, crud.DATA_SCOPE) is None:
+            s.add(models.DataVersion(scope=crud.DATA_SCOPE, version=0))
+            await s.commit()
 
-async def _refresh_schedules() -> None:
-    scheduler.remove_all_jobs()
-    async with SessionLocal() as s:  # type: AsyncSession
-        res = await s.execute(
-            select(models.EmailSchedule, models.Tag)
-            .join(models.Tag, models.Tag.id == models.EmailSchedule.tag_id)
-            .where(models.EmailSchedule.active == True)  # noqa: E712
-        )
-        for sch, tag in res.all():
-            scheduler.add_job(
-                _run_email_job,
-                CronTrigger.from_crontab(sch.cron),
-                kwargs={"tag_id": tag.id},
-                id=f"email_tag_{tag.id}_{sch.id}",
-                replace_existing=True,
-            )
-    print(f"Scheduler: loaded {len(scheduler.get_jobs())} job(s).")
 
+# ---------- Scheduled jobs (services/scheduler.py) ----------
 
-async def _run_email_job(tag_id: int) -> None:
-    async with SessionLocal() as s:  # type: AsyncSession
-        comp = (
-            await s.execute(
-                select(models.Competitor).where(models.Competitor.code == "praktiker")
-            )
-        ).scalar_one()
+def _timed_job(name: str):
+    """
+    Job duration / SQL statement metrics and a request id per run, so its log
+    lines group together.
+    """
 
-        q_items = await s.execute(
-            select(models.Item)
-            .join(models.ItemTag, models.ItemTag.item_id == models.Item.id)
-            .where(models.ItemTag.tag_id == tag_id)
-        )
-        items = q_items.scalars().all()
-
-        rows = []
-        for it in items:
-            q_match = await s.execute(
-                select(models.Match, models.CompetitorProduct)
-                .join(
-                    models.CompetitorProduct,
-                    models.CompetitorProduct.id == models.Match.competitor_product_id,
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def run(*args, **kwargs):
+            token = logs.request_id.set(f"job-{name}-{uuid.uuid4().hex[:8]}")
+            outcome = "error"
+            start = time.perf_counter()
+            try:
+                with sqltrace.track(f"job:{name}") as db:
+                    await fn(*args, **kwargs)
+                outcome = "ok"
+            finally:
+                elapsed = time.perf_counter() - start
+                metrics.job_runs.observe(elapsed, job=name, outcome=outcome)
+                metrics.job_db_queries.observe(db.count, job=name)
+                log.info(
+                    "Scheduler: job finished",
+                    extra={
+                        "job": name,
+                        "outcome": outcome,
+                        "duration_ms": round(elapsed * 1000, 1),
+                        "db_queries": db.count,
+                        "db_ms": round(db.seconds * 1000, 1),
+                        **kwargs,
+                    },
                 )
-                .where(
-                    models.Match.item_id == it.id,
-                    models.Match.approved == True,  # noqa: E712
-                    models.CompetitorProduct.competitor_id == comp.id,
-                )
-            )
-            mm = q_match.first()
-            rows.append(
-                {
-                    "our_sku": it.sku,
-                    "comp_sku": mm[1].sku if mm else None,
-                    "our_name": it.name,
-                    "comp_name": mm[1].name if mm else None,
-                    "our_price": it.price,
-                    "comp_price": None,
-                    "diff": None,
-                }
-            )
+                logs.request_id.reset(token)
+
+        return run
+
+    return wrap
+
 
-        path = write_comparison_xlsx(rows, f"/tmp/pricecompare_tag_{tag_id}.xlsx")
-        tag = (
-            await s.execute(select(models.Tag).where(models.Tag.id == tag_id))
-        ).scalar_one()
-        if tag.email:
-            send_email_with_attachment(
+@_timed_job("email_report")
+async def _run_email_job(tag_id: int) -> None:
+    """Build the tag report and queue it; delivery happens in services/outbox.py."""
+    from .services import reports  # openpyxl: only this job writes workbooks
+
+    # written where the outbox keeps attachments: the queued row only holds the path
+    os.makedirs(settings.EMAIL_ATTACHMENTS_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(
+        prefix=f"pricecompare_tag_{tag_id}_", suffix=".xlsx", dir=settings.EMAIL_ATTACHMENTS_DIR
+    )
+    os.close(fd)
+    queued = False
+    try:
+        async with SessionLocal() as s:  # type: AsyncSession
+            competitors = (
+                await s.execute(select(models.Competitor).order_by(models.Competitor.code))
+            ).scalars().all()
+            tag = (
+                await s.execute(select(models.Tag).where(models.Tag.id == tag_id))
+            ).scalar_one_or_none()
+            if tag is None:
+                log.info("Scheduler: tag is gone, skipping", extra={"tag_id": tag_id})
+                return
+            if not tag.email:
+                log.info("Scheduler: tag has no email, skipping", extra={"tag_id": tag_id})
+                return
+
+            n_rows = await reports.write_tag_report(s, tag_id, competitors, path)
+            await outbox.enqueue(
+                s,
                 tag.email,
                 "Price comparison",
                 "Attached is your comparison.",
-                path,
+                attachment_name=f"pricecompare_tag_{tag_id}.xlsx",
+                tag_id=tag_id,
+                attachment_path=path,
             )
-    print(f"Scheduler: email job for tag {tag_id} finished.")
+            queued = True
+    finally:
+        if not queued:  # once queued, the outbox deletes it after sending
+            with contextlib.suppress(OSError):
+                os.remove(path)
+    log.info("Scheduler: email queued", extra={"tag_id": tag_id, "rows": n_rows})
+
+
+@_timed_job("price_refresh")
+async def _run_price_refresh() -> None:
+    # all competitors at once; each site is bounded by its own scraper budget
+    reports_by_code = await price_refresh.refresh_all()
+    for code, report in reports_by_code.items():
+        log.info("Scheduler: price refresh finished", extra={"competitor": code, "report": report})
+
+
+@_timed_job("catalogue_crawl")
+async def _run_catalogue_crawl() -> None:
+    reports_by_code = await catalogue.crawl_all()
+    for code, report in reports_by_code.items():
+        log.info("Scheduler: catalogue crawl finished", extra={"competitor": code, "report": report})
+
+
+scheduler.register(scheduler.EMAIL_HANDLER, _run_email_job)
+scheduler.register("price_refresh", _run_price_refresh)
+scheduler.register("catalogue_crawl", _run_catalogue_crawl)
 
 
 # ---------- Lifespan (startup/shutdown) ----------
@@ -198,28 +338,34 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     # STARTUP
     try:
         await _ensure_schema_and_seed()
-    except Exception as e:  # fail fast with a clear log
-        import traceback
-        print("Startup failed while ensuring schema/seeding:")
-        traceback.print_exc()
+    except Exception:  # fail fast with a clear log
+        log.exception("Startup failed while ensuring schema/seeding")
         raise
 
+    await outbox.start()
+
     try:
-        await _refresh_schedules()
-        scheduler.start()
-        print("Scheduler: started.")
+        # jobs live in the database: every worker polls, one runs each fire time
+        await scheduler.sync({
+            "price_refresh": settings.PRICE_REFRESH_CRON,
+            "catalogue_crawl": settings.CATALOGUE_CRAWL_CRON,
+        })
+        await scheduler.start()
     except Exception:
-        import traceback
-        print("Scheduler failed to start:")
-        traceback.print_exc()
+        log.exception("Scheduler failed to start")
         # don’t block API if scheduler fails
     try:
         yield
     finally:
         # SHUTDOWN
         with contextlib.suppress(Exception):
-            scheduler.shutdown(wait=False)
-            print("Scheduler: stopped.")
+            await scheduler.stop()
+        for sc in scrapers.all_scrapers():
+            with contextlib.suppress(Exception):
+                await sc.cache.flush()
+        await outbox.stop()
+        await http_client.close()
+        parsing.shutdown()
 
 # Bind lifespan to the app (overrides default events)
 app.router.lifespan_context = lifespan
@@ -0,0 +1,168 @@
+"""
+In-process metrics in the Prometheus text format (served at GET /metrics).
+
+A deliberately small registry (counters, histograms, collect-time gauges)
+instead of a client library: everything here is updated from the event loop
+or from SQLAlchemy's cursor hooks (app/sqltrace.py), so plain dicts are enough. Values are per
+process; with several uvicorn workers, scrape each one or aggregate by
+instance.
+"""
+import bisect
+import math
+from typing import Callable, Iterable
+
+# seconds; covers a 1 ms query up to a multi-minute crawl
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_metrics: list["_Metric"] = []
+_collectors: list[Callable[[], Iterable[tuple[str, str, str, dict, float]]]] = []
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(names: tuple, values: tuple, extra: dict | None = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in (extra or {}).items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labels
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> list[str]:
+        out = self.header()
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                out.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, key, {'le': _num(bound)})} {cumulative}"
+                )
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(round(total[0], 6))}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return out
+
+
+def collector(fn: Callable[[], Iterable[tuple[str, str, str, dict, float]]]):
+    """
+    Register a function evaluated at scrape time, yielding
+    (name, type, help, labels, value); for state that already lives elsewhere
+    (cache stats, pool sizes).
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    lines: list[str] = []
+    for m in _metrics:
+        lines += m.render()
+    # samples of one metric must be contiguous, whatever order collectors yield them in
+    families: dict[str, list[str]] = {}
+    for fn in _collectors:
+        for name, kind, doc, labels, value in fn():
+            if value is None:
+                continue
+            family = families.setdefault(name, [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"])
+            family.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_num(value)}")
+    for family in families.values():
+        lines += family
+    return "\n".join(lines) + "\n"
+
+
+# ---------- application metrics ----------
+
+http_requests = Histogram(
+    "http_request_duration_seconds", "HTTP request latency (until the last body chunk)",
+    ("method", "route", "status"),
+)
+http_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request",
+    ("method", "route"), buckets=COUNT_BUCKETS,
+)
+http_db_seconds = Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per HTTP request",
+    ("method", "route"),
+)
+db_queries = Histogram(
+    "db_query_duration_seconds", "SQL statement latency by statement type", ("operation",)
+)
+db_slow_queries = Counter(
+    "db_slow_queries_total", "SQL statements over SQL_SLOW_QUERY_MS", ("operation",)
+)
+db_repeated_statements = Counter(
+    "db_repeated_statements_total",
+    "Statements run SQL_REPEAT_THRESHOLD+ times within one request or job (N+1 suspects)",
+    ("scope",),
+)
+scraper_requests = Histogram(
+    "scraper_request_duration_seconds", "Competitor HTTP request latency per attempt",
+    ("host", "status"),
+)
+job_runs = Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time", ("job", "outcome")
+)
+job_db_queries = Histogram(
+    "scheduler_job_db_queries", "SQL statements executed per scheduled job run", ("job",),
+    buckets=COUNT_BUCKETS + (5000, 10000, 50000),
+)
+email_outbox = Counter(
+    "email_outbox_messages_total", "Outbox send attempts by outcome", ("outcome",)
+)
+
@@ -0,0 +1,112 @@
+"""
+Versioned schema migrations.
+
+`schema_migrations` holds one row per applied migration. Startup
+(`upgrade`) reads its highest version, a single query with no table
+reflection, and only does more when that is behind the newest migration
+listed here.
+
+A migration is a module `vNNN_<name>.py` in this package with
+`upgrade(conn)`, which gets a sync Connection (run through run_sync, so
+Core DDL, `op`-style `text()` and `inspect(conn)` all work). Add it to
+MIGRATIONS; never change one that has shipped. A migration spells out its
+own DDL and SQL instead of using app/models.py or app/queries.py, which
+describe the current schema and would change what it does over time
+(models only create an empty database, below). The pending ones run in
+one transaction together with their schema_migrations rows, so a failed
+upgrade leaves the version where it was.
+
+- An empty database is created from the models (`create_all`) and stamped
+  with every version; no migration runs.
+- A database from before versioning (tables, but no schema_migrations)
+  gets v001_baseline, then the later migrations.
+- Workers that start together serialise on an application lock on SQL
+  Server (sp_getapplock) and re-read the version once they hold it.
+- A database newer than the code (a rolling deploy) is left alone, with a
+  warning.
+"""
+import importlib
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import func, inspect, insert, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .. import models
+from ..db import Base
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    "v001_baseline",
+    "v002_price_comparisons",
+    "v003_outbox_attachment_path",
+    "v004_scheduler_lock_token",
+]
+HEAD = len(MIGRATIONS)
+
+_LOCK = """
+DECLARE @r INT;
+EXEC @r = sp_getapplock @Resource = 'pricecompare_schema', @LockMode = 'Exclusive',
+    @LockOwner = 'Transaction', @LockTimeout = 120000;
+IF @r < 0 THROW 50000, 'Timed out waiting for the schema migration lock', 1;
+"""
+
+
+def _version(name: str) -> int:
+    return int(name[1:4])
+
+
+async def current_version(engine: AsyncEngine) -> int | None:
+    """Highest applied version; None when the database has no schema_migrations table."""
+    try:
+        async with engine.connect() as conn:
+            version = (await conn.execute(select(func.max(models.SchemaMigration.version)))).scalar()
+    except DBAPIError:  # no such table: empty or pre-versioning database
+        return None
+    return version or 0
+
+
+async def _stamp(conn: AsyncConnection, names: list[str]) -> None:
+    if names:
+        now = datetime.now(timezone.utc)
+        await conn.execute(
+            insert(models.SchemaMigration),
+            [{"version": _version(n), "name": n, "applied_at": now} for n in names],
+        )
+
+
+async def upgrade(engine: AsyncEngine) -> int:
+    """Bring the schema to HEAD; returns the version it is at afterwards."""
+    version = await current_version(engine)
+    if version == HEAD:
+        log.info("DB: schema up to date", extra={"schema_version": version})
+        return version
+    if version is not None and version > HEAD:
+        log.warning("DB: schema is newer than this code", extra={"schema_version": version, "code_version": HEAD})
+        return version
+
+    async with engine.begin() as conn:
+        if conn.dialect.name == "mssql":
+            await conn.exec_driver_sql(_LOCK)
+        tables = await conn.run_sync(lambda c: set(inspect(c).get_table_names()))
+        if models.SchemaMigration.__tablename__ in tables:
+            version = (await conn.execute(select(func.max(models.SchemaMigration.version)))).scalar() or 0
+        elif models.Item.__tablename__ in tables:
+            version = 0  # created by create_all before migrations existed: start at the baseline
+        else:
+            await conn.run_sync(Base.metadata.create_all)
+            await _stamp(conn, MIGRATIONS)
+            log.info("DB: schema created", extra={"schema_version": HEAD})
+            return HEAD
+
+        pending = [n for n in MIGRATIONS if _version(n) > version]
+        for name in pending:
+            log.info("DB: applying migration", extra={"migration": name})
+            module = importlib.import_module(f".{name}", __name__)
+            await conn.run_sync(module.upgrade)
+        await _stamp(conn, pending)
+    if pending:
+        log.info("DB: schema upgraded", extra={"from_version": version, "schema_version": HEAD})
+    return max(version, HEAD)
@@ -0,0 +1,195 @@
+"""
+Baseline: the schema as it was when migrations were introduced.
+
+Databases from before then were built by `Base.metadata.create_all` on
+every start, which only ever added missing tables; creating the missing
+ones of this snapshot brings them level (and creates schema_migrations).
+
+The tables are spelled out here, frozen, rather than taken from
+app/models.py: a later model change belongs in its own migration and must
+not change what this one does.
+"""
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    Table,
+    Unicode,
+    UnicodeText,
+    UniqueConstraint,
+    func,
+)
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+
+def _created_at(name: str = "created_at") -> Column:
+    return Column(name, DateTime(timezone=True), server_default=func.sysutcdatetime(), nullable=False)
+
+
+Table(
+    "items", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("sku", Unicode(64), unique=True, index=True, nullable=False),
+    Column("name", UnicodeText, nullable=False),
+    Column("barcode", Unicode(64), index=True, nullable=True),
+    Column("price", Float, nullable=False),
+    _created_at(),
+)
+Table(
+    "competitors", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("code", Unicode(32), unique=True, index=True, nullable=False),
+    Column("name", Unicode(128), nullable=False),
+    Column("base_url", Unicode(256), nullable=False),
+    _created_at(),
+)
+Table(
+    "competitor_products", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("competitor_id", Integer, ForeignKey("competitors.id", ondelete="CASCADE"), index=True, nullable=False),
+    Column("sku", Unicode(64), index=True, nullable=False),
+    Column("name", UnicodeText, nullable=False),
+    Column("url", Unicode(512), nullable=False),
+    Column("barcode", Unicode(64), index=True, nullable=True),
+    _created_at(),
+    UniqueConstraint("competitor_id", "sku", name="uq_competitor_sku"),
+)
+Table(
+    "competitor_prices", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column(
+        "competitor_product_id", Integer,
+        ForeignKey("competitor_products.id", ondelete="CASCADE"), nullable=False,
+    ),
+    Column("price", Float, nullable=False),
+    _created_at("fetched_at"),
+    _created_at("checked_at"),
+    Index("ix_competitor_prices_product_fetched", "competitor_product_id", "fetched_at"),
+)
+Table(
+    "matches", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE"), index=True, nullable=False),
+    Column(
+        "competitor_product_id", Integer,
+        ForeignKey("competitor_products.id", ondelete="CASCADE"), index=True, nullable=False,
+    ),
+    Column("approved", Boolean, nullable=False),
+    Column("auto_by_barcode", Boolean, nullable=False),
+    _created_at(),
+    UniqueConstraint("item_id", "competitor_product_id", name="uq_item_competitor_product"),
+)
+Table(
+    "tags", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", Unicode(128), index=True, nullable=False),
+    Column("email", Unicode(256), nullable=True),
+    _created_at(),
+    UniqueConstraint("name", name="uq_tags_name"),
+)
+Table(
+    "item_tags", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE"), index=True, nullable=False),
+    Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), index=True, nullable=False),
+    _created_at(),
+    UniqueConstraint("item_id", "tag_id", name="uq_item_tag"),
+)
+Table(
+    "email_schedules", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), index=True, nullable=False),
+    Column("cron", Unicode(64), nullable=False),
+    Column("active", Boolean, nullable=False),
+    _created_at(),
+)
+Table(
+    "scheduled_jobs", metadata,
+    Column("id", Unicode(128), primary_key=True),
+    Column("handler", Unicode(64), nullable=False),
+    Column("kwargs", UnicodeText, nullable=False),
+    Column("cron", Unicode(64), nullable=False),
+    Column(
+        "email_schedule_id", Integer,
+        ForeignKey("email_schedules.id", ondelete="CASCADE"), index=True, nullable=True,
+    ),
+    Column("next_run_at", DateTime(timezone=True), index=True, nullable=False),
+    Column("lease_until", DateTime(timezone=True), nullable=True),
+    Column("locked_by", Unicode(128), nullable=True),
+    Column("last_run_at", DateTime(timezone=True), nullable=True),
+    Column("last_outcome", Unicode(16), nullable=True),
+    Column("last_error", UnicodeText, nullable=True),
+)
+Table(
+    "email_outbox", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("to_email", Unicode(256), nullable=False),
+    Column("subject", Unicode(256), nullable=False),
+    Column("body", UnicodeText, nullable=False),
+    Column("attachment", LargeBinary, nullable=True),
+    Column("attachment_name", Unicode(256), nullable=True),
+    Column("tag_id", Integer, ForeignKey("tags.id", ondelete="SET NULL"), nullable=True),
+    Column("status", Unicode(16), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("last_error", UnicodeText, nullable=True),
+    Column("next_attempt_at", DateTime(timezone=True), nullable=False),
+    Column("sent_at", DateTime(timezone=True), nullable=True),
+    _created_at(),
+    Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+)
+Table(
+    "price_comparisons", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE"), index=True, nullable=False),
+    Column("competitor_id", Integer, ForeignKey("competitors.id", ondelete="CASCADE"), nullable=False),
+    Column("competitor_product_id", Integer, nullable=False),
+    Column("our_sku", Unicode(64), nullable=False),
+    Column("our_name", UnicodeText, nullable=False),
+    Column("our_price", Float, nullable=False),
+    Column("comp_sku", Unicode(64), nullable=False),
+    Column("comp_name", UnicodeText, nullable=False),
+    Column("comp_url", Unicode(512), nullable=False),
+    Column("comp_price", Float, nullable=True),
+    Column("comp_price_checked_at", DateTime(timezone=True), nullable=True),
+    Column("diff", Float, nullable=True),
+    Column("diff_pct", Float, nullable=True),
+    _created_at("refreshed_at"),
+    UniqueConstraint("item_id", "competitor_id", name="uq_price_comparison"),
+    Index("ix_price_comparisons_comp_sku", "competitor_id", "our_sku"),
+    Index("ix_price_comparisons_comp_diff", "competitor_id", "diff"),
+    Index("ix_price_comparisons_comp_diff_pct", "competitor_id", "diff_pct"),
+)
+Table(
+    "data_versions", metadata,
+    Column("scope", Unicode(32), primary_key=True),
+    Column("version", BigInteger, nullable=False),
+)
+Table(
+    "barcode_lookups", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("competitor_code", Unicode(32), nullable=False),
+    Column("barcode", Unicode(64), nullable=False),
+    Column("found", Boolean, nullable=False),
+    Column("payload", UnicodeText, nullable=True),
+    Column("fetched_at", DateTime(timezone=True), nullable=False),
+    UniqueConstraint("competitor_code", "barcode", name="uq_barcode_lookup"),
+)
+Table(
+    "schema_migrations", metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", Unicode(128), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.create_all(conn)  # checkfirst: only the missing tables
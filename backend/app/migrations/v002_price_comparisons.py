@@ -0,0 +1,47 @@
+"""
+Fill `price_comparisons`, the precomputed comparison table.
+
+The baseline created the table, but empty; from here on every write keeps
+it current (crud.refresh_comparisons). This fills it once from the matches
+and prices already stored: per item and competitor its lowest approved
+match, with the latest price snapshot. The statement is frozen here; the
+current definition is queries.comparison_source (crud.rebuild_comparisons,
+POST /compare/rebuild).
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+_FILL = """
+INSERT INTO price_comparisons (
+    item_id, competitor_id, competitor_product_id,
+    our_sku, our_name, our_price,
+    comp_sku, comp_name, comp_url,
+    comp_price, comp_price_checked_at, diff, diff_pct
+)
+SELECT
+    i.id, cp.competitor_id, cp.id,
+    i.sku, i.name, i.price,
+    cp.sku, cp.name, cp.url,
+    p.price, p.checked_at, i.price - p.price, (i.price - p.price) * 100.0 / NULLIF(p.price, 0)
+FROM matches m
+JOIN items i ON i.id = m.item_id
+JOIN competitor_products cp ON cp.id = m.competitor_product_id
+LEFT JOIN competitor_prices p
+    ON p.competitor_product_id = cp.id
+    AND NOT EXISTS (
+        SELECT 1 FROM competitor_prices newer
+        WHERE newer.competitor_product_id = p.competitor_product_id
+          AND (newer.fetched_at > p.fetched_at OR (newer.fetched_at = p.fetched_at AND newer.id > p.id))
+    )
+WHERE m.id = (
+    SELECT MIN(am.id)
+    FROM matches am
+    JOIN competitor_products amp ON amp.id = am.competitor_product_id
+    WHERE am.item_id = m.item_id AND am.approved = 1 AND amp.competitor_id = cp.competitor_id
+)
+"""
+
+
+def upgrade(conn: Connection) -> None:
+    conn.execute(text("DELETE FROM price_comparisons"))
+    conn.execute(text(_FILL))
@@ -0,0 +1,11 @@
+"""
+email_outbox.attachment_path: queued reports are kept as files and only
+read when the message is sent, instead of as a blob in the row.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection) -> None:
+    type_ = "NVARCHAR(1024)" if conn.dialect.name == "mssql" else "VARCHAR(1024)"
+    conn.execute(text(f"ALTER TABLE email_outbox ADD attachment_path {type_} NULL"))
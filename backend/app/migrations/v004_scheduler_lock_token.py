@@ -0,0 +1,12 @@
+"""
+scheduled_jobs.lock_token: a run renews and releases its lease by the token
+of its own claim, not by worker id, so two runs of one job in the same
+process (a stalled one and its takeover) cannot share a lease.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection) -> None:
+    type_ = "NVARCHAR(32)" if conn.dialect.name == "mssql" else "VARCHAR(32)"
+    conn.execute(text(f"ALTER TABLE scheduled_jobs ADD lock_token {type_} NULL"))
@@ -4,10 +4,13 @@ from datetime import datetime
 from typing import List, Optional
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     DateTime,
     Float,
     ForeignKey,
+    Index,
+    LargeBinary,
     UniqueConstraint,
     func,
 )
@@ -81,6 +84,39 @@ class CompetitorProduct(Base):
     matches: Mapped[List["Match"]] = relationship(
         back_populates="competitor_product", cascade="all, delete-orphan"
     )
+    prices: Mapped[List["CompetitorPrice"]] = relationship(
+        back_populates="competitor_product", cascade="all, delete-orphan"
+    )
+
+
+class CompetitorPrice(Base):
+    """
+    Price time series per competitor product. A row is only added when the
+    price changes; `checked_at` is bumped when a refresh sees the same price.
+    """
+    __tablename__ = "competitor_prices"
+    __table_args__ = (
+        # "latest snapshot per product" is a seek on this index
+        Index("ix_competitor_prices_product_fetched", "competitor_product_id", "fetched_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    competitor_product_id: Mapped[int] = mapped_column(
+        ForeignKey("competitor_products.id", ondelete="CASCADE")
+    )
+    price: Mapped[float] = mapped_column(Float, nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.sysutcdatetime(),
+        nullable=False,
+    )
+    checked_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.sysutcdatetime(),
+        nullable=False,
+    )
+
+    competitor_product: Mapped["CompetitorProduct"] = relationship(back_populates="prices")
 
 
 class Match(Base):
@@ -160,3 +196,146 @@ class EmailSchedule(Base):
     )
 
     tag: Mapped["Tag"] = relationship(back_populates="schedules")
+
+
+class ScheduledJob(Base):
+    """
+    Scheduler job store (services/scheduler.py), shared by every app worker.
+    A run is claimed by moving `next_run_at` to the following fire time with a
+    conditional UPDATE, so each fire time runs on exactly one worker;
+    `lease_until` is held (and renewed) while it runs, and a run whose worker
+    died is taken over once the lease expires. `lock_token` is new for every
+    claim: only the run holding it may renew or release the lease.
+    """
+    __tablename__ = "scheduled_jobs"
+
+    id: Mapped[str] = mapped_column(Unicode(128), primary_key=True)
+    handler: Mapped[str] = mapped_column(Unicode(64))  # name registered with scheduler.register()
+    kwargs: Mapped[str] = mapped_column(UnicodeText, default="{}", nullable=False)  # JSON
+    cron: Mapped[str] = mapped_column(Unicode(64))
+    # email report jobs go away with their schedule
+    email_schedule_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("email_schedules.id", ondelete="CASCADE"), index=True, nullable=True
+    )
+    next_run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+    lease_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    locked_by: Mapped[Optional[str]] = mapped_column(Unicode(128), nullable=True)
+    lock_token: Mapped[Optional[str]] = mapped_column(Unicode(32), nullable=True)
+    last_run_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_outcome: Mapped[Optional[str]] = mapped_column(Unicode(16), nullable=True)  # ok|error|misfired
+    last_error: Mapped[Optional[str]] = mapped_column(UnicodeText, nullable=True)
+
+
+class EmailOutbox(Base):
+    """
+    Queued outgoing mail, drained by services/outbox.py. `next_attempt_at` is
+    both the retry time (pending) and the claim lease (sending). Reports are
+    attached by file (`attachment_path`, read at send time); `attachment`
+    holds the bytes of rows queued before that.
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    to_email: Mapped[str] = mapped_column(Unicode(256))
+    subject: Mapped[str] = mapped_column(Unicode(256))
+    body: Mapped[str] = mapped_column(UnicodeText)
+    attachment: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    attachment_name: Mapped[Optional[str]] = mapped_column(Unicode(256), nullable=True)
+    attachment_path: Mapped[Optional[str]] = mapped_column(Unicode(1024), nullable=True)
+    tag_id: Mapped[Optional[int]] = mapped_column(ForeignKey("tags.id", ondelete="SET NULL"), nullable=True)
+    status: Mapped[str] = mapped_column(Unicode(16), default="pending", nullable=False)  # pending|sending|sent|failed
+    attempts: Mapped[int] = mapped_column(default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(UnicodeText, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.sysutcdatetime(),
+        nullable=False,
+    )
+
+
+# -------------------------
+# Caches
+# -------------------------
+
+class PriceComparison(Base):
+    """
+    Precomputed comparison, one row per item and competitor with an approved
+    match: both prices, the diff, and where the competitor price came from.
+    Rows are recomputed (crud.refresh_comparisons) in the same transaction as
+    the item / match / price write that affects them, so /compare and the
+    reports read them with index range scans instead of joining matches,
+    products and the latest price snapshot on every call.
+    """
+    __tablename__ = "price_comparisons"
+    __table_args__ = (
+        UniqueConstraint("item_id", "competitor_id", name="uq_price_comparison"),
+        Index("ix_price_comparisons_comp_sku", "competitor_id", "our_sku"),
+        # "largest price gap first" is a backward range scan
+        Index("ix_price_comparisons_comp_diff", "competitor_id", "diff"),
+        Index("ix_price_comparisons_comp_diff_pct", "competitor_id", "diff_pct"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id", ondelete="CASCADE"), index=True)
+    competitor_id: Mapped[int] = mapped_column(ForeignKey("competitors.id", ondelete="CASCADE"))
+    # no FK: a second cascade path from competitors is rejected by SQL Server
+    competitor_product_id: Mapped[int] = mapped_column(nullable=False)
+    our_sku: Mapped[str] = mapped_column(Unicode(64))
+    our_name: Mapped[str] = mapped_column(UnicodeText)
+    our_price: Mapped[float] = mapped_column(Float, nullable=False)
+    comp_sku: Mapped[str] = mapped_column(Unicode(64))
+    comp_name: Mapped[str] = mapped_column(UnicodeText)
+    comp_url: Mapped[str] = mapped_column(Unicode(512))
+    comp_price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    comp_price_checked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    diff: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # our_price - comp_price
+    diff_pct: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    refreshed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.sysutcdatetime(),
+        nullable=False,
+    )
+
+
+class DataVersion(Base):
+    """
+    Monotonic counter bumped by every write that can change the comparison /
+    match views; response caches key their entries (and ETags) on it.
+    """
+    __tablename__ = "data_versions"
+
+    scope: Mapped[str] = mapped_column(Unicode(32), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class BarcodeLookup(Base):
+    """Persistent copy of the barcode search cache (services/barcode_cache.py)."""
+    __tablename__ = "barcode_lookups"
+    __table_args__ = (
+        UniqueConstraint("competitor_code", "barcode", name="uq_barcode_lookup"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    competitor_code: Mapped[str] = mapped_column(Unicode(32))
+    barcode: Mapped[str] = mapped_column(Unicode(64))
+    found: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    payload: Mapped[Optional[str]] = mapped_column(UnicodeText, nullable=True)  # JSON of the search result
+    fetched_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+# -------------------------
+# Schema
+# -------------------------
+
+class SchemaMigration(Base):
+    """One row per applied migration (app/migrations); startup reads the highest version."""
+    __tablename__ = "schema_migrations"
+
+    version: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    name: Mapped[str] = mapped_column(Unicode(128))
+    applied_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination over the items table.
+
+Both sort keys are unique (`id`, `sku`), so the cursor is just the last
+row's sort value: the next page is `WHERE key > :last ORDER BY key LIMIT n`,
+an index seek however deep the client has scrolled.
+"""
+import base64
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import Select
+
+from . import models
+
+SORTS = {
+    "id": (models.Item.id, False),
+    "-id": (models.Item.id, True),
+    "sku": (models.Item.sku, False),
+    "-sku": (models.Item.sku, True),
+}
+
+MAX_LIMIT = 1000
+
+
+def encode_cursor(sort: str, value) -> str:
+    raw = json.dumps({"s": sort, "v": value}, ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data["s"] != sort:
+            raise ValueError("cursor was issued for another sort order")
+        return data["v"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def sort_column(sort: str):
+    if sort not in SORTS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid sort; use one of {', '.join(SORTS)}"
+        )
+    return SORTS[sort][0]
+
+
+def keyset(stmt: Select, sort: str, cursor: str | None, limit: int) -> Select:
+    """Apply ORDER BY / seek / LIMIT; fetches one extra row to detect a next page."""
+    sort_column(sort)
+    col, desc = SORTS[sort]
+    if cursor:
+        last = decode_cursor(cursor, sort)
+        stmt = stmt.where(col < last if desc else col > last)
+    return stmt.order_by(col.desc() if desc else col.asc()).limit(limit + 1)
+
+
+def order_by(sort: str, columns):
+    """ORDER BY for `sort` against another selectable with id/sku columns (e.g. a page subquery)."""
+    col, desc = SORTS[sort]
+    c = columns[col.key]
+    return c.desc() if desc else c.asc()
+
+
+def next_cursor(rows: list, sort: str, limit: int, key) -> str | None:
+    """Trims the look-ahead row in place; returns the cursor for the next page."""
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    return encode_cursor(sort, key(rows[-1]))
@@ -0,0 +1,313 @@
+"""
+Reusable SELECT building blocks shared by routers, reports and jobs.
+"""
+from sqlalchemy import and_, case, exists, false, func, select
+from sqlalchemy.orm import aliased
+
+from . import models
+from .db import seconds_since
+
+
+def latest_price_id(competitor_product_id):
+    """
+    Correlated scalar subquery: id of the newest `CompetitorPrice` for the given
+    competitor product column (TOP 1 seek on ix_competitor_prices_product_fetched).
+    """
+    snap = aliased(models.CompetitorPrice, name="snap")
+    return (
+        select(snap.id)
+        .where(snap.competitor_product_id == competitor_product_id)
+        .order_by(snap.fetched_at.desc(), snap.id.desc())
+        .limit(1)
+        .correlate_except(snap)
+        .scalar_subquery()
+    )
+
+
+def price_columns(our_price, comp_price, checked_at, prefix: str = ""):
+    """diff / diff_pct / price_age_s computed in SQL (diff > 0: we are more expensive)."""
+    diff = our_price - comp_price
+    return (
+        diff.label(f"{prefix}diff"),
+        (diff * 100.0 / func.nullif(comp_price, 0)).label(f"{prefix}diff_pct"),
+        seconds_since(checked_at).label(f"{prefix}price_age_s"),
+    )
+
+
+# price_comparisons columns, in comparison_source() order
+COMPARISON_COLUMNS = [
+    "item_id", "competitor_id", "competitor_product_id",
+    "our_sku", "our_name", "our_price",
+    "comp_sku", "comp_name", "comp_url",
+    "comp_price", "comp_price_checked_at", "diff", "diff_pct",
+]
+
+
+def comparison_source():
+    """
+    The rows `price_comparisons` holds, computed from scratch: per item and
+    competitor its (lowest) approved match, joined to the latest price
+    snapshot. crud.refresh_comparisons narrows it to the affected items.
+    """
+    price = models.CompetitorPrice
+    cp = models.CompetitorProduct
+    diff = models.Item.price - price.price
+    return (
+        select(
+            models.Item.id,
+            cp.competitor_id,
+            cp.id,
+            models.Item.sku,
+            models.Item.name,
+            models.Item.price,
+            cp.sku,
+            cp.name,
+            cp.url,
+            price.price,
+            price.checked_at,
+            diff,
+            diff * 100.0 / func.nullif(price.price, 0),
+        )
+        .select_from(models.Match)
+        .join(models.Item, models.Item.id == models.Match.item_id)
+        .join(cp, cp.id == models.Match.competitor_product_id)
+        .outerjoin(price, price.id == latest_price_id(cp.id))
+        .where(models.Match.id == approved_match_id(models.Match.item_id, cp.competitor_id))
+    )
+
+
+# /compare sort keys -> ORDER BY over price_comparisons
+COMPARE_SORTS = ("sku", "diff", "-diff", "diff_pct", "-diff_pct")
+
+
+def compare_select(competitor_id: int, sort: str = "sku"):
+    """
+    One competitor's rows of the precomputed comparison. The diff sorts skip
+    rows without a competitor price and run on their (competitor, diff)
+    indexes, e.g. "-diff" = where we are the most expensive first.
+    """
+    pc = models.PriceComparison
+    stmt = select(
+        pc.our_sku,
+        pc.comp_sku,
+        pc.our_name,
+        pc.comp_name,
+        pc.our_price,
+        pc.comp_price,
+        pc.diff,
+        pc.diff_pct,
+        seconds_since(pc.comp_price_checked_at).label("price_age_s"),
+        pc.comp_price_checked_at,
+        pc.comp_url,
+    ).where(pc.competitor_id == competitor_id)
+    if sort == "sku":
+        return stmt.order_by(pc.our_sku, pc.comp_sku)
+    col = pc.diff_pct if sort.lstrip("-") == "diff_pct" else pc.diff
+    return stmt.where(col.is_not(None)).order_by(col.desc() if sort.startswith("-") else col, pc.id)
+
+
+def approved_match_id(item_id, competitor_id):
+    """
+    Correlated scalar subquery: lowest approved `Match.id` of an item for one
+    competitor (an item normally has at most one); both arguments may be
+    values or outer columns.
+    """
+    m = aliased(models.Match, name="am")
+    p = aliased(models.CompetitorProduct, name="amp")
+    return (
+        select(func.min(m.id))
+        .join(p, p.id == m.competitor_product_id)
+        .where(
+            m.item_id == item_id,
+            m.approved.is_(True),
+            p.competitor_id == competitor_id,
+        )
+        .correlate_except(m, p)
+        .scalar_subquery()
+    )
+
+
+def approved_in(competitor_ids):
+    """EXISTS clause over `models.Item`: an approved match to any of these competitors."""
+    pc = aliased(models.PriceComparison, name="pc_any")
+    return exists(
+        select(pc.id).where(pc.item_id == models.Item.id, pc.competitor_id.in_(list(competitor_ids)))
+    )
+
+
+def pivot_select(competitors, items=None, matched_only: bool = True):
+    """
+    One row per item with every listed competitor's latest price side by side
+    (conditional aggregation over the precomputed price_comparisons rows,
+    grouped by item only, so NVARCHAR(MAX) columns stay out of the GROUP BY).
+
+    Competitor columns are positional: c{i}_price / _diff / _diff_pct /
+    _price_age_s / _url for competitors[i] (see pivot_row). `items` is an optional
+    (id, sku) subquery (a keyset page, a tag); `matched_only=False` keeps
+    items without any approved match.
+    """
+    pc = models.PriceComparison
+    ap = select(
+        pc.item_id,
+        pc.competitor_id,
+        pc.comp_url.label("url"),
+        pc.comp_price.label("price"),
+        pc.comp_price_checked_at.label("checked_at"),
+    ).where(pc.competitor_id.in_([c.id for c in competitors]))
+    if items is not None:
+        ap = ap.join(items, items.c.id == pc.item_id)
+    ap = ap.subquery("ap")
+
+    agg_cols = []
+    for i, c in enumerate(competitors):
+        mine = ap.c.competitor_id == c.id
+        agg_cols += [
+            func.max(case((mine, ap.c.price))).label(f"c{i}_price"),
+            func.max(case((mine, ap.c.checked_at))).label(f"c{i}_checked_at"),
+            func.max(case((mine, ap.c.url))).label(f"c{i}_url"),
+        ]
+    agg = (
+        select(ap.c.item_id, *agg_cols, func.min(ap.c.price).label("best_price"))
+        .group_by(ap.c.item_id)
+        .subquery("pv")
+    )
+
+    cols = []
+    for i in range(len(competitors)):
+        cols += [
+            agg.c[f"c{i}_price"],
+            *price_columns(
+                models.Item.price, agg.c[f"c{i}_price"], agg.c[f"c{i}_checked_at"], prefix=f"c{i}_"
+            ),
+            agg.c[f"c{i}_url"],
+        ]
+    stmt = select(
+        models.Item.id.label("item_id"),
+        models.Item.sku.label("our_sku"),
+        models.Item.name.label("our_name"),
+        models.Item.price.label("our_price"),
+        *cols,
+        agg.c.best_price,
+    )
+    if items is not None:
+        stmt = stmt.select_from(items).join(models.Item, models.Item.id == items.c.id)
+    else:
+        stmt = stmt.select_from(models.Item)
+    join = stmt.join if matched_only else stmt.outerjoin
+    return join(agg, agg.c.item_id == models.Item.id)
+
+
+def pivot_row(row, competitors) -> dict:
+    """Reshape a pivot_select row: positional competitor columns -> {code: {...}}."""
+    prices = {}
+    for i, c in enumerate(competitors):
+        if row[f"c{i}_price"] is None and row[f"c{i}_url"] is None:
+            continue  # no approved match for this competitor
+        prices[c.code] = {
+            "price": row[f"c{i}_price"],
+            "diff": row[f"c{i}_diff"],
+            "diff_pct": row[f"c{i}_diff_pct"],
+            "price_age_s": row[f"c{i}_price_age_s"],
+            "url": row[f"c{i}_url"],
+        }
+    best = [code for code, p in prices.items() if p["price"] is not None and p["price"] == row["best_price"]]
+    return {
+        "item_id": row["item_id"],
+        "our_sku": row["our_sku"],
+        "our_name": row["our_name"],
+        "our_price": row["our_price"],
+        "best_price": row["best_price"],
+        "best_competitor": best[0] if best else None,
+        "prices": prices,
+    }
+
+
+def item_filters(
+    competitor_id: int | None = None,
+    matched: bool | None = None,
+    approved: bool | None = None,
+    has_barcode: bool | None = None,
+    tag_id: int | None = None,
+    sku_prefix: str | None = None,
+) -> list:
+    """
+    WHERE clauses over `models.Item` shared by the item and match listings.
+    `matched` / `approved` are scoped to `competitor_id` when it is given.
+    """
+    def match_exists(approved_only: bool):
+        m = aliased(models.Match, name="fm")
+        q = select(m.id).where(m.item_id == models.Item.id)
+        if approved_only:
+            q = q.where(m.approved.is_(True))
+        if competitor_id is not None:
+            p = aliased(models.CompetitorProduct, name="fmp")
+            q = q.join(p, p.id == m.competitor_product_id).where(p.competitor_id == competitor_id)
+        return exists(q)
+
+    clauses = []
+    if matched is not None:
+        clauses.append(match_exists(False) if matched else ~match_exists(False))
+    if approved is not None:
+        clauses.append(match_exists(True) if approved else ~match_exists(True))
+    if has_barcode is not None:
+        has = (models.Item.barcode.is_not(None)) & (models.Item.barcode != "")
+        clauses.append(has if has_barcode else ~has)
+    if tag_id is not None:
+        # aliased: also used inside statements on item_tags itself (crud tag membership)
+        t = aliased(models.ItemTag, name="ft")
+        clauses.append(exists(select(t.id).where(t.item_id == models.Item.id, t.tag_id == tag_id)))
+    if sku_prefix:
+        clauses.append(models.Item.sku.startswith(sku_prefix, autoescape=True))
+    return clauses
+
+
+def match_view_select(competitor_id: int, items=None):
+    """
+    Items with their best match for one competitor, in a single statement:
+    candidate matches are ranked per item with ROW_NUMBER() (approved first,
+    then oldest) and rank 1 is outer-joined back to the items. The competitor
+    filter lives inside the ranked subquery, so items matched only to other
+    competitors still come back (unmatched).
+
+    `items` is an optional (id, sku) subquery, e.g. one keyset page; ranking
+    is then limited to that page's matches. Defaults to the whole table.
+    """
+    ranked = select(
+        models.Match.item_id,
+        models.CompetitorProduct.barcode,
+        models.CompetitorProduct.url,
+        models.Match.approved,
+        func.row_number()
+        .over(
+            partition_by=models.Match.item_id,
+            order_by=(models.Match.approved.desc(), models.Match.id),
+        )
+        .label("rn"),
+    )
+    if items is None:
+        items = models.Item.__table__
+        ranked = ranked.select_from(models.Match)
+    else:
+        # drive the ranking from the page so only its matches are touched
+        ranked = ranked.select_from(items).join(
+            models.Match, models.Match.item_id == items.c.id
+        )
+    ranked = (
+        ranked.join(
+            models.CompetitorProduct,
+            models.CompetitorProduct.id == models.Match.competitor_product_id,
+        )
+        .where(models.CompetitorProduct.competitor_id == competitor_id)
+        .subquery("ranked")
+    )
+    return (
+        select(
+            items.c.id.label("item_id"),
+            items.c.sku.label("our_sku"),
+            ranked.c.barcode.label("comp_barcode"),
+            ranked.c.url.label("comp_url"),
+            func.coalesce(ranked.c.approved, false()).label("approved"),
+        )
+        .select_from(items)
+        .outerjoin(ranked, and_(ranked.c.item_id == items.c.id, ranked.c.rn == 1))
+    )
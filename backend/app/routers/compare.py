@@ -1,16 +1,128 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_session
-from .. import models
-from ..schemas import PriceCompareRow
+from ..db import ReadSessionLocal, get_read_session, get_session
+from .. import crud, models, pagination, queries
+from ..schemas import Page, PriceCompareRow, PricePivotRow
+from ..services import export, price_refresh, response_cache, scrapers
 
 router = APIRouter(prefix="/compare", tags=["compare"])
 
+STREAM_BATCH = 1000
+SORT_PATTERN = "^(" + "|".join(queries.COMPARE_SORTS) + ")$"
+
+
+# declared before /{competitor_code} so "pivot" is not taken for a code
+@router.get("/pivot", response_model=Page[PricePivotRow])
+async def pivot(
+    request: Request,
+    competitors: str | None = None,
+    limit: int = Query(200, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str | None = None,
+    sort: str = "sku",
+    tag_id: int | None = None,
+    sku_prefix: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Our price next to every competitor's latest price, one row per item with
+    at least one approved match. `competitors` is a comma-separated list of
+    codes (default: all). Keyset-paginated like /items.
+    """
+    async def build():
+        stmt = select(models.Competitor).order_by(models.Competitor.code)
+        if competitors:
+            codes = [c.strip() for c in competitors.split(",") if c.strip()]
+            stmt = stmt.where(models.Competitor.code.in_(codes))
+        comps = (await session.execute(stmt)).scalars().all()
+        if competitors and len(comps) != len(set(codes)):
+            unknown = set(codes) - {c.code for c in comps}
+            raise HTTPException(status_code=404, detail=f"Competitor not found: {', '.join(sorted(unknown))}")
+
+        filters = queries.item_filters(tag_id=tag_id, sku_prefix=sku_prefix)
+        page = pagination.keyset(
+            select(models.Item.id, models.Item.sku).where(
+                *filters, queries.approved_in(c.id for c in comps)
+            ),
+            sort, cursor, limit,
+        ).subquery("page")
+        res = await session.execute(
+            queries.pivot_select(comps, page).order_by(pagination.order_by(sort, page.c))
+        )
+        rows = list(res.mappings().all())
+        key = pagination.sort_column(sort).key
+        nxt = pagination.next_cursor(
+            rows, sort, limit, key=lambda r: r["item_id" if key == "id" else "our_sku"]
+        )
+        return Page[PricePivotRow](
+            items=[PricePivotRow.model_validate(queries.pivot_row(r, comps)) for r in rows],
+            next_cursor=nxt,
+        )
+
+    return await response_cache.cached_json(request, session, build)
+
+
+@router.post("/refresh", response_model=dict)
+async def refresh_all(concurrency: int | None = None, min_age_s: float | None = None):
+    """Price refresh for every competitor with a scraper, all in parallel."""
+    reports = await price_refresh.refresh_all(concurrency=concurrency, min_age_s=min_age_s)
+    return {"status": "ok", "competitors": reports}
+
+
+@router.post("/rebuild", response_model=dict)
+async def rebuild(session: AsyncSession = Depends(get_session)):
+    """Recompute the whole precomputed comparison (normally kept current row by row)."""
+    rows = await crud.rebuild_comparisons(session)
+    await crud.bump_data_version(session)
+    await session.commit()
+    return {"status": "ok", "rows": rows}
+
 
 @router.get("/{competitor_code}", response_model=list[PriceCompareRow])
-async def compare(competitor_code: str, session: AsyncSession = Depends(get_session)):
+async def compare(
+    competitor_code: str,
+    request: Request,
+    sort: str = Query("sku", pattern=SORT_PATTERN),
+    limit: int | None = Query(None, ge=1),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Approved matches of one competitor with both prices and the diff, read from
+    the precomputed comparison table. `sort`: sku (default), diff / diff_pct
+    ascending, or -diff / -diff_pct for the largest gap first (rows without a
+    competitor price are left out then); `limit` keeps the first rows.
+    """
+    async def build():
+        comp = (
+            await session.execute(
+                select(models.Competitor).where(models.Competitor.code == competitor_code)
+            )
+        ).scalar_one_or_none()
+        if not comp:
+            raise HTTPException(status_code=404, detail="Competitor not found")
+
+        q = await session.execute(queries.compare_select(comp.id, sort).limit(limit))
+        return [PriceCompareRow.model_validate(r) for r in q.mappings().all()]
+
+    # unchanged data -> 304 / cached body after a single version lookup
+    return await response_cache.cached_json(request, session, build)
+
+
+@router.get("/{competitor_code}/export")
+async def export_comparison(
+    competitor_code: str,
+    format: str = Query("csv", pattern="^(" + "|".join(export.FORMATS) + ")$"),
+    sort: str = Query("sku", pattern=SORT_PATTERN),
+    limit: int | None = Query(None, ge=1),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    The comparison of GET /compare/{competitor_code} (same `sort` / `limit`)
+    as a csv, xlsx or parquet download, streamed from a server-side cursor:
+    rows are encoded and sent batch by batch, never collected.
+    """
     comp = (
         await session.execute(
             select(models.Competitor).where(models.Competitor.code == competitor_code)
@@ -18,30 +130,45 @@ async def compare(competitor_code: str, session: AsyncSession = Depends(get_sess
     ).scalar_one_or_none()
     if not comp:
         raise HTTPException(status_code=404, detail="Competitor not found")
+    if not export.available(format):
+        raise HTTPException(status_code=400, detail=f"{format} export needs pyarrow installed")
 
-    q = await session.execute(
-        select(models.Match, models.Item, models.CompetitorProduct)
-        .join(models.Item, models.Item.id == models.Match.item_id)
-        .join(
-            models.CompetitorProduct,
-            models.CompetitorProduct.id == models.Match.competitor_product_id,
-        )
-        .where(
-            models.Match.approved.is_(True),
-            models.CompetitorProduct.competitor_id == comp.id,
-        )
+    stmt = queries.compare_select(comp.id, sort).limit(limit).execution_options(yield_per=STREAM_BATCH)
+    media_type, ext, encode = export.FORMATS[format]
+
+    async def batches():
+        # the request-scoped session is closed before the body is sent
+        async with ReadSessionLocal() as s:
+            result = await s.stream(stmt)
+            async for batch in result.mappings().partitions(STREAM_BATCH):
+                yield batch
+
+    return StreamingResponse(
+        encode(stmt.selected_columns, batches()),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="compare_{comp.code}.{ext}"'},
     )
-    rows: list[PriceCompareRow] = []
-    for m, it, cp in q.all():
-        rows.append(
-            PriceCompareRow(
-                our_sku=it.sku,
-                comp_sku=cp.sku,
-                our_name=it.name,
-                comp_name=cp.name,
-                our_price=it.price,
-                comp_price=None,  # could live-scrape here
-                diff=None,
-            )
+
+
+@router.post("/{competitor_code}/refresh", response_model=dict)
+async def refresh(
+    competitor_code: str,
+    concurrency: int | None = None,
+    min_age_s: float | None = None,
+    session: AsyncSession = Depends(get_session),
+):
+    """Run the price refresh crawler now (same job the scheduler runs nightly)."""
+    comp = (
+        await session.execute(
+            select(models.Competitor).where(models.Competitor.code == competitor_code)
         )
-    return rows
+    ).scalar_one_or_none()
+    if not comp:
+        raise HTTPException(status_code=404, detail="Competitor not found")
+    if scrapers.get(comp.code) is None:
+        raise HTTPException(status_code=400, detail="No scraper for this competitor")
+
+    report = await price_refresh.refresh_prices(
+        session, comp, concurrency=concurrency, min_age_s=min_age_s
+    )
+    return {"status": "ok", **report}
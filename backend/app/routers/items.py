@@ -1,46 +1,116 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+import zipfile
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import FileResponse
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from ..db import get_session
-from .. import models
-from ..schemas import ItemIn, ItemOut
+from ..db import get_read_session, get_session
+from .. import crud, models, pagination, queries
+from ..schemas import ItemIn, ItemOut, Page
+from ..services import importer
 
 router = APIRouter(prefix="/items", tags=["items"])
 
 
 @router.post("/upsert", response_model=dict)
 async def upsert(items: list[ItemIn], session: AsyncSession = Depends(get_session)):
-    # simple upsert by SKU
-    for i in items:
-        res = await session.execute(
-            select(models.Item).where(models.Item.sku == i.sku)
-        )
-        row = res.scalar_one_or_none()
-        if row:
-            row.name = i.name
-            row.barcode = i.barcode
-            row.price = i.price
-        else:
-            session.add(
-                models.Item(
-                    sku=i.sku,
-                    name=i.name,
-                    barcode=i.barcode,
-                    price=i.price,
-                )
-            )
-    await session.commit()
-    return {"status": "ok", "count": len(items)}
+    # set-based upsert by SKU (staging table + MERGE on SQL Server)
+    counts = await crud.upsert_items(session, [i.model_dump() for i in items])
+    return {"status": "ok", "count": len(items), **counts}
+
+
+@router.post("/import", response_model=dict)
+async def import_file(file: UploadFile = File(...), session: AsyncSession = Depends(get_session)):
+    """
+    Import a CSV/XLSX export (columns: sku, name, barcode, price).
+
+    The upload is spooled to disk by Starlette; rows are then parsed and
+    validated as a stream and upserted in chunks of IMPORT_CHUNK_SIZE. Invalid
+    rows go to a reject file downloadable from `rejects_url`.
+    """
+    try:
+        imp = await run_in_threadpool(importer.ItemImport, file.file, file.filename)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read file: {e}")
+
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0}
+    try:
+        while True:
+            chunk = await run_in_threadpool(imp.next_chunk)
+            if not chunk:
+                break
+            counts = await crud.upsert_items(session, chunk)
+            for k in totals:
+                totals[k] += counts[k]
+    finally:
+        imp.close()
+
+    return {
+        "status": "ok",
+        "rows": imp.rows,
+        "accepted": imp.accepted,
+        "rejected": imp.rejected,
+        **totals,
+        "rejects_url": f"/items/import/rejects/{imp.reject_id}" if imp.reject_id else None,
+    }
 
 
-@router.get("/", response_model=list[ItemOut])
-async def list_items(session: AsyncSession = Depends(get_session)):
+@router.get("/import/rejects/{reject_id}")
+async def download_rejects(reject_id: str):
+    try:
+        path = importer.reject_path(reject_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Reject file not found")
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Reject file not found")
+    return FileResponse(path, media_type="text/csv", filename=path.name)
+
+
+@router.get("/", response_model=Page[ItemOut])
+async def list_items(
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str | None = None,
+    sort: str = "-id",
+    with_total: bool = False,
+    competitor_code: str | None = None,
+    matched: bool | None = None,
+    approved: bool | None = None,
+    has_barcode: bool | None = None,
+    tag_id: int | None = None,
+    sku_prefix: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Keyset-paginated item listing. `matched` / `approved` refer to
+    `competitor_code` when given, otherwise to any competitor.
+    """
+    competitor_id = None
+    if competitor_code:
+        competitor_id = (
+            await session.execute(
+                select(models.Competitor.id).where(models.Competitor.code == competitor_code)
+            )
+        ).scalar_one_or_none()
+        if competitor_id is None:
+            raise HTTPException(status_code=404, detail="Competitor not found")
+
+    filters = queries.item_filters(
+        competitor_id, matched, approved, has_barcode, tag_id, sku_prefix
+    )
     res = await session.execute(
-        select(models.Item).order_by(models.Item.id.desc()).limit(1000)
+        pagination.keyset(select(models.Item).where(*filters), sort, cursor, limit)
+    )
+    items = list(res.scalars().all())
+    nxt = pagination.next_cursor(
+        items, sort, limit, key=lambda o: getattr(o, pagination.sort_column(sort).key)
+    )
+    total = None
+    if with_total:
+        total = (
+            await session.execute(select(func.count()).select_from(models.Item).where(*filters))
+        ).scalar_one()
+    return Page[ItemOut](
+        items=[ItemOut.model_validate(o) for o in items], next_cursor=nxt, total=total
     )
-    items = res.scalars().all()
-    return [
-        ItemOut(id=o.id, sku=o.sku, name=o.name, barcode=o.barcode, price=o.price)
-        for o in items
-    ]
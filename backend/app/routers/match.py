@@ -1,16 +1,114 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_session
-from app import models
-from app.services.matcher import auto_match_by_barcode
-from app.services import scraper_praktiker
+from app.db import ReadSessionLocal, get_read_session, get_session
+from app import crud, models, pagination, queries
+from app.schemas import MatchViewRow, NameCandidate, Page
+from app.services import catalogue, matcher
+from app.services import response_cache, scrapers
 
 router = APIRouter(prefix="/match", tags=["match"])
+log = logging.getLogger(__name__)
+
+STREAM_BATCH = 1000
 
 @router.post("/auto/{competitor_code}", response_model=dict)
-async def auto_match_all(competitor_code: str, session: AsyncSession = Depends(get_session)):
+async def auto_match_all(
+    competitor_code: str,
+    concurrency: int | None = None,
+    batch_size: int | None = None,
+    live: bool = True,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Match crawled competitor products by barcode in the database first; with
+    `live`, search the site for the barcodes that are left.
+    """
+    comp = (
+        await session.execute(
+            select(models.Competitor).where(models.Competitor.code == competitor_code)
+        )
+    ).scalar_one_or_none()
+    if not comp:
+        raise HTTPException(status_code=404, detail="Competitor not found")
+    if scrapers.get(comp.code) is None:
+        raise HTTPException(status_code=400, detail="No scraper for this competitor")
+
+    report = await matcher.auto_match_all(
+        session, comp, concurrency=concurrency, batch_size=batch_size, live=live
+    )
+    log.info("Matcher: auto-match finished", extra={"competitor": competitor_code, "report": report})
+    return {"status": "ok", **report}
+
+@router.post("/crawl/{competitor_code}", response_model=dict)
+async def crawl_catalogue(
+    competitor_code: str,
+    concurrency: int | None = None,
+    max_pages: int | None = Query(None, ge=0),
+    details: bool = True,
+    match: bool = True,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Walk the competitor's category listings into competitor_products
+    (`details`: product pages for cards without a barcode), then, with
+    `match`, barcode-match the items offline.
+    """
+    comp = (
+        await session.execute(
+            select(models.Competitor).where(models.Competitor.code == competitor_code)
+        )
+    ).scalar_one_or_none()
+    if not comp:
+        raise HTTPException(status_code=404, detail="Competitor not found")
+    scraper = scrapers.get(comp.code)
+    if scraper is None or not scraper.can_crawl:
+        raise HTTPException(status_code=400, detail="No catalogue crawler for this competitor")
+
+    report = await catalogue.crawl(
+        session, comp, concurrency=concurrency, max_pages=max_pages, details=details
+    )
+    if match:
+        report["match"] = await matcher.match_offline(session, comp)
+    log.info("Catalogue: crawl finished", extra={"competitor": competitor_code, "report": report})
+    return {"status": "ok", **report}
+
+@router.post("/auto_name/{competitor_code}", response_model=dict)
+async def auto_match_by_name(
+    competitor_code: str,
+    threshold: float | None = Query(None, ge=0, le=1),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Items without a barcode: create an unapproved match to the stored
+    competitor product with the most similar name, if it scores >= threshold.
+    """
+    comp = (
+        await session.execute(
+            select(models.Competitor).where(models.Competitor.code == competitor_code)
+        )
+    ).scalar_one_or_none()
+    if not comp:
+        raise HTTPException(status_code=404, detail="Competitor not found")
+
+    report = await matcher.auto_match_by_name(session, comp, threshold=threshold)
+    log.info("Matcher: name match finished", extra={"competitor": competitor_code, "report": report})
+    return {"status": "ok", **report}
+
+@router.get("/suggest/{competitor_code}/{item_id}", response_model=list[NameCandidate])
+async def suggest_by_name(
+    competitor_code: str,
+    item_id: int,
+    k: int = Query(5, ge=1, le=50),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Top-k stored competitor products for the item's name, best first."""
     comp = (
         await session.execute(
             select(models.Competitor).where(models.Competitor.code == competitor_code)
@@ -18,25 +116,95 @@ async def auto_match_all(competitor_code: str, session: AsyncSession = Depends(g
     ).scalar_one_or_none()
     if not comp:
         raise HTTPException(status_code=404, detail="Competitor not found")
+    item = await session.get(models.Item, item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
 
-    items = (await session.execute(select(models.Item))).scalars().all()
-    created = 0
-    for it in items:
-        m = await auto_match_by_barcode(session, comp.id, it)
-        if m:
-            created += 1
-    return {"status": "ok", "created": created}
+    return [
+        NameCandidate(
+            competitor_product_id=cp.id,
+            sku=cp.sku,
+            name=cp.name,
+            url=cp.url,
+            barcode=cp.barcode,
+            score=score,
+        )
+        for cp, score in await matcher.suggest_by_name(session, comp, item, k)
+    ]
 
-@router.get("/view/{competitor_code}", response_model=list[dict])
-async def view_table(competitor_code: str, session: AsyncSession = Depends(get_session)):
+@router.get("/view/{competitor_code}", response_model=Page[MatchViewRow])
+async def view_table(
+    competitor_code: str,
+    request: Request,
+    limit: int = Query(200, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str | None = None,
+    sort: str = "id",
+    with_total: bool = False,
+    matched: bool | None = None,
+    approved: bool | None = None,
+    has_barcode: bool | None = None,
+    tag_id: int | None = None,
+    sku_prefix: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
     """
-    Row per item:
+    Row per item (keyset-paginated, filters scoped to this competitor):
       - item_id
       - our_sku
-      - comp_barcode (if matched & approved for this competitor)
+      - comp_barcode (best match for this competitor; approved ones win)
       - comp_url (clickable)
       - approved
     """
+    async def build():
+        comp = (
+            await session.execute(
+                select(models.Competitor).where(models.Competitor.code == competitor_code)
+            )
+        ).scalar_one_or_none()
+        if not comp:
+            raise HTTPException(status_code=404, detail="Competitor not found")
+
+        filters = queries.item_filters(
+            comp.id, matched, approved, has_barcode, tag_id, sku_prefix
+        )
+        # one statement: keyset page of items -> matches ranked for that page only
+        page = pagination.keyset(
+            select(models.Item.id, models.Item.sku).where(*filters), sort, cursor, limit
+        ).subquery("page")
+        res = await session.execute(
+            queries.match_view_select(comp.id, page).order_by(pagination.order_by(sort, page.c))
+        )
+        rows = list(res.mappings().all())
+        key = pagination.sort_column(sort).key
+        nxt = pagination.next_cursor(
+            rows, sort, limit, key=lambda r: r["item_id" if key == "id" else "our_sku"]
+        )
+        rows = [MatchViewRow.model_validate(dict(r)) for r in rows]
+
+        total = None
+        if with_total:
+            total = (
+                await session.execute(select(func.count()).select_from(models.Item).where(*filters))
+            ).scalar_one()
+        return Page[MatchViewRow](items=rows, next_cursor=nxt, total=total)
+
+    # unchanged data -> 304 / cached page after a single version lookup
+    return await response_cache.cached_json(request, session, build)
+
+@router.get("/view/{competitor_code}/stream")
+async def view_table_stream(
+    competitor_code: str,
+    matched: bool | None = None,
+    approved: bool | None = None,
+    has_barcode: bool | None = None,
+    tag_id: int | None = None,
+    sku_prefix: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    The whole match view as NDJSON (one MatchViewRow per line), streamed from
+    a server-side cursor; rows go out as they are read.
+    """
     comp = (
         await session.execute(
             select(models.Competitor).where(models.Competitor.code == competitor_code)
@@ -45,45 +213,24 @@ async def view_table(competitor_code: str, session: AsyncSession = Depends(get_s
     if not comp:
         raise HTTPException(status_code=404, detail="Competitor not found")
 
-    q = await session.execute(
-        select(
-            models.Item.id.label("item_id"),
-            models.Item.sku.label("our_sku"),
-            models.CompetitorProduct.barcode.label("comp_barcode"),
-            models.CompetitorProduct.url.label("comp_url"),
-            func.coalesce(models.Match.approved, False).label("approved"),
-        )
-        .select_from(models.Item)
-        .join(models.Match, models.Match.item_id == models.Item.id, isouter=True)
-        .join(models.CompetitorProduct, models.CompetitorProduct.id == models.Match.competitor_product_id, isouter=True)
-        .where(
-            (models.Match.id.is_(None)) | (models.CompetitorProduct.competitor_id == comp.id)
-        )
-        .order_by(models.Item.id.asc())
+    stmt = (
+        queries.match_view_select(comp.id)
+        .where(*queries.item_filters(comp.id, matched, approved, has_barcode, tag_id, sku_prefix))
+        .order_by(models.Item.id)
+        .execution_options(yield_per=STREAM_BATCH)
     )
 
-    rows_map: dict[int, dict] = {}
-    for item_id, our_sku, comp_barcode, comp_url, approved in q.all():
-        cand = {
-            "item_id": item_id,
-            "our_sku": our_sku,
-            "comp_barcode": comp_barcode,
-            "comp_url": comp_url,
-            "approved": bool(approved),
-        }
-        prev = rows_map.get(item_id)
-        if prev is None or (not prev["approved"] and cand["approved"]):
-            rows_map[item_id] = cand
-
-    # Ensure every item appears
-    all_items = (await session.execute(select(models.Item.id, models.Item.sku))).all()
-    for item_id, sku in all_items:
-        rows_map.setdefault(item_id, {
-            "item_id": item_id, "our_sku": sku,
-            "comp_barcode": None, "comp_url": None, "approved": False
-        })
-
-    return list(rows_map.values())
+    async def body():
+        # the request-scoped session is closed before the body is sent
+        async with ReadSessionLocal() as s:
+            result = await s.stream(stmt)
+            async for batch in result.mappings().partitions(STREAM_BATCH):
+                yield "".join(
+                    json.dumps({**r, "approved": bool(r["approved"])}, ensure_ascii=False) + "\n"
+                    for r in batch
+                )
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
 @router.post("/manual_by_barcode/{competitor_code}", response_model=dict)
 async def manual_by_barcode(
@@ -93,8 +240,8 @@ async def manual_by_barcode(
     session: AsyncSession = Depends(get_session),
 ):
     """
-    Manually link by competitor BARCODE: search praktiker, upsert competitor product,
-    create APPROVED match.
+    Manually link by competitor BARCODE: search the competitor's site, upsert
+    competitor product, create APPROVED match.
     """
     comp = (
         await session.execute(
@@ -103,6 +250,9 @@ async def manual_by_barcode(
     ).scalar_one_or_none()
     if not comp:
         raise HTTPException(status_code=404, detail="Competitor not found")
+    scraper = scrapers.get(comp.code)
+    if scraper is None:
+        raise HTTPException(status_code=400, detail="No scraper for this competitor")
 
     item = (
         await session.execute(select(models.Item).where(models.Item.id == item_id))
@@ -110,7 +260,7 @@ async def manual_by_barcode(
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    result = await scraper_praktiker.search_by_barcode(competitor_barcode)
+    result = await scraper.cache.get(competitor_barcode)
     if not result:
         raise HTTPException(status_code=404, detail="Competitor product not found by barcode")
 
@@ -132,6 +282,8 @@ async def manual_by_barcode(
         )
         session.add(cp)
         await session.flush()
+    if result.get("price") is not None:
+        await crud.record_prices(session, {cp.id: result["price"]})
 
     match = models.Match(
         item_id=item.id,
@@ -140,5 +292,8 @@ async def manual_by_barcode(
         approved=True,
     )
     session.add(match)
+    await session.flush()
+    await crud.refresh_comparisons(session, item_ids=[item.id])
+    await crud.bump_data_version(session)
     await session.commit()
     return {"status": "ok", "item_id": item.id, "comp_barcode": cp.barcode, "comp_url": cp.url}
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..db import get_session
 from .. import models
+from ..services import outbox, scheduler
 
 router = APIRouter(prefix="/schedules", tags=["schedules"])
 
@@ -14,16 +17,109 @@ async def create_schedule(
     cron: str,
     session: AsyncSession = Depends(get_session),
 ):
+    if await session.get(models.Tag, tag_id) is None:
+        raise HTTPException(404, "Tag not found")
     s = models.EmailSchedule(tag_id=tag_id, cron=cron, active=True)
     session.add(s)
+    await session.flush()
+    # the job goes live with the schedule (same transaction), on every worker
+    try:
+        job = await scheduler.put_email_job(session, s)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid cron: {e}")
     await session.commit()
-    return {"id": s.id, "status": "ok"}
+    scheduler.wake()
+    return {"id": s.id, "status": "ok", "next_run_at": job.next_run_at}
 
 
 @router.get("/", response_model=list[dict])
 async def list_schedules(session: AsyncSession = Depends(get_session)):
-    res = await session.execute(select(models.EmailSchedule))
+    job = models.ScheduledJob
+    res = await session.execute(
+        select(models.EmailSchedule, job.next_run_at, job.last_run_at, job.last_outcome)
+        .outerjoin(job, job.email_schedule_id == models.EmailSchedule.id)
+    )
     return [
-        {"id": s.id, "tag_id": s.tag_id, "cron": s.cron, "active": s.active}
-        for s in res.scalars().all()
+        {
+            "id": s.id, "tag_id": s.tag_id, "cron": s.cron, "active": s.active,
+            "next_run_at": next_run_at, "last_run_at": last_run_at, "last_outcome": last_outcome,
+        }
+        for s, next_run_at, last_run_at, last_outcome in res.all()
     ]
+
+
+@router.put("/{schedule_id}", response_model=dict)
+async def update_schedule(
+    schedule_id: int,
+    cron: str | None = None,
+    active: bool | None = None,
+    session: AsyncSession = Depends(get_session),
+):
+    """Change the cron and/or pause (active=false) / resume a schedule; only its own job changes."""
+    s = await session.get(models.EmailSchedule, schedule_id)
+    if not s:
+        raise HTTPException(404, "Schedule not found")
+    if cron is not None:
+        s.cron = cron
+    if active is not None:
+        s.active = active
+    next_run_at = None
+    if s.active:
+        try:
+            next_run_at = (await scheduler.put_email_job(session, s)).next_run_at
+        except ValueError as e:
+            raise HTTPException(400, f"Invalid cron: {e}")
+    else:
+        await scheduler.remove_job(session, scheduler.email_job_id(s.id))
+    await session.commit()
+    scheduler.wake()
+    return {"id": s.id, "status": "ok", "next_run_at": next_run_at}
+
+
+@router.delete("/{schedule_id}", response_model=dict)
+async def delete_schedule(schedule_id: int, session: AsyncSession = Depends(get_session)):
+    s = await session.get(models.EmailSchedule, schedule_id)
+    if not s:
+        raise HTTPException(404, "Schedule not found")
+    await scheduler.remove_job(session, scheduler.email_job_id(s.id))
+    await session.delete(s)
+    await session.commit()
+    return {"id": schedule_id, "status": "ok"}
+
+
+@router.get("/jobs", response_model=list[dict])
+async def list_jobs(session: AsyncSession = Depends(get_session)):
+    """Every scheduled job (email reports, price refresh, catalogue crawl) with its last run."""
+    return await scheduler.list_jobs(session)
+
+
+@router.get("/outbox", response_model=list[dict])
+async def list_outbox(
+    status: str | None = None,
+    limit: int = 100,
+    session: AsyncSession = Depends(get_session),
+):
+    """Recent queued/sent emails with delivery status (attachments omitted)."""
+    o = models.EmailOutbox
+    stmt = select(
+        o.id, o.tag_id, o.to_email, o.subject, o.attachment_name, o.status,
+        o.attempts, o.last_error, o.next_attempt_at, o.sent_at, o.created_at,
+    ).order_by(o.id.desc()).limit(min(max(1, limit), 1000))
+    if status:
+        stmt = stmt.where(o.status == status)
+    res = await session.execute(stmt)
+    return [dict(r._mapping) for r in res.all()]
+
+
+@router.post("/outbox/{message_id}/retry", response_model=dict)
+async def retry_outbox(message_id: int, session: AsyncSession = Depends(get_session)):
+    msg = await session.get(models.EmailOutbox, message_id)
+    if not msg:
+        raise HTTPException(404, "Message not found")
+    if msg.status != "failed":
+        raise HTTPException(409, f"Message is {msg.status}")
+    msg.status, msg.attempts = "pending", 0
+    msg.next_attempt_at = datetime.now(timezone.utc)
+    await session.commit()
+    outbox.wake()
+    return {"id": msg.id, "status": "ok"}
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends
+import zipfile
+from typing import Literal
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from ..db import get_session
-from .. import models
-from ..schemas import TagIn, TagOut
+from .. import crud, models, queries
+from ..schemas import ItemFilterIn, TagIn, TagItemsIn, TagOut
+from ..services import importer
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -15,11 +20,74 @@ async def create_tag(tag: TagIn, session: AsyncSession = Depends(get_session)):
     session.add(t)
     await session.commit()
     await session.refresh(t)
-    return TagOut(id=t.id, name=t.name, email=t.email)
+    return TagOut.model_validate(t)
 
 
 @router.get("/", response_model=list[TagOut])
 async def list_tags(session: AsyncSession = Depends(get_session)):
     res = await session.execute(select(models.Tag))
     tags = res.scalars().all()
-    return [TagOut(id=t.id, name=t.name, email=t.email) for t in tags]
+    return [TagOut.model_validate(t) for t in tags]
+
+
+# ---------- bulk membership ----------
+
+async def _tag_or_404(session: AsyncSession, tag_id: int) -> None:
+    if await session.get(models.Tag, tag_id) is None:
+        raise HTTPException(status_code=404, detail="Tag not found")
+
+
+async def _filters(session: AsyncSession, f: ItemFilterIn) -> list:
+    competitor_id = None
+    if f.competitor_code:
+        competitor_id = (
+            await session.execute(
+                select(models.Competitor.id).where(models.Competitor.code == f.competitor_code)
+            )
+        ).scalar_one_or_none()
+        if competitor_id is None:
+            raise HTTPException(status_code=404, detail="Competitor not found")
+    return queries.item_filters(
+        competitor_id, f.matched, f.approved, f.has_barcode, f.tag_id, f.sku_prefix
+    )
+
+
+async def _apply(session: AsyncSession, tag_id: int, action: str, skus=None, filters=None) -> dict:
+    change = crud.add_tag_items if action == "add" else crud.remove_tag_items
+    counts = await change(session, tag_id, skus=skus, filters=filters)
+    return {"status": "ok", "tag_id": tag_id, **counts}
+
+
+@router.post("/{tag_id}/items/{action}", response_model=dict)
+async def change_items(
+    tag_id: int,
+    action: Literal["add", "remove"],
+    body: TagItemsIn,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Add items to / remove them from a tag, by SKU list (`skus`) or by a filter
+    over the catalog (`filter`: the /items list filters, or `{"all": true}` for
+    every item; an empty filter is rejected). One transaction;
+    items already in (or not in) the tag are counted, not errors.
+    """
+    await _tag_or_404(session, tag_id)
+    if body.filter is not None:
+        return await _apply(session, tag_id, action, filters=await _filters(session, body.filter))
+    return await _apply(session, tag_id, action, skus=body.skus)
+
+
+@router.post("/{tag_id}/items/{action}/file", response_model=dict)
+async def change_items_from_file(
+    tag_id: int,
+    action: Literal["add", "remove"],
+    file: UploadFile = File(...),
+    session: AsyncSession = Depends(get_session),
+):
+    """SKUs from a CSV/XLSX (a sku column, or one column of bare SKUs); as above otherwise."""
+    await _tag_or_404(session, tag_id)
+    try:
+        skus = await run_in_threadpool(importer.read_skus, file.file, file.filename)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read file: {e}")
+    return await _apply(session, tag_id, action, skus=skus)
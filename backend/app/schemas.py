@@ -1,8 +1,20 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field, ConfigDict
+from typing import Generic, Optional, List, TypeVar
+from pydantic import BaseModel, Field, ConfigDict, model_validator
+
+T = TypeVar("T")
+
+# -------------------------
+# Pagination
+# -------------------------
+
+class Page(BaseModel, Generic[T]):
+    """One keyset page; pass `next_cursor` back as `cursor` for the next one."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None     # only when requested (with_total=true)
 
 # -------------------------
 # Item
@@ -40,6 +52,39 @@ class TagOut(BaseModel):
     email: Optional[str]
     created_at: datetime
 
+class ItemFilterIn(BaseModel):
+    """
+    Selects items like the /items list filters. At least one criterion is
+    required; the whole catalogue only with an explicit `all: true`.
+    """
+    competitor_code: Optional[str] = None
+    matched: Optional[bool] = None
+    approved: Optional[bool] = None
+    has_barcode: Optional[bool] = None
+    tag_id: Optional[int] = None     # items of another tag
+    sku_prefix: Optional[str] = None
+    all: bool = False
+
+    @model_validator(mode="after")
+    def _some_criterion(self):
+        criteria = [v for k, v in self if k != "all" and v not in (None, "")]
+        if self.all and criteria:
+            raise ValueError("all cannot be combined with other criteria")
+        if not self.all and not criteria:
+            raise ValueError("give at least one criterion, or all: true for every item")
+        return self
+
+class TagItemsIn(BaseModel):
+    """Items to add to / remove from a tag: a SKU list or a filter, not both."""
+    skus: Optional[List[str]] = None
+    filter: Optional[ItemFilterIn] = None
+
+    @model_validator(mode="after")
+    def _one_source(self):
+        if (self.skus is None) == (self.filter is None):
+            raise ValueError("give either skus or filter")
+        return self
+
 # -------------------------
 # Match (optional response)
 # -------------------------
@@ -54,6 +99,23 @@ class MatchOut(BaseModel):
     auto_by_barcode: bool
     created_at: datetime
 
+class MatchViewRow(BaseModel):
+    """One row of /match/view: an item and its best match for the competitor."""
+    item_id: int
+    our_sku: str
+    comp_barcode: Optional[str] = None
+    comp_url: Optional[str] = None
+    approved: bool = False
+
+class NameCandidate(BaseModel):
+    """A stored competitor product suggested for an item by name similarity."""
+    competitor_product_id: int
+    sku: str
+    name: str
+    url: str
+    barcode: Optional[str] = None
+    score: float                    # cosine similarity of the normalised names, 0..1
+
 # -------------------------
 # Competitor Product (minimal)
 # -------------------------
@@ -85,5 +147,31 @@ class PriceCompareRow(BaseModel):
     comp_name: Optional[str] = None
     our_price: float
     comp_price: Optional[float] = None
-    diff: Optional[float] = None
+    diff: Optional[float] = None          # our_price - comp_price
+    diff_pct: Optional[float] = None      # diff as % of comp_price
+    comp_price_checked_at: Optional[datetime] = None
+    price_age_s: Optional[int] = None     # seconds since comp_price was last confirmed
     comp_url: Optional[str] = None
+
+
+class PivotPrice(BaseModel):
+    """One competitor's cell in a PricePivotRow."""
+    price: Optional[float] = None
+    diff: Optional[float] = None          # our_price - price
+    diff_pct: Optional[float] = None
+    price_age_s: Optional[int] = None
+    url: Optional[str] = None
+
+
+class PricePivotRow(BaseModel):
+    """
+    Our price next to every competitor's latest price (keyed by competitor
+    code; competitors without an approved match are absent).
+    """
+    item_id: int
+    our_sku: str
+    our_name: str
+    our_price: float
+    best_price: Optional[float] = None    # lowest competitor price
+    best_competitor: Optional[str] = None
+    prices: dict[str, PivotPrice] = Field(default_factory=dict)
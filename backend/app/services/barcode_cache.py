@@ -0,0 +1,236 @@
+"""
+Cache in front of the competitor barcode search.
+
+- in-memory LRU with a TTL; "not found" answers are cached too, with their
+  own (shorter) TTL
+- concurrent lookups of the same barcode share one in-flight request
+- optionally persisted to the `barcode_lookups` table so the cache survives
+  restarts; `warm()` bulk-loads it for a list of barcodes and writes are
+  buffered and flushed in batches
+
+Lookup errors (timeouts, 5xx, ...) are never cached.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import models
+from ..config import settings
+from ..db import SessionLocal
+
+log = logging.getLogger(__name__)
+
+# SQL Server caps a statement at 2100 parameters
+_DB_CHUNK = 1000
+_FLUSH_EVERY = 200
+
+_MISSING = object()
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class BarcodeCache:
+    def __init__(
+        self,
+        competitor_code: str,
+        fetch: Callable[[str], Awaitable[Optional[dict]]],
+        maxsize: int | None = None,
+        ttl: float | None = None,
+        negative_ttl: float | None = None,
+        persist: bool | None = None,
+    ):
+        self.competitor_code = competitor_code
+        self._fetch = fetch
+        self.maxsize = maxsize if maxsize is not None else settings.BARCODE_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.BARCODE_CACHE_TTL
+        self.negative_ttl = (
+            negative_ttl if negative_ttl is not None else settings.BARCODE_CACHE_NEGATIVE_TTL
+        )
+        self.persist = persist if persist is not None else settings.BARCODE_CACHE_PERSIST
+
+        # barcode -> (expires_at on the monotonic clock, result or None)
+        self._entries: OrderedDict[str, tuple[float, Optional[dict]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._unsaved: dict[str, tuple[datetime, Optional[dict]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "db_loaded": 0,
+            "errors": 0,
+        }
+
+    # ---------- memory ----------
+
+    def _get_local(self, barcode: str):
+        entry = self._entries.get(barcode)
+        if entry is None:
+            return _MISSING
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[barcode]
+            return _MISSING
+        self._entries.move_to_end(barcode)
+        return result
+
+    def _put_local(self, barcode: str, result: Optional[dict], age: float = 0.0) -> None:
+        ttl = self.ttl if result is not None else self.negative_ttl
+        if age >= ttl:
+            return
+        self._entries[barcode] = (time.monotonic() + ttl - age, result)
+        self._entries.move_to_end(barcode)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop in-memory entries and counters (persisted lookups are kept)."""
+        self._entries.clear()
+        self._stats = dict.fromkeys(self._stats, 0)
+
+    # ---------- lookups ----------
+
+    async def get(self, barcode: str) -> Optional[dict]:
+        """Cached `search_by_barcode`: the product dict, or None when not found."""
+        result = self._get_local(barcode)
+        if result is not _MISSING:
+            self._stats["hits" if result is not None else "negative_hits"] += 1
+            return result
+
+        pending = self._inflight.get(barcode)
+        if pending is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        self._stats["misses"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[barcode] = fut
+        try:
+            result = await self._fetch(barcode)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            self._stats["errors"] += 1
+            fut.set_exception(e)
+            fut.exception()  # waiters re-raise; don't warn if there are none
+            raise
+        else:
+            fut.set_result(result)
+        finally:
+            self._inflight.pop(barcode, None)
+
+        self._put_local(barcode, result)
+        if self.persist:
+            self._unsaved[barcode] = (datetime.now(timezone.utc), result)
+            if len(self._unsaved) >= _FLUSH_EVERY:
+                try:
+                    await self.flush()
+                except Exception:  # the lookup itself succeeded; the batch stays buffered
+                    log.exception("BarcodeCache: flush failed", extra={"competitor": self.competitor_code})
+        return result
+
+    # ---------- persistence ----------
+
+    async def warm(self, barcodes: Iterable[str]) -> int:
+        """Load still-fresh persisted entries for `barcodes`; returns how many."""
+        if not self.persist:
+            return 0
+        wanted = [b for b in set(barcodes) if self._get_local(b) is _MISSING]
+        now = datetime.now(timezone.utc)
+        oldest = now - timedelta(seconds=max(self.ttl, self.negative_ttl))
+        loaded = 0
+        async with SessionLocal() as s:
+            for i in range(0, len(wanted), _DB_CHUNK):
+                res = await s.execute(
+                    select(
+                        models.BarcodeLookup.barcode,
+                        models.BarcodeLookup.found,
+                        models.BarcodeLookup.payload,
+                        models.BarcodeLookup.fetched_at,
+                    ).where(
+                        models.BarcodeLookup.competitor_code == self.competitor_code,
+                        models.BarcodeLookup.barcode.in_(wanted[i:i + _DB_CHUNK]),
+                        models.BarcodeLookup.fetched_at >= oldest,
+                    )
+                )
+                for barcode, found, payload, fetched_at in res.all():
+                    age = (now - _as_utc(fetched_at)).total_seconds()
+                    before = len(self._entries)
+                    self._put_local(barcode, json.loads(payload) if found else None, age)
+                    loaded += len(self._entries) > before
+        self._stats["db_loaded"] += loaded
+        return loaded
+
+    async def flush(self) -> None:
+        """
+        Write buffered lookups to `barcode_lookups` (one transaction). On failure
+        they stay buffered for the next flush; a barcode another worker inserted
+        meanwhile (uq_barcode_lookup) is retried once, as an update.
+        """
+        async with self._flush_lock:
+            for attempt in range(2):
+                if not self._unsaved:
+                    return
+                batch, self._unsaved = self._unsaved, {}
+                try:
+                    await self._write(batch)
+                    return
+                except BaseException as e:
+                    # lookups buffered while this one was written are newer
+                    self._unsaved = {**batch, **self._unsaved}
+                    if not isinstance(e, IntegrityError) or attempt:
+                        raise
+
+    async def _write(self, batch: dict[str, tuple[datetime, Optional[dict]]]) -> None:
+        codes = list(batch)
+        async with SessionLocal() as s:
+            for i in range(0, len(codes), _DB_CHUNK):
+                res = await s.execute(
+                    select(models.BarcodeLookup.barcode, models.BarcodeLookup.id).where(
+                        models.BarcodeLookup.competitor_code == self.competitor_code,
+                        models.BarcodeLookup.barcode.in_(codes[i:i + _DB_CHUNK]),
+                    )
+                )
+                existing = dict(res.all())
+                # bulk executemany, not unit-of-work adds (one INSERT ... RETURNING per row)
+                inserts, updates = [], []
+                for barcode in codes[i:i + _DB_CHUNK]:
+                    fetched_at, result = batch[barcode]
+                    values = {
+                        "found": result is not None,
+                        "payload": json.dumps(result, ensure_ascii=False) if result else None,
+                        "fetched_at": fetched_at,
+                    }
+                    if barcode in existing:
+                        updates.append({"id": existing[barcode], **values})
+                    else:
+                        inserts.append(
+                            {"competitor_code": self.competitor_code, "barcode": barcode, **values}
+                        )
+                if inserts:
+                    await s.execute(
+                        insert(models.BarcodeLookup).execution_options(render_nulls=True), inserts
+                    )
+                if updates:
+                    await s.execute(update(models.BarcodeLookup), updates)
+            await s.commit()
+
+    def stats(self) -> dict:
+        out = dict(self._stats, size=len(self._entries))
+        lookups = out["hits"] + out["negative_hits"] + out["misses"] + out["coalesced"]
+        out["hit_ratio"] = (
+            round((lookups - out["misses"]) / lookups, 3) if lookups else None
+        )
+        return out
+
@@ -0,0 +1,174 @@
+"""
+Catalogue crawl: walk a competitor's category listings once and store every
+product, with its barcode, in `competitor_products`. Barcode matching then
+becomes a join inside the database (matcher.match_offline) instead of one
+site search per item; the live search is only the fallback for barcodes
+the crawl did not find.
+
+Categories are walked `concurrency` at a time (within the site's shared
+scraper budget), each one page by page along its "next" links; a page seen
+before (categories overlap) is not fetched again. Every walked category is
+upserted in one transaction (crud.upsert_competitor_products).
+
+Cards without a barcode are completed from their product page afterwards
+(`details`). Stored barcodes survive later crawls, so that slow step only
+covers products that still have none.
+"""
+import asyncio
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models
+from ..config import settings
+from ..db import SessionLocal
+from . import matcher, pipeline, scrapers
+
+
+async def crawl(
+    session: AsyncSession,
+    competitor: models.Competitor,
+    concurrency: int | None = None,
+    max_pages: int | None = None,
+    details: bool = True,
+) -> dict:
+    """
+    Crawl the competitor's catalogue into `competitor_products`. `max_pages`
+    caps the pages walked per category (0/None: all). Returns counters and
+    per-stage timings.
+    """
+    competitor_id = competitor.id
+    scraper = scrapers.require(competitor.code)
+    if not scraper.can_crawl:
+        raise ValueError(f"The '{competitor.code}' scraper cannot crawl the catalogue")
+    concurrency = max(1, concurrency or settings.CATALOGUE_CONCURRENCY)
+    max_pages = settings.CATALOGUE_MAX_PAGES if max_pages is None else max_pages
+    started = time.perf_counter()
+
+    categories = await scraper.list_categories()
+    stats = {
+        "categories": len(categories),
+        "pages": 0,
+        "cards": 0,
+        "with_barcode": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "prices_changed": 0,
+    }
+    seen_pages: set[str] = set()
+
+    async def walk(url: str) -> list[dict]:
+        products, pages = [], 0
+        while url and url not in seen_pages and (not max_pages or pages < max_pages):
+            seen_pages.add(url)
+            found, url = await scraper.fetch_listing(url)
+            products.extend(found)
+            pages += 1
+        stats["pages"] += pages
+        return products
+
+    async def flush(batch: list) -> None:
+        products = [p for _, found in batch for p in found]
+        stats["cards"] += len(products)
+        stats["with_barcode"] += sum(1 for p in products if p.get("barcode"))
+        counts = await crud.upsert_competitor_products(session, competitor_id, products)
+        await session.commit()
+        for key in ("inserted", "updated", "unchanged", "prices_changed"):
+            stats[key] += counts[key]
+
+    listing = await pipeline.run(iter(categories), walk, flush, concurrency, batch_size=1)
+    listing_s = time.perf_counter() - started
+
+    t = time.perf_counter()
+    detail = {"pages": 0, "barcodes_found": 0, "failed": 0}
+    if details:
+        detail = await _complete_barcodes(session, competitor_id, scraper, concurrency)
+    details_s = time.perf_counter() - t
+
+    elapsed = time.perf_counter() - started
+    return {
+        **stats,
+        "failed": listing["failed"],
+        "details": detail,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "timings": {
+            "listing_s": round(listing_s, 3),
+            "fetch_s": round(listing["fetch_s"], 3),
+            "db_s": round(listing["flush_s"], 3),
+            "details_s": round(details_s, 3),
+        },
+    }
+
+
+async def _complete_barcodes(
+    session: AsyncSession,
+    competitor_id: int,
+    scraper: scrapers.Scraper,
+    concurrency: int,
+) -> dict:
+    """Fetch the product page of every stored product without a barcode."""
+    CP = models.CompetitorProduct
+    todo = (
+        await session.execute(
+            select(CP.id, CP.url).where(
+                CP.competitor_id == competitor_id,
+                (CP.barcode.is_(None)) | (CP.barcode == ""),
+                CP.url.is_not(None),
+            )
+        )
+    ).all()
+    stats = {"pages": len(todo), "barcodes_found": 0}
+
+    async def fetch(entry: tuple[int, str]):
+        return await scraper.fetch_product(entry[1])
+
+    async def flush(batch: list) -> None:
+        found = [(cp_id, res) for (cp_id, _), res in batch if res and res.get("barcode")]
+        if found:
+            await session.execute(
+                update(CP), [{"id": cp_id, "barcode": res["barcode"]} for cp_id, res in found]
+            )
+            await crud.bump_data_version(session)
+        await crud.record_prices(
+            session,
+            {cp_id: res["price"] for (cp_id, _), res in batch if res and res.get("price") is not None},
+        )
+        await session.commit()
+        stats["barcodes_found"] += len(found)
+
+    batch_size = min(max(1, settings.MATCH_BATCH_SIZE), 1000)
+    run = await pipeline.run(iter(todo), fetch, flush, concurrency, batch_size)
+    return {**stats, "failed": run["failed"]}
+
+
+async def crawl_all(**kwargs) -> dict:
+    """
+    Crawl every competitor whose scraper can, concurrently, then match their
+    items offline. Returns {code: report}; a failing competitor reports
+    {"error": ...} without stopping the others.
+    """
+    async with SessionLocal() as s:
+        comps = (
+            await s.execute(
+                select(models.Competitor).where(
+                    models.Competitor.code.in_(
+                        [sc.code for sc in scrapers.all_scrapers() if sc.can_crawl]
+                    )
+                )
+            )
+        ).scalars().all()
+
+    async def one(comp: models.Competitor) -> dict:
+        async with SessionLocal() as s:  # AsyncSession is not safe to share across tasks
+            report = await crawl(s, comp, **kwargs)
+            report["match"] = await matcher.match_offline(s, comp)
+            return report
+
+    results = await asyncio.gather(*(one(c) for c in comps), return_exceptions=True)
+    return {
+        c.code: ({"error": repr(r)} if isinstance(r, Exception) else r)
+        for c, r in zip(comps, results)
+    }
@@ -1,33 +1,98 @@
 import smtplib
 from email.message import EmailMessage
-from pathlib import Path
+from typing import Callable, Sequence
 
 from ..config import settings
 
 
-def send_email_with_attachment(
+def build_message(
     to_email: str,
     subject: str,
     body: str,
+    attachment: bytes | None = None,
+    attachment_name: str | None = None,
     attachment_path: str | None = None,
-) -> None:
+) -> EmailMessage:
+    """`attachment_path` (read now) takes precedence over `attachment` bytes."""
+    if attachment_path is not None:
+        with open(attachment_path, "rb") as fh:
+            attachment = fh.read()
     msg = EmailMessage()
     msg["From"] = settings.SMTP_FROM
     msg["To"] = to_email
     msg["Subject"] = subject
     msg.set_content(body)
 
-    if attachment_path:
-        data = Path(attachment_path).read_bytes()
+    if attachment is not None:
         msg.add_attachment(
-            data,
+            attachment,
             maintype="application",
             subtype="octet-stream",
-            filename=Path(attachment_path).name,
+            filename=attachment_name or "attachment",
         )
+    return msg
+
+
+def _connect() -> smtplib.SMTP:
+    s = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+    if settings.SMTP_USER and settings.SMTP_PASS:
+        s.starttls()
+        s.login(settings.SMTP_USER, settings.SMTP_PASS)
+    return s
+
+
+def _drop(conn: smtplib.SMTP | None) -> None:
+    if conn is not None:
+        conn.close()
+    return None
+
+
+def send_messages(messages: Sequence[Callable[[], EmailMessage]]) -> list[str | None]:
+    """
+    Send over one SMTP connection (blocking; run it in a thread). Messages are
+    given as builders, called just before each send, so only one attachment
+    is in memory at a time. Returns one entry per message: None when
+    accepted, else the error text. A dropped connection is re-opened once per
+    message; a connect/login failure fails the remaining messages without
+    retrying each of them.
+    """
+    results: list[str | None] = []
+    conn: smtplib.SMTP | None = None
+    pending = list(messages)
+    try:
+        for i, build in enumerate(pending):
+            try:
+                msg = build()
+            except OSError as e:  # attachment file missing / unreadable
+                results.append(repr(e))
+                continue
+            for attempt in (1, 2):
+                try:
+                    if conn is None:
+                        conn = _connect()
+                    conn.send_message(msg)
+                    results.append(None)
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    conn = _drop(conn)
+                    if attempt == 2:
+                        results.append(repr(e))
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    results.append(repr(e))  # this message only; connection is still usable
+                    break
+                except (OSError, smtplib.SMTPException) as e:
+                    if conn is None:  # could not connect / log in
+                        err = repr(e)
+                        results.extend(err for _ in pending[i:])
+                        return results
+                    conn = _drop(conn)
+                    if attempt == 2:
+                        results.append(repr(e))
+    finally:
+        if conn is not None:
+            try:
+                conn.quit()
+            except (OSError, smtplib.SMTPException):
+                conn.close()
+    return results
 
-    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
-        if settings.SMTP_USER and settings.SMTP_PASS:
-            s.starttls()
-            s.login(settings.SMTP_USER, settings.SMTP_PASS)
-        s.send_message(msg)
@@ -1,12 +1,31 @@
 from pathlib import Path
-from typing import Iterable
 
-import pandas as pd
+from openpyxl import Workbook
 
 
-def write_comparison_xlsx(rows: Iterable[dict], out_path: str) -> str:
-    df = pd.DataFrame(rows)
-    p = Path(out_path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    df.to_excel(p, index=False)
-    return str(p)
+class ComparisonXlsxWriter:
+    """
+    Row-at-a-time XLSX writer (openpyxl write-only mode): rows are flushed to
+    a temporary sheet file as they are appended, so memory stays bounded
+    whatever the row count. The header is taken from the first row's keys.
+    """
+
+    def __init__(self, out_path: str):
+        self.path = Path(out_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.rows = 0
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("Comparison")
+        self._columns: list[str] | None = None
+
+    def append(self, row: dict) -> None:
+        if self._columns is None:
+            self._columns = list(row.keys())
+            self._ws.append(self._columns)
+        self._ws.append([row.get(c) for c in self._columns])
+        self.rows += 1
+
+    def close(self) -> str:
+        self._wb.save(self.path)
+        return str(self.path)
+
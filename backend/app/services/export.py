@@ -0,0 +1,257 @@
+"""
+Streaming file exports of query results (GET /compare/{code}/export).
+
+Every encoder takes the statement's columns (`stmt.selected_columns`) and
+an async iterator of row batches (lists of mappings, as read from a
+server-side cursor) and yields the file as byte chunks. Nothing but the
+current batch is held, so memory stays flat whatever the row count, and the
+first bytes go out as soon as the first batch is read.
+
+- csv: UTF-8 with a BOM (Excel opens Cyrillic names correctly), ISO dates.
+- xlsx: written by hand rather than with openpyxl, whose write-only mode
+  still needs a seekable file and only zips it on save. The sheet is
+  deflated straight into the response. Zip entries use data descriptors
+  (zipfile does that on an unseekable stream), and cells are inline strings,
+  so there is no shared-strings table to collect first.
+- parquet: column types from the SQL types, one row group per
+  PARQUET_ROW_GROUP rows; needs the optional pyarrow package
+  (`available("parquet")`), imported on the first parquet export only.
+"""
+import csv
+import importlib.util
+import io
+import re
+import zipfile
+from datetime import date, datetime, timezone
+from typing import AsyncIterator, Iterable, Mapping
+from xml.sax.saxutils import escape
+
+from sqlalchemy import types as sa_types
+from sqlalchemy.sql.expression import ColumnCollection
+
+PARQUET_ROW_GROUP = 50_000
+
+Batches = AsyncIterator[list[Mapping]]
+
+
+class _Sink:
+    """Write-only file object that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    @property
+    def closed(self) -> bool:
+        return False
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+# ---------- csv ----------
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+async def csv_chunks(columns: ColumnCollection, batches: Batches) -> AsyncIterator[bytes]:
+    columns = list(columns.keys())
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    yield b"\xef\xbb\xbf" + buf.getvalue().encode("utf-8")
+    async for batch in batches:
+        buf.seek(0)
+        buf.truncate()
+        w.writerows([_csv_value(r[c]) for c in columns] for r in batch)
+        yield buf.getvalue().encode("utf-8")
+
+
+# ---------- xlsx ----------
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Comparison" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        "</Relationships>"
+    ),
+    # style 1: bold header, style 2: date + time
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        "</styleSheet>"
+    ),
+}
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+    'activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>'
+    "<sheetData>"
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+# control characters XML 1.0 does not allow (scraped names occasionally carry them)
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell(v, style: int = 0) -> str:
+    if v is None:
+        return "<c/>"
+    if isinstance(v, bool):
+        return f'<c t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float)):
+        return f"<c><v>{v!r}</v></c>"
+    if isinstance(v, datetime):
+        if v.tzinfo is not None:  # Excel has no time zones: UTC wall time
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return f'<c s="2"><v>{(v - _EXCEL_EPOCH).total_seconds() / 86400!r}</v></c>'
+    s = ' s="1"' if style else ""
+    return f'<c t="inlineStr"{s}><is><t xml:space="preserve">{escape(_XML_INVALID.sub("", str(v)))}</t></is></c>'
+
+
+def _xml_row(values: Iterable, style: int = 0) -> str:
+    # cells without an "r" reference are placed left to right
+    return "<row>" + "".join(_cell(v, style) for v in values) + "</row>"
+
+
+async def xlsx_chunks(columns: ColumnCollection, batches: Batches) -> AsyncIterator[bytes]:
+    columns = list(columns.keys())
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_STATIC.items():
+            zf.writestr(name, xml)
+        # force_zip64: the size is unknown up front and may pass 4 GB
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_HEAD + _xml_row(columns, style=1)).encode("utf-8"))
+            yield sink.drain()
+            async for batch in batches:
+                sheet.write("".join(_xml_row(r[c] for c in columns) for r in batch).encode("utf-8"))
+                chunk = sink.drain()
+                if chunk:  # the deflater holds small writes back
+                    yield chunk
+            sheet.write(_SHEET_TAIL.encode("utf-8"))
+    yield sink.drain()
+
+
+# ---------- parquet ----------
+
+def _arrow_type(sql_type):
+    import pyarrow as pa
+
+    if isinstance(sql_type, sa_types.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, sa_types.Integer):
+        return pa.int64()
+    if isinstance(sql_type, (sa_types.Float, sa_types.Numeric)):
+        return pa.float64()
+    if isinstance(sql_type, sa_types.DateTime):
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def _arrow_value(v):
+    if isinstance(v, datetime) and v.tzinfo is None:
+        return v.replace(tzinfo=timezone.utc)  # stored as UTC
+    return v
+
+
+async def parquet_chunks(columns: ColumnCollection, batches: Batches) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c.key, _arrow_type(c.type)) for c in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    pending: list[Mapping] = []
+
+    def write(rows: list[Mapping]) -> None:
+        arrays = [
+            pa.array([_arrow_value(r[f.name]) for r in rows], type=f.type)
+            for f in schema
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    async for batch in batches:
+        pending.extend(batch)
+        if len(pending) >= PARQUET_ROW_GROUP:
+            write(pending)
+            pending = []
+            yield sink.drain()
+    if pending:
+        write(pending)
+    writer.close()
+    yield sink.drain()
+
+
+# ---------- formats ----------
+
+# format -> (media type, file extension, encoder)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv", csv_chunks),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx", xlsx_chunks),
+    "parquet": ("application/vnd.apache.parquet", "parquet", parquet_chunks),
+}
+
+
+def available(fmt: str) -> bool:
+    # find_spec: checking must not import pyarrow
+    return fmt in FORMATS and (fmt != "parquet" or importlib.util.find_spec("pyarrow") is not None)
@@ -0,0 +1,148 @@
+"""
+Shared, pooled httpx client for the competitor scrapers.
+
+One AsyncClient per process, created on first use (`get_client()`; httpx
+itself is only imported then, which keeps it out of the app's startup) and
+closed by the app lifespan; everything else goes through `fetch_text()`. Connections are kept alive and
+reused, HTTP/2 is used when the `h2` package is installed, and transient
+failures (timeouts, connection errors, 429/5xx) are retried with jittered
+exponential backoff.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING
+
+from .. import metrics
+from ..config import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+log = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+_stats = {
+    "requests": 0,  # HTTP attempts, retries included
+    "retries": 0,
+    "failures": 0,  # gave up after the last attempt
+    "tcp_connects": 0,  # new connections opened (handshakes)
+    "tls_handshakes": 0,
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def _trace(event: str, info: dict) -> None:
+    # httpcore trace hook: only fires when a *new* connection is made
+    if event == "connection.connect_tcp.complete":
+        _stats["tcp_connects"] += 1
+    elif event == "connection.start_tls.complete":
+        _stats["tls_handshakes"] += 1
+
+
+def _build_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    import httpx
+
+    http2 = settings.SCRAPER_HTTP2 and _http2_available()
+    log.info(
+        "HTTP: pooled client",
+        extra={"http2": http2, "max_connections": settings.SCRAPER_MAX_CONNECTIONS},
+    )
+    return httpx.AsyncClient(
+        timeout=settings.SCRAPER_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.SCRAPER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SCRAPER_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SCRAPER_KEEPALIVE_EXPIRY,
+        ),
+        follow_redirects=True,
+        transport=transport,
+    )
+
+
+async def start(transport: httpx.AsyncBaseTransport | None = None) -> None:
+    """Create the client now; `transport` replaces the network (e.g. httpx.MockTransport in benchmarks)."""
+    global _client
+    if _client is None:
+        _client = _build_client(transport)
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        log.info("HTTP: client closed")
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared client, created on first use."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": uniform in [0, base * 2^attempt], capped
+    cap = min(settings.SCRAPER_BACKOFF_MAX, settings.SCRAPER_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+async def fetch_text(url: str, headers: dict | None = None) -> str:
+    """GET `url` and return the body; raises httpx errors once retries run out."""
+    import httpx
+
+    client = get_client()
+    attempts = max(1, settings.SCRAPER_RETRIES + 1)
+    host = httpx.URL(url).host
+    for attempt in range(attempts):
+        _stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            r = await client.get(url, headers=headers, extensions={"trace": _trace})
+            metrics.scraper_requests.observe(time.perf_counter() - started, host=host, status=r.status_code)
+            if r.status_code in RETRY_STATUSES and attempt + 1 < attempts:
+                raise httpx.HTTPStatusError(
+                    f"transient status {r.status_code}", request=r.request, response=r
+                )
+            r.raise_for_status()
+            return r.text
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if isinstance(e, httpx.TransportError):  # no response: label by error type
+                metrics.scraper_requests.observe(
+                    time.perf_counter() - started, host=host, status=type(e).__name__
+                )
+            transient = isinstance(e, httpx.TransportError) or (
+                e.response.status_code in RETRY_STATUSES
+            )
+            if not transient or attempt + 1 >= attempts:
+                _stats["failures"] += 1
+                raise
+            _stats["retries"] += 1
+            await asyncio.sleep(_backoff(attempt))
+    raise AssertionError("unreachable")
+
+
+def stats() -> dict:
+    """Connection-reuse counters since process start."""
+    out = dict(_stats)
+    out["reused_requests"] = max(0, out["requests"] - out["tcp_connects"])
+    out["reuse_ratio"] = (
+        round(out["reused_requests"] / out["requests"], 3) if out["requests"] else None
+    )
+    return out
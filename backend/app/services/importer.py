@@ -0,0 +1,172 @@
+"""
+Streaming item import from ERP exports (CSV / XLSX).
+
+Rows are read one at a time (csv reader / openpyxl read-only mode), validated
+against `ItemIn` and handed out in fixed-size chunks, so memory stays flat
+whatever the file size. Rows that fail validation are written to a reject CSV
+(original values + line number + error) instead of failing the import.
+"""
+import csv
+import io
+import itertools
+import re
+import uuid
+from pathlib import Path
+from typing import IO, Iterator, Optional
+
+from pydantic import ValidationError
+
+from ..config import settings
+from ..schemas import ItemIn
+
+# accepted header spellings -> ItemIn field
+HEADER_ALIASES = {
+    "sku": "sku", "code": "sku", "item_code": "sku", "код": "sku", "артикул": "sku",
+    "name": "name", "description": "name", "име": "name", "наименование": "name",
+    "barcode": "barcode", "ean": "barcode", "gtin": "barcode", "баркод": "barcode",
+    "price": "price", "цена": "price",
+}
+
+REJECT_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _field_for(header) -> Optional[str]:
+    key = str(header or "").strip().lower().replace(" ", "_")
+    return HEADER_ALIASES.get(key)
+
+
+def _clean(field: str, value):
+    if value is None:
+        return None
+    if field == "barcode" and isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel stores long barcodes as numbers
+    if field == "price" and isinstance(value, str):
+        value = value.replace("\xa0", "").replace(" ", "").replace(",", ".")
+    if isinstance(value, (int, float)) and field != "price":
+        value = str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return None
+    return value
+
+
+def _csv_rows(fh: IO[bytes]) -> Iterator[list]:
+    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    first = text.readline()
+    # ERP exports use ';' (BG locale) or ','; pick whichever the header uses most
+    delimiter = max((";", ",", "\t"), key=first.count)
+    yield next(csv.reader([first], delimiter=delimiter), [])
+    yield from csv.reader(text, delimiter=delimiter)
+
+
+def _xlsx_rows(fh: IO[bytes]) -> Iterator[list]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_raw_rows(fh: IO[bytes], filename: str) -> Iterator[list]:
+    """Header row first, then data rows, as plain lists."""
+    suffix = Path(filename or "").suffix.lower()
+    if suffix in (".xlsx", ".xlsm"):
+        return _xlsx_rows(fh)
+    if suffix in (".csv", ".txt", ""):
+        return _csv_rows(fh)
+    raise ValueError(f"Unsupported file type: {suffix or filename}")
+
+
+def read_skus(fh: IO[bytes], filename: str) -> list[str]:
+    """
+    Distinct SKUs from a CSV/XLSX/text file, in file order (blocking). Uses the
+    sku column when the header names one; otherwise the first column, the
+    first row included (a bare list of SKUs).
+    """
+    raw = iter_raw_rows(fh, filename)
+    first = next(raw, [])
+    fields = [_field_for(h) for h in first]
+    col = fields.index("sku") if "sku" in fields else 0
+    rows = raw if "sku" in fields else itertools.chain([first], raw)
+    skus = {}
+    for row in rows:
+        value = _clean("sku", row[col]) if len(row) > col else None
+        if value:
+            skus[value] = None
+    return list(skus)
+
+
+class ItemImport:
+    """
+    One import run. `next_chunk()` is blocking (parsing, reject writes), so
+    callers on the event loop should run it in a thread.
+    """
+
+    def __init__(self, fh: IO[bytes], filename: str, chunk_size: int | None = None):
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.reject_id: Optional[str] = None
+        self._reject_fh = None
+        self._reject_writer = None
+
+        self._raw = iter_raw_rows(fh, filename)
+        self._header = [str(h) if h is not None else "" for h in next(self._raw, [])]
+        self._fields = [_field_for(h) for h in self._header]
+        missing = {"sku", "name", "price"} - set(self._fields)
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}")
+        self._line = 1
+
+    def _reject(self, raw: list, error: str) -> None:
+        if self._reject_writer is None:
+            self.reject_id = uuid.uuid4().hex
+            path = reject_path(self.reject_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._reject_fh = path.open("w", encoding="utf-8-sig", newline="")
+            self._reject_writer = csv.writer(self._reject_fh)
+            self._reject_writer.writerow(["line", "error", *self._header])
+        self._reject_writer.writerow([self._line, error, *raw])
+        self.rejected += 1
+
+    def next_chunk(self) -> list[dict]:
+        """Up to `chunk_size` validated rows; an empty list means done."""
+        chunk: list[dict] = []
+        for raw in self._raw:
+            self._line += 1
+            if not any(v not in (None, "") for v in raw):
+                continue  # blank line
+            self.rows += 1
+            data = {}
+            for field, value in zip(self._fields, raw):
+                if field:
+                    data[field] = _clean(field, value)
+            try:
+                item = ItemIn(**data)
+            except ValidationError as e:
+                msg = "; ".join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                )
+                self._reject(raw, msg)
+                continue
+            chunk.append(item.model_dump())
+            self.accepted += 1
+            if len(chunk) >= self.chunk_size:
+                break
+        return chunk
+
+    def close(self) -> None:
+        if self._reject_fh is not None:
+            self._reject_fh.close()
+            self._reject_fh = None
+
+
+def reject_path(reject_id: str) -> Path:
+    if not REJECT_ID_RE.match(reject_id):
+        raise ValueError("Invalid reject file id")
+    return Path(settings.IMPORT_REJECTS_DIR) / f"item_import_rejects_{reject_id}.csv"
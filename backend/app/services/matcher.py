@@ -1,52 +1,330 @@
-from sqlalchemy import select
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+from sqlalchemy import func, insert, literal, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import models
-from . import scraper_praktiker
+from .. import crud, models
+from ..config import settings
+from . import pipeline, scrapers
+
+if TYPE_CHECKING:  # numpy: imported with the first name index, not at startup
+    from .name_index import NameIndex
+
+
+async def _product_ids(session: AsyncSession, competitor_id: int, skus) -> dict[str, int]:
+    q = await session.execute(
+        select(models.CompetitorProduct.sku, models.CompetitorProduct.id).where(
+            models.CompetitorProduct.competitor_id == competitor_id,
+            models.CompetitorProduct.sku.in_(skus),
+        )
+    )
+    return dict(q.all())
+
+
+def _already_matched(competitor_id: int):
+    return (
+        select(models.Match.item_id)
+        .join(
+            models.CompetitorProduct,
+            models.CompetitorProduct.id == models.Match.competitor_product_id,
+        )
+        .where(models.CompetitorProduct.competitor_id == competitor_id)
+    )
 
 
-async def auto_match_by_barcode(
+async def _upsert_matches(
     session: AsyncSession,
     competitor_id: int,
-    item: models.Item,
-):
+    found: list[tuple[int, dict]],
+) -> int:
+    """
+    Upsert the competitor products for a batch of (item_id, scrape result)
+    pairs and create the missing (approved=False) matches, in one transaction.
+    Returns the number of matches created.
+    """
+    if not found:
+        return 0
+
+    # upsert competitor products by (competitor_id, sku); bulk inserts, then
+    # one lookup for the new ids (unit-of-work adds would be one INSERT per row)
+    skus = {res["sku"] for _, res in found}
+    products = await _product_ids(session, competitor_id, skus)
+    new = {
+        res["sku"]: {
+            "competitor_id": competitor_id,
+            "sku": res["sku"],
+            "name": res["name"],
+            "url": res["url"],
+            "barcode": res.get("barcode"),
+        }
+        for _, res in found
+        if res["sku"] not in products
+    }
+    if new:
+        await session.execute(
+            insert(models.CompetitorProduct).execution_options(render_nulls=True), list(new.values())
+        )
+        products.update(await _product_ids(session, competitor_id, new))
+
+    # the search result already carries the price: keep it as a snapshot
+    await crud.record_prices(
+        session,
+        {products[res["sku"]]: res["price"] for _, res in found if res.get("price") is not None},
+    )
+
+    # skip pairs that are already linked (uq_item_competitor_product)
+    pairs = {(item_id, products[res["sku"]]) for item_id, res in found}
+    q = await session.execute(
+        select(models.Match.item_id, models.Match.competitor_product_id).where(
+            models.Match.item_id.in_({i for i, _ in pairs}),
+            models.Match.competitor_product_id.in_({c for _, c in pairs}),
+        )
+    )
+    new_pairs = pairs - {tuple(r) for r in q.all()}
+    if new_pairs:
+        await session.execute(
+            insert(models.Match),
+            [
+                {
+                    "item_id": item_id,
+                    "competitor_product_id": cp_id,
+                    "auto_by_barcode": True,
+                    "approved": False,
+                }
+                for item_id, cp_id in new_pairs
+            ],
+        )
+    if new_pairs:
+        await crud.bump_data_version(session)
+    await session.commit()
+    return len(new_pairs)
+
+
+async def match_offline(session: AsyncSession, competitor: models.Competitor) -> dict:
+    """
+    Barcode auto-match against the competitor products already stored (by the
+    catalogue crawl, see services/catalogue.py) as one INSERT ... SELECT: a
+    join on the indexed `items.barcode` / `competitor_products.barcode`
+    columns, no network. Items that already have a match for this competitor
+    are skipped; one product per item if several share its barcode.
+    """
+    competitor_id = competitor.id
+    started = time.perf_counter()
+    Item, CP = models.Item, models.CompetitorProduct
+    pairs = (
+        select(Item.id, func.min(CP.id), literal(True), literal(False))
+        .join(CP, CP.barcode == Item.barcode)
+        .where(
+            CP.competitor_id == competitor_id,
+            Item.barcode.is_not(None),
+            Item.barcode != "",
+            Item.id.not_in(_already_matched(competitor_id)),
+        )
+        .group_by(Item.id)
+    )
+    res = await session.execute(
+        insert(models.Match).from_select(
+            ["item_id", "competitor_product_id", "auto_by_barcode", "approved"], pairs
+        )
+    )
+    created = max(res.rowcount or 0, 0)
+    if created:
+        await crud.bump_data_version(session)
+    await session.commit()
+    return {"created": created, "elapsed_s": round(time.perf_counter() - started, 3)}
+
+
+async def auto_match_all(
+    session: AsyncSession,
+    competitor: models.Competitor,
+    concurrency: int | None = None,
+    batch_size: int | None = None,
+    live: bool = True,
+) -> dict:
     """
-    If the item has a barcode, try to find the competitor product (praktiker.bg)
-    and create a Match (approved=False). Returns the Match or None.
+    Barcode auto-match for every item that has a barcode and no match for this
+    competitor yet.
+
+    Stored (crawled) competitor products are matched first, in the database
+    (match_offline); only the barcodes left over are searched on the site, and
+    only with `live`.
+
+    Scrapes run `concurrency` at a time (and within the competitor's shared
+    scraper budget, see services/scrapers.py); results are handed to a single writer
+    that upserts competitor products / matches in batches of `batch_size`
+    (one commit per batch). Returns counters, throughput and per-stage timings
+    (`scrape_s` is summed across workers, so it can exceed `elapsed_s`).
     """
-    if not item.barcode:
-        return None
+    competitor_id = competitor.id
+    cache = scrapers.require(competitor.code).cache
+    concurrency = max(1, concurrency or settings.MATCH_CONCURRENCY)
+    # IN-lists per batch must stay under SQL Server's 2100 parameter limit
+    batch_size = min(max(1, batch_size or settings.MATCH_BATCH_SIZE), 1000)
+    started = time.perf_counter()
+
+    offline = await match_offline(session, competitor)
+    offline_s = time.perf_counter() - started
+
+    # ---- load: only items that still need a lookup
+    todo = []
+    if live:
+        todo = (
+            await session.execute(
+                select(models.Item.id, models.Item.barcode).where(
+                    models.Item.barcode.is_not(None),
+                    models.Item.barcode != "",
+                    models.Item.id.not_in(_already_matched(competitor_id)),
+                )
+            )
+        ).all()
+    # pull still-fresh persisted lookups into memory in a few bulk queries
+    await cache.warm(barcode for _, barcode in todo)
+    load_s = time.perf_counter() - started - offline_s
+
+    stats = {"items": len(todo), "found": 0, "not_found": 0, "created": 0}
+
+    async def lookup(entry: tuple[int, str]):
+        return await cache.get(entry[1])
+
+    async def flush(batch: list) -> None:
+        found = [(item_id, res) for (item_id, _), res in batch if res]
+        stats["found"] += len(found)
+        stats["not_found"] += len(batch) - len(found)
+        stats["created"] += await _upsert_matches(session, competitor_id, found)
+
+    try:
+        run = await pipeline.run(iter(todo), lookup, flush, concurrency, batch_size)
+    finally:
+        await cache.flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        **stats,
+        "offline_created": offline["created"],
+        "failed": run["failed"],
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(stats["items"] / elapsed, 2) if elapsed > 0 else None,
+        "timings": {
+            "offline_s": round(offline_s, 3),
+            "load_s": round(load_s, 3),
+            "scrape_s": round(run["fetch_s"], 3),
+            "db_s": round(run["flush_s"], 3),
+        },
+        "cache": cache.stats(),
+    }
+
+
+# ---------- name matching (items without a barcode) ----------
 
-    res = await scraper_praktiker.search_by_barcode(item.barcode)
-    if not res:
-        return None
+# competitor_id -> ((product count, max product id), index); rebuilt when products are added
+_name_indexes: dict[int, tuple[tuple, "NameIndex"]] = {}
 
-    # upsert competitor product
+
+async def name_index(session: AsyncSession, competitor_id: int) -> "NameIndex":
+    """The competitor's stored products indexed by name (built in a thread, cached)."""
+    from .name_index import NameIndex
+
+    CP = models.CompetitorProduct
+    signature = tuple(
+        (
+            await session.execute(
+                select(func.count(), func.max(CP.id)).where(CP.competitor_id == competitor_id)
+            )
+        ).one()
+    )
+    cached = _name_indexes.get(competitor_id)
+    if cached and cached[0] == signature:
+        return cached[1]
+    rows = (
+        await session.execute(select(CP.id, CP.name).where(CP.competitor_id == competitor_id))
+    ).all()
+    index = await asyncio.to_thread(NameIndex, [r[0] for r in rows], [r[1] or "" for r in rows])
+    _name_indexes[competitor_id] = (signature, index)
+    return index
+
+
+async def suggest_by_name(
+    session: AsyncSession,
+    competitor: models.Competitor,
+    item: models.Item,
+    k: int | None = None,
+) -> list[tuple[models.CompetitorProduct, float]]:
+    """Top `k` stored competitor products for the item's name, with cosine scores."""
+    index = await name_index(session, competitor.id)
+    [candidates] = await asyncio.to_thread(index.top_k, [item.name or ""], k or settings.FUZZY_TOP_K)
+    if not candidates:
+        return []
     q = await session.execute(
         select(models.CompetitorProduct).where(
-            models.CompetitorProduct.competitor_id == competitor_id,
-            models.CompetitorProduct.sku == res["sku"],
+            models.CompetitorProduct.id.in_([cp_id for cp_id, _ in candidates])
         )
     )
-    cp = q.scalar_one_or_none()
-    if not cp:
-        cp = models.CompetitorProduct(
-            competitor_id=competitor_id,
-            sku=res["sku"],
-            name=res["name"],
-            url=res["url"],
-            barcode=res.get("barcode"),
+    products = {cp.id: cp for cp in q.scalars().all()}
+    return [(products[cp_id], score) for cp_id, score in candidates if cp_id in products]
+
+
+async def auto_match_by_name(
+    session: AsyncSession,
+    competitor: models.Competitor,
+    threshold: float | None = None,
+) -> dict:
+    """
+    Name auto-match for every item without a barcode and without a match for
+    this competitor: the best stored competitor product scoring at least
+    `threshold` becomes an unapproved match. Products only get stored by the
+    barcode matcher / crawler, so this never scrapes.
+    """
+    competitor_id = competitor.id
+    threshold = settings.FUZZY_MATCH_THRESHOLD if threshold is None else threshold
+    started = time.perf_counter()
+    todo = (
+        await session.execute(
+            select(models.Item.id, models.Item.name).where(
+                (models.Item.barcode.is_(None)) | (models.Item.barcode == ""),
+                models.Item.id.not_in(_already_matched(competitor_id)),
+            )
         )
-        session.add(cp)
-        await session.flush()
+    ).all()
+    load_s = time.perf_counter() - started
+
+    t = time.perf_counter()
+    index = await name_index(session, competitor_id)
+    index_s = time.perf_counter() - t
 
-    match = models.Match(
-        item_id=item.id,
-        competitor_product_id=cp.id,
-        auto_by_barcode=True,
-        approved=False,
+    t = time.perf_counter()
+    best = await asyncio.to_thread(
+        index.top_k, [name or "" for _, name in todo], 1, threshold
     )
-    session.add(match)
+    score_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    new = [
+        {"item_id": item_id, "competitor_product_id": cand[0][0], "auto_by_barcode": False, "approved": False}
+        for (item_id, _), cand in zip(todo, best)
+        if cand
+    ]
+    for i in range(0, len(new), 1000):
+        await session.execute(insert(models.Match), new[i:i + 1000])
+    if new:
+        await crud.bump_data_version(session)
     await session.commit()
-    await session.refresh(match)
-    return match
+    db_s = time.perf_counter() - t
+
+    elapsed = time.perf_counter() - started
+    return {
+        "items": len(todo),
+        "products": len(index),
+        "created": len(new),
+        "threshold": threshold,
+        "elapsed_s": round(elapsed, 3),
+        "timings": {
+            "load_s": round(load_s, 3),
+            "index_s": round(index_s, 3),
+            "score_s": round(score_s, 3),
+            "db_s": round(db_s, 3),
+        },
+    }
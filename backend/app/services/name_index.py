@@ -0,0 +1,231 @@
+"""
+Product-name similarity for items without a barcode.
+
+Names are normalised first: case, "ё", decimal commas, dimension separators
+(10 х 20, 10x20, 10*20) and units (мм/см/м -> mm, мл/л -> ml, г/кг -> g,
+Вт -> w, бр -> pcs), so "Боя 2,5 л" and "БОЯ 2500мл" agree. A name becomes a
+set of features: character 3-grams of every word (padded, so word starts
+and ends count) plus every token with a digit as a whole ("2500ml",
+"4x40mm"), because sizes tell variants apart. Features are weighted by idf
+over the products and L2-normalised; the score of a pair is their cosine.
+
+Blocking: `NameIndex` keeps an inverted index (feature -> products, CSR
+arrays) of the features found in at most FUZZY_MAX_DF products, so a query
+only touches the postings of its own rarer features; common ones (" бо",
+"ков") would pull in most of the catalogue. The products sharing the most
+weight with a name there become its FUZZY_CANDIDATES candidates, which are
+then scored with the full vectors. Queries run in blocks sized by their
+total posting length and entirely in numpy (no loop per item or pair).
+"""
+import re
+
+import numpy as np
+
+from ..config import settings
+
+# ---------- normalisation ----------
+
+# unit -> (base unit, factor); longest spellings first in the regex
+_UNITS = {
+    "mm": ("mm", 1), "мм": ("mm", 1),
+    "cm": ("mm", 10), "см": ("mm", 10),
+    "m": ("mm", 1000), "м": ("mm", 1000),
+    "ml": ("ml", 1), "мл": ("ml", 1),
+    "l": ("ml", 1000), "л": ("ml", 1000), "литра": ("ml", 1000), "литър": ("ml", 1000),
+    "g": ("g", 1), "г": ("g", 1), "гр": ("g", 1),
+    "kg": ("g", 1000), "кг": ("g", 1000),
+    "w": ("w", 1), "вт": ("w", 1), "kw": ("w", 1000), "квт": ("w", 1000),
+    "v": ("v", 1),  # not "в": "5 в 1" is "5-in-1"
+    "pcs": ("pcs", 1), "бр": ("pcs", 1),
+}
+_NUM = r"\d+(?:\.\d+)?"
+_AREA_RE = re.compile(rf"({_NUM})\s?(?:м2|м²|m2|m²|кв\.?\s?м\b)")
+_DIM_RE = re.compile(rf"({_NUM})\s?[xх×*]\s?(?={_NUM})")
+_UNIT_RE = re.compile(
+    rf"(?<![\w.])({_NUM}(?:x{_NUM})*)\s?("
+    + "|".join(sorted(map(re.escape, _UNITS), key=len, reverse=True))
+    + r")(?![\w])"
+)
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+(?:[.x][0-9a-zа-я]+)*")
+_DIGIT_RE = re.compile(r"\d")
+
+
+def _fmt(x: float) -> str:
+    return ("%.6f" % x).rstrip("0").rstrip(".")
+
+
+def _unit(m: re.Match) -> str:
+    base, factor = _UNITS[m.group(2)]
+    return "x".join(_fmt(float(v) * factor) for v in m.group(1).split("x")) + base
+
+
+def normalize(name: str) -> str:
+    s = name.lower().replace("ё", "е")
+    s = re.sub(r"(\d),(\d)", r"\1.\2", s)
+    s = _AREA_RE.sub(r"\1m2", s)
+    s = _DIM_RE.sub(r"\1x", s)
+    s = _UNIT_RE.sub(_unit, s)
+    return " ".join(_TOKEN_RE.findall(s))
+
+
+def features(name: str, n: int = 3) -> set[str]:
+    out: set[str] = set()
+    for tok in normalize(name).split():
+        padded = f" {tok} "
+        out.update(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+        if _DIGIT_RE.search(tok):
+            out.add("#" + tok)
+    return out
+
+
+# ---------- index ----------
+
+def _top_per_row(rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, k: int):
+    """The `k` best (row, col, score) per row, rows ascending, best first."""
+    # one float sort instead of lexsort: scores are cosines (0..1), so rows stay apart
+    order = np.argsort(rows * 4.0 - scores)
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    idx = np.arange(len(rows))
+    first = np.r_[True, rows[1:] != rows[:-1]] if len(rows) else np.zeros(0, dtype=bool)
+    rank = idx - np.maximum.accumulate(np.where(first, idx, 0))
+    top = rank < k
+    return rows[top], cols[top], scores[top]
+
+
+def _expand(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """concat(arange(s, s + n) for s, n in zip(starts, lengths)), without a Python loop."""
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))
+
+
+class NameIndex:
+    def __init__(self, ids: list[int], names: list[str], max_df: int | None = None):
+        max_df = max_df or settings.FUZZY_MAX_DF
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vocab: dict[str, int] = {}
+        cols, lengths = [], []
+        for name in names:
+            fs = features(name)
+            cols.extend(self.vocab.setdefault(f, len(self.vocab)) for f in fs)
+            lengths.append(len(fs))
+        n_prod, n_feat = len(ids), len(self.vocab)
+        cols = np.asarray(cols, dtype=np.int64)
+        rows = np.repeat(np.arange(n_prod, dtype=np.int64), lengths)
+
+        self.df = np.bincount(cols, minlength=n_feat)
+        self.idf = np.log((n_prod + 1) / (self.df + 1)) + 1.0
+        self.max_idf = float(np.log(n_prod + 1) + 1.0)  # for features no product has
+        self.max_df = max_df
+
+        w = self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=w * w, minlength=n_prod))
+        w = np.divide(w, norms[rows], out=np.zeros_like(w), where=norms[rows] > 0)
+
+        # product-major (product * n_feat + feature, sorted) for exact scores
+        key = rows * n_feat + cols
+        order = np.argsort(key)
+        self.pf_key, self.pf_w = key[order], w[order]
+
+        # feature-major postings (CSR) of the blocking features only
+        block = self.df[cols] <= max_df
+        cols, rows, w = cols[block], rows[block], w[block]
+        order = np.argsort(cols, kind="stable")
+        self.post_prod, self.post_w = rows[order], w[order]
+        self.indptr = np.zeros(n_feat + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=n_feat), out=self.indptr[1:])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _vectorize(self, names: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(query row, feature, weight) for the indexed features of each name, rows ascending."""
+        rows, cols, weights = [], [], []
+        for r, name in enumerate(names):
+            known, unknown = [], 0
+            for f in features(name):
+                c = self.vocab.get(f)
+                if c is None:
+                    unknown += 1  # no product has it, but it still dilutes the cosine
+                else:
+                    known.append(c)
+            if not known:
+                continue
+            w = self.idf[known]
+            w = w / np.sqrt(float(w @ w) + unknown * self.max_idf ** 2)
+            rows.extend([r] * len(known))
+            cols.extend(known)
+            weights.extend(w.tolist())
+        return (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            np.asarray(weights, dtype=np.float64),
+        )
+
+    def _exact(self, q_ptr, q_cols, q_w, rows: np.ndarray, prods: np.ndarray) -> np.ndarray:
+        """Full cosine of each (query row, product) pair."""
+        lengths = q_ptr[rows + 1] - q_ptr[rows]
+        pos = _expand(q_ptr[rows], lengths)
+        key = np.repeat(prods, lengths) * len(self.vocab) + q_cols[pos]
+        at = np.minimum(np.searchsorted(self.pf_key, key), len(self.pf_key) - 1)
+        hit = self.pf_key[at] == key
+        pair = np.repeat(np.arange(len(rows)), lengths)
+        return np.bincount(
+            pair[hit], weights=q_w[pos][hit] * self.pf_w[at[hit]], minlength=len(rows)
+        )
+
+    def top_k(
+        self,
+        names: list[str],
+        k: int = 5,
+        min_score: float = 0.0,
+        candidates: int | None = None,
+        block_postings: int | None = None,
+    ) -> list[list[tuple[int, float]]]:
+        """
+        Per query name: up to `k` (product id, score) pairs, best first.
+
+        Stage 1 ranks products by the blocking features alone and keeps
+        `candidates` per name; stage 2 scores those with the full vectors.
+        """
+        candidates = max(k, candidates or settings.FUZZY_CANDIDATES)
+        block_postings = block_postings or settings.FUZZY_BLOCK_POSTINGS
+        out: list[list[tuple[int, float]]] = [[] for _ in names]
+        q_rows, q_cols, q_w = self._vectorize(names)
+        if not len(q_rows) or not len(self):
+            return out
+        q_ptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(q_rows, minlength=len(names)), out=q_ptr[1:])
+
+        b = self.df[q_cols] <= self.max_df
+        b_rows, b_cols, b_w = q_rows[b], q_cols[b], q_w[b]
+        # the common features can add at most |q_common| to a pair's score
+        # (Cauchy-Schwarz, product vectors are unit length): prune what can't reach min_score
+        q_common = np.sqrt(np.bincount(q_rows[~b], weights=q_w[~b] ** 2, minlength=len(names)))
+        b_len = self.indptr[b_cols + 1] - self.indptr[b_cols]
+        if not len(b_rows) or not b_len.sum():
+            return out
+        # cut the (row-sorted) entries into blocks of ~block_postings postings,
+        # never splitting one query row
+        cum = np.cumsum(b_len)
+        cuts = np.searchsorted(cum, np.arange(block_postings, cum[-1], block_postings))
+        cuts = np.unique(np.searchsorted(b_rows, b_rows[np.minimum(cuts, len(b_rows) - 1)]))
+        n_prod = len(self)
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(b_rows)]):
+            lengths = b_len[lo:hi]
+            if not lengths.sum():
+                continue
+            pos = _expand(self.indptr[b_cols[lo:hi]], lengths)
+            key = np.repeat(b_rows[lo:hi], lengths) * n_prod + self.post_prod[pos]
+            keys, inverse = np.unique(key, return_inverse=True)
+            partial = np.bincount(inverse, weights=np.repeat(b_w[lo:hi], lengths) * self.post_w[pos])
+            rows, prods = keys // n_prod, keys % n_prod
+            if min_score > 0:
+                reach = partial + q_common[rows] >= min_score
+                rows, prods, partial = rows[reach], prods[reach], partial[reach]
+            rows, prods, _ = _top_per_row(rows, prods, partial, candidates)
+
+            scores = self._exact(q_ptr, q_cols, q_w, rows, prods)
+            ok = scores >= min_score
+            rows, prods, scores = _top_per_row(rows[ok], prods[ok], scores[ok], k)
+            for q, p, s in zip(rows.tolist(), self.ids[prods].tolist(), scores.tolist()):
+                out[q].append((p, round(min(s, 1.0), 4)))
+        return out
@@ -0,0 +1,218 @@
+"""
+Persistent email outbox.
+
+Producers (the scheduled tag reports) only insert an `email_outbox` row (a
+report stays a file in EMAIL_ATTACHMENTS_DIR until it is sent); a
+single background worker drains due rows in batches, sends each batch over
+one SMTP connection in a thread (smtplib is blocking) and records the
+outcome. Failures are retried with capped exponential backoff until
+EMAIL_MAX_ATTEMPTS, then marked `failed`.
+
+Rows are claimed with a conditional UPDATE (status + due time), so several
+app workers can drain the same table without sending a message twice; a
+claim is a lease, and rows left in `sending` by a crashed worker become due
+again after EMAIL_SEND_LEASE seconds.
+"""
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import metrics, models
+from ..config import settings
+from ..db import SessionLocal
+from . import emailer
+
+log = logging.getLogger(__name__)
+
+_task: asyncio.Task | None = None
+_wakeup: asyncio.Event | None = None
+_running = False
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _backoff(attempts: int) -> float:
+    # equal jitter on a capped exponential: unlike the scraper client's full jitter,
+    # a failing mail server always gets at least half the delay before the retry
+    cap = min(settings.EMAIL_BACKOFF_MAX, settings.EMAIL_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return random.uniform(cap / 2, cap)
+
+
+async def enqueue(
+    session: AsyncSession,
+    to_email: str,
+    subject: str,
+    body: str,
+    attachment: bytes | None = None,
+    attachment_name: str | None = None,
+    tag_id: int | None = None,
+    attachment_path: str | None = None,
+) -> models.EmailOutbox:
+    """
+    Store a message (commits) and nudge the worker. A file passed as
+    `attachment_path` belongs to the outbox from then on: it is read when the
+    message is sent and deleted once it has been (a failed message keeps it
+    for POST /schedules/outbox/{id}/retry).
+    """
+    msg = models.EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        attachment=attachment,
+        attachment_name=attachment_name,
+        attachment_path=attachment_path,
+        tag_id=tag_id,
+        status="pending",
+        attempts=0,
+        next_attempt_at=_now(),
+    )
+    session.add(msg)
+    await session.commit()
+    wake()
+    return msg
+
+
+async def _claim(session: AsyncSession, limit: int) -> list[models.EmailOutbox]:
+    Outbox = models.EmailOutbox
+    now = _now()
+    due = (Outbox.status.in_(("pending", "sending")), Outbox.next_attempt_at <= now)
+    ids = (
+        await session.execute(
+            select(Outbox.id).where(*due).order_by(Outbox.next_attempt_at, Outbox.id).limit(limit)
+        )
+    ).scalars().all()
+
+    lease_until = now + timedelta(seconds=settings.EMAIL_SEND_LEASE)
+    claimed = []
+    for id_ in ids:
+        # losing this race to another worker just skips the row
+        res = await session.execute(
+            update(Outbox)
+            .where(Outbox.id == id_, *due)
+            .values(status="sending", next_attempt_at=lease_until, attempts=Outbox.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 1:
+            claimed.append(id_)
+    await session.commit()
+    if not claimed:
+        return []
+    res = await session.execute(select(Outbox).where(Outbox.id.in_(claimed)).order_by(Outbox.id))
+    return list(res.scalars().all())
+
+
+async def drain_once(limit: int | None = None) -> dict:
+    """Send one batch of due messages. Returns {"sent", "retry", "failed"}."""
+    counts = {"sent": 0, "retry": 0, "failed": 0}
+    async with SessionLocal() as s:
+        rows = await _claim(s, limit or settings.EMAIL_OUTBOX_BATCH)
+        if not rows:
+            return counts
+        messages = [
+            functools.partial(
+                emailer.build_message,
+                r.to_email, r.subject, r.body, r.attachment, r.attachment_name, r.attachment_path,
+            )
+            for r in rows
+        ]
+        results = await asyncio.to_thread(emailer.send_messages, messages)
+
+        now = _now()
+        sent_files = []
+        for row, err in zip(rows, results):
+            if err is None:
+                row.status, row.sent_at, row.last_error = "sent", now, None
+                row.attachment = None  # delivered; no need to keep the report bytes
+                sent_files.append(row.attachment_path)
+                counts["sent"] += 1
+            elif row.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                row.status, row.last_error = "failed", err
+                counts["failed"] += 1
+            else:
+                row.status, row.last_error = "pending", err
+                row.next_attempt_at = now + timedelta(seconds=_backoff(row.attempts))
+                counts["retry"] += 1
+        await s.commit()
+    for path in sent_files:
+        if path:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+    for outcome, n in counts.items():
+        if n:
+            metrics.email_outbox.inc(n, outcome=outcome)
+    log.info("Outbox: batch done", extra=counts)
+    return counts
+
+
+async def _seconds_to_next_retry() -> float:
+    async with SessionLocal() as s:
+        nxt = (
+            await s.execute(
+                select(func.min(models.EmailOutbox.next_attempt_at)).where(
+                    models.EmailOutbox.status.in_(("pending", "sending"))
+                )
+            )
+        ).scalar_one_or_none()
+    if nxt is None:
+        return settings.EMAIL_OUTBOX_POLL
+    if isinstance(nxt, str):  # SQLite returns the raw text for aggregates
+        nxt = datetime.fromisoformat(nxt)
+    nxt = nxt if nxt.tzinfo else nxt.replace(tzinfo=timezone.utc)
+    return max(0.0, (nxt - _now()).total_seconds())
+
+
+async def _worker() -> None:
+    while _running:
+        _wakeup.clear()
+        try:
+            while True:
+                counts = await drain_once()
+                if not _running or not any(counts.values()):
+                    break
+            timeout = min(settings.EMAIL_OUTBOX_POLL, await _seconds_to_next_retry())
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # keep the worker alive; the rows stay due
+            log.exception("Outbox: drain failed")
+            timeout = settings.EMAIL_OUTBOX_POLL
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def wake() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def start() -> None:
+    global _task, _wakeup, _running
+    if _task is None:
+        _wakeup = asyncio.Event()
+        _running = True
+        _task = asyncio.create_task(_worker())
+        log.info("Outbox: worker started")
+
+
+async def stop(timeout: float = 30) -> None:
+    """Let an in-flight batch finish (up to `timeout`), then stop."""
+    global _task, _running
+    if _task is not None:
+        _running = False
+        wake()
+        try:
+            await asyncio.wait_for(_task, timeout)
+        except asyncio.TimeoutError:  # wait_for cancelled it; claimed rows retry after the lease
+            pass
+        _task = None
+        log.info("Outbox: worker stopped")
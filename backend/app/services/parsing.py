@@ -0,0 +1,58 @@
+"""
+Executor for CPU-bound HTML parsing.
+
+Parsing a page takes milliseconds of pure CPU; done inline it stalls the
+event loop for every other request and scrape. `run()` hands the parse
+function to a pool chosen by SCRAPER_PARSE_POOL:
+
+- "thread"  (default) cheap hand-off; lxml releases the GIL while parsing
+- "process" real parallelism for the pure-Python bs4 parser; the function
+            and its arguments must be picklable (module-level functions)
+- "inline"  no pool (debugging, single-threaded benchmarks)
+
+The pool is created on first use and shut down with the app.
+"""
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from ..config import settings
+
+_executor: Executor | None = None
+_kind: str | None = None
+
+
+def _get_executor() -> Executor | None:
+    global _executor, _kind
+    kind = settings.SCRAPER_PARSE_POOL
+    if _executor is not None and _kind != kind:
+        shutdown()
+    if kind == "inline":
+        return None
+    if _executor is None:
+        workers = max(1, settings.SCRAPER_PARSE_WORKERS)
+        if kind == "process":
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        elif kind == "thread":
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+        else:
+            raise ValueError(f"Unknown SCRAPER_PARSE_POOL: {kind!r}")
+        _kind = kind
+    return _executor
+
+
+async def run(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    executor = _get_executor()
+    if executor is None:
+        return fn(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+def shutdown() -> None:
+    global _executor, _kind
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _kind = None
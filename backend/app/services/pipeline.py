@@ -0,0 +1,79 @@
+"""
+Bounded-concurrency fetch -> batched write pipeline.
+
+N fetch workers pull from a shared source iterator and push results to a
+queue; a single writer (the only coroutine that touches the DB session)
+drains it and calls `flush` once per `batch_size` results. Used by the
+auto-matcher and the price refresh crawler.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterator
+
+log = logging.getLogger(__name__)
+
+
+async def run(
+    source: Iterator[Any],
+    fetch: Callable[[Any], Awaitable[Any]],
+    flush: Callable[[list[tuple[Any, Any]]], Awaitable[None]],
+    concurrency: int,
+    batch_size: int,
+    deadline: float | None = None,
+) -> dict:
+    """
+    Returns {"fetched", "failed", "fetch_s", "flush_s"}. `fetch` exceptions are
+    logged and counted, never passed to `flush`. Once `deadline`
+    (time.monotonic()) has passed workers stop taking new work, leaving the
+    rest of `source` untouched.
+    """
+    stats = {"fetched": 0, "failed": 0, "fetch_s": 0.0, "flush_s": 0.0}
+    results: asyncio.Queue = asyncio.Queue(maxsize=batch_size * 2)
+
+    async def worker() -> None:
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                key = next(source)
+            except StopIteration:
+                return
+            t = time.perf_counter()
+            try:
+                res = await fetch(key)
+            except Exception as e:  # one bad page must not abort the run
+                log.warning("Pipeline: fetch failed", extra={"key": repr(key), "error": repr(e)})
+                stats["failed"] += 1
+                continue
+            finally:
+                stats["fetch_s"] += time.perf_counter() - t
+            stats["fetched"] += 1
+            await results.put((key, res))
+
+    async def writer() -> None:
+        batch: list[tuple[Any, Any]] = []
+        while True:
+            entry = await results.get()
+            if entry is not None:
+                batch.append(entry)
+            if batch and (entry is None or len(batch) >= batch_size):
+                t = time.perf_counter()
+                await flush(batch)
+                stats["flush_s"] += time.perf_counter() - t
+                batch = []
+            if entry is None:
+                return
+
+    writer_task = asyncio.create_task(writer())
+    workers = asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    try:
+        # a failing writer would leave the workers blocked on a full queue
+        await asyncio.wait({workers, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+        if writer_task.done():
+            writer_task.result()
+        await workers
+        await results.put(None)
+        await writer_task
+    finally:
+        workers.cancel()
+        writer_task.cancel()
+    return stats
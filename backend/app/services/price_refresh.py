@@ -0,0 +1,151 @@
+"""
+Incremental price refresh for approved matches.
+
+Re-fetches the stored `CompetitorProduct.url` pages, stalest first (priority
+queue on the last `checked_at`), with bounded concurrency and an optional time
+budget so a nightly run always finishes inside its window. Whatever did not
+fit is reported as `deferred` and is first in line next time.
+
+Only changed prices add a `competitor_prices` row; unchanged ones get a single
+set-based `checked_at` bump per batch (crud.record_prices).
+
+`refresh_all` runs every registered competitor at once, one session each;
+each site stays within its own scraper budget (services/scrapers.py).
+"""
+import asyncio
+import heapq
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models, queries
+from ..config import settings
+from ..db import SessionLocal
+from . import pipeline, scrapers
+
+
+def _ts(dt: datetime | None) -> float:
+    if dt is None:
+        return float("-inf")  # never priced: most stale
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+async def refresh_prices(
+    session: AsyncSession,
+    competitor: models.Competitor,
+    concurrency: int | None = None,
+    batch_size: int | None = None,
+    min_age_s: float | None = None,
+    time_budget_s: float | None = None,
+) -> dict:
+    competitor_id = competitor.id
+    scraper = scrapers.require(competitor.code)
+    concurrency = max(1, concurrency or settings.PRICE_REFRESH_CONCURRENCY)
+    batch_size = min(max(1, batch_size or settings.MATCH_BATCH_SIZE), 1000)
+    min_age_s = settings.PRICE_REFRESH_MIN_AGE if min_age_s is None else min_age_s
+    time_budget_s = settings.PRICE_REFRESH_TIME_BUDGET if time_budget_s is None else time_budget_s
+    started = time.perf_counter()
+
+    # ---- load: products behind approved matches + when they were last checked
+    price = models.CompetitorPrice
+    rows = (
+        await session.execute(
+            select(models.CompetitorProduct.id, models.CompetitorProduct.url, price.checked_at)
+            .outerjoin(price, price.id == queries.latest_price_id(models.CompetitorProduct.id))
+            .where(
+                models.CompetitorProduct.competitor_id == competitor_id,
+                models.CompetitorProduct.id.in_(
+                    select(models.Match.competitor_product_id).where(
+                        models.Match.approved.is_(True)
+                    )
+                ),
+            )
+        )
+    ).all()
+
+    stats = {
+        "products": len(rows),
+        "pages": 0,
+        "changed": 0,
+        "unchanged": 0,
+        "unparsed": 0,
+        "skipped_fresh": 0,
+        "skipped_no_url": 0,
+    }
+    fresh_after = time.time() - min_age_s
+    queue: list[tuple[float, int, str]] = []
+    for cp_id, url, checked_at in rows:
+        if not url:
+            stats["skipped_no_url"] += 1
+        elif _ts(checked_at) > fresh_after:
+            stats["skipped_fresh"] += 1
+        else:
+            queue.append((_ts(checked_at), cp_id, url))
+    heapq.heapify(queue)
+    load_s = time.perf_counter() - started
+
+    def stalest_first():
+        while queue:
+            yield heapq.heappop(queue)
+
+    async def fetch(entry: tuple[float, int, str]):
+        return await scraper.fetch_product(entry[2])
+
+    async def flush(batch: list) -> None:
+        stats["pages"] += len(batch)
+        prices = {
+            cp_id: res["price"]
+            for (_, cp_id, _), res in batch
+            if res and res.get("price") is not None
+        }
+        stats["unparsed"] += len(batch) - len(prices)
+        counts = await crud.record_prices(session, prices)
+        await session.commit()
+        stats["changed"] += counts["changed"]
+        stats["unchanged"] += counts["unchanged"]
+
+    deadline = time.monotonic() + time_budget_s if time_budget_s else None
+    run = await pipeline.run(stalest_first(), fetch, flush, concurrency, batch_size, deadline)
+
+    elapsed = time.perf_counter() - started
+    return {
+        **stats,
+        "failed": run["failed"],
+        "deferred": len(queue),  # out of time budget; stalest-first next run
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_s": round((stats["pages"] + run["failed"]) / elapsed, 2) if elapsed > 0 else None,
+        "timings": {
+            "load_s": round(load_s, 3),
+            "fetch_s": round(run["fetch_s"], 3),
+            "db_s": round(run["flush_s"], 3),
+        },
+    }
+
+
+async def refresh_all(**kwargs) -> dict:
+    """
+    Refresh every competitor that has a registered scraper, concurrently.
+    Returns {code: report}; a failing competitor reports {"error": ...}
+    without stopping the others.
+    """
+    async with SessionLocal() as s:
+        comps = (
+            await s.execute(
+                select(models.Competitor).where(
+                    models.Competitor.code.in_([sc.code for sc in scrapers.all_scrapers()])
+                )
+            )
+        ).scalars().all()
+
+    async def one(comp: models.Competitor) -> dict:
+        async with SessionLocal() as s:  # AsyncSession is not safe to share across tasks
+            return await refresh_prices(s, comp, **kwargs)
+
+    results = await asyncio.gather(*(one(c) for c in comps), return_exceptions=True)
+    return {
+        c.code: ({"error": repr(r)} if isinstance(r, Exception) else r)
+        for c, r in zip(comps, results)
+    }
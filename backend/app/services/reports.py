@@ -0,0 +1,57 @@
+"""
+Tag comparison reports (scheduled emails).
+
+The whole report is one pivot SELECT (queries.pivot_select: every item of the
+tag, one column group per competitor) streamed from a server-side cursor
+straight into a write-only XLSX writer, so neither the query nor the workbook
+is held in memory. Rows are fetched on the event loop and handed to the
+writer one batch at a time in a worker thread: openpyxl's serialisation is
+plain CPU work and would otherwise stall every request in flight.
+"""
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models, queries
+from .excel import ComparisonXlsxWriter
+
+STREAM_BATCH = 1000
+
+
+def _flat(row: dict, competitors) -> dict:
+    out = {"our_sku": row["our_sku"], "our_name": row["our_name"], "our_price": row["our_price"]}
+    for i, c in enumerate(competitors):
+        out[f"{c.code}_price"] = row[f"c{i}_price"]
+        out[f"{c.code}_diff"] = row[f"c{i}_diff"]
+        out[f"{c.code}_diff_pct"] = row[f"c{i}_diff_pct"]
+        out[f"{c.code}_url"] = row[f"c{i}_url"]
+    out["best_price"] = row["best_price"]
+    return out
+
+
+def _append_batch(writer: ComparisonXlsxWriter, batch, competitors) -> None:
+    for row in batch:
+        writer.append(_flat(row, competitors))
+
+
+async def write_tag_report(
+    session: AsyncSession,
+    tag_id: int,
+    competitors: list[models.Competitor],
+    out_path: str,
+) -> int:
+    """Write the tag's comparison to `out_path`; returns the number of rows."""
+    writer = ComparisonXlsxWriter(out_path)
+    items = (
+        select(models.Item.id, models.Item.sku)
+        .where(*queries.item_filters(tag_id=tag_id))
+        .subquery("tag_items")
+    )
+    stmt = queries.pivot_select(competitors, items, matched_only=False).order_by(models.Item.sku)
+    result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH))
+    async for batch in result.mappings().partitions(STREAM_BATCH):
+        await asyncio.to_thread(_append_batch, writer, batch, competitors)
+    # zipping the sheet is the only sizeable CPU step: keep it off the loop
+    await asyncio.to_thread(writer.close)
+    return writer.rows
@@ -0,0 +1,92 @@
+"""
+Versioned response cache for the read-heavy views (/compare, /match/view).
+
+Entries are keyed by endpoint + parameters and tagged with the DB-wide data
+version (crud.bump_data_version, bumped by every item/match/price write) and
+a time bucket of RESPONSE_CACHE_TTL seconds, since rows carry a price age.
+The strong ETag is derived from the same triple, so an unchanged reload
+(`If-None-Match`) costs one version lookup and returns 304 without running
+the query or serialising anything.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .. import crud
+from ..config import settings
+
+# key -> (etag, body)
+_entries: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+_stats = {"hits": 0, "not_modified": 0, "misses": 0}
+
+
+def _etag(key: str, version: int) -> str:
+    bucket = int(time.time() // settings.RESPONSE_CACHE_TTL) if settings.RESPONSE_CACHE_TTL > 0 else 0
+    digest = hashlib.sha256(f"{key}|{version}|{bucket}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _client_has(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # no "*": it would answer 304 before build() has found the competitor/code,
+    # i.e. for resources that do not exist; only a tag we issued counts
+    tags = {t.strip() for t in header.split(",")}
+    return etag in tags
+
+
+def request_key(request: Request) -> str:
+    """Path + sorted query string (parameter order must not split entries)."""
+    params = sorted(request.query_params.multi_items())
+    return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in params)
+
+
+async def cached_json(
+    request: Request,
+    session: AsyncSession,
+    build: Callable[[], Awaitable[Any]],
+    key: str | None = None,
+) -> Response:
+    key = key or request_key(request)
+    version = await crud.get_data_version(session)
+    etag = _etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _client_has(request, etag):
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    entry = _entries.get(key)
+    if entry is not None and entry[0] == etag:
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        body = entry[1]
+    else:
+        _stats["misses"] += 1
+        body = json.dumps(
+            jsonable_encoder(await build()), ensure_ascii=False, separators=(",", ":")
+        ).encode()
+        _entries[key] = (etag, body)
+        _entries.move_to_end(key)
+        while len(_entries) > settings.RESPONSE_CACHE_SIZE:
+            _entries.popitem(last=False)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def clear() -> None:
+    _entries.clear()
+
+
+def stats() -> dict:
+    out = dict(_stats, size=len(_entries))
+    total = out["hits"] + out["not_modified"] + out["misses"]
+    out["hit_ratio"] = round((total - out["misses"]) / total, 3) if total else None
+    return out
@@ -0,0 +1,399 @@
+"""
+Database-backed cron scheduler, safe with several app workers and nodes.
+
+Jobs live in `scheduled_jobs` (models.ScheduledJob): a handler name, JSON
+kwargs, a crontab string and the next fire time. Every worker runs the same
+poll loop. A due job is claimed with a conditional UPDATE that moves
+`next_run_at` to the following fire time and takes a lease, so exactly one
+worker wins each fire time however many are up. The winner renews the lease
+while the handler runs; if it dies, another worker takes the run over once
+the lease has expired. A run whose lease cannot be renewed, or has been
+taken over, is cancelled before that can happen, so it never runs twice.
+
+A job that is still running when its next fire time comes is not started a
+second time: that run waits and is coalesced, like APScheduler's
+max_instances=1 / coalesce=True. A run later than SCHEDULER_MISFIRE_GRACE
+(every worker was down) is skipped.
+
+Jobs are added, changed and removed one at a time (put_job / remove_job) in
+the caller's transaction, e.g. by the /schedules endpoints. The table is the
+only state, so every worker picks a change up on its next poll; `wake()`
+makes the local one look immediately.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import settings
+from ..db import SessionLocal
+
+log = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+EMAIL_HANDLER = "email_report"
+
+_handlers: dict[str, Callable[..., Awaitable[None]]] = {}
+_runs: set[asyncio.Task] = set()
+_task: asyncio.Task | None = None
+_wakeup: asyncio.Event | None = None
+_running = False
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _utc(dt: datetime | str) -> datetime:
+    if isinstance(dt, str):  # SQLite returns the raw text for aggregates
+        dt = datetime.fromisoformat(dt)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def next_fire(cron: str, after: datetime) -> datetime:
+    """First fire time of `cron` at or after `after`, in UTC; ValueError for a bad crontab."""
+    nxt = CronTrigger.from_crontab(cron).get_next_fire_time(None, after)
+    if nxt is None:
+        raise ValueError(f"Cron '{cron}' never fires")
+    return nxt.astimezone(timezone.utc)
+
+
+def register(name: str, fn: Callable[..., Awaitable[None]]) -> None:
+    """Make `fn` runnable as the handler `name` (job kwargs are passed through)."""
+    _handlers[name] = fn
+
+
+def email_job_id(schedule_id: int) -> str:
+    return f"email_schedule_{schedule_id}"
+
+
+# ---------- job store ----------
+
+async def put_job(
+    session: AsyncSession,
+    job_id: str,
+    handler: str,
+    cron: str,
+    kwargs: dict | None = None,
+    email_schedule_id: int | None = None,
+) -> models.ScheduledJob:
+    """
+    Add or change one job; does not commit. The next fire time is only
+    recomputed when the cron changes, so re-putting a job does not shift it.
+    Raises ValueError for an invalid crontab.
+    """
+    nxt = next_fire(cron, _now())
+    job = await session.get(models.ScheduledJob, job_id)
+    if job is None:
+        job = models.ScheduledJob(id=job_id, next_run_at=nxt)
+        session.add(job)
+    elif job.cron != cron:
+        job.next_run_at = nxt
+    job.handler = handler
+    job.cron = cron
+    job.kwargs = json.dumps(kwargs or {}, sort_keys=True)
+    job.email_schedule_id = email_schedule_id
+    await session.flush()
+    return job
+
+
+async def put_email_job(session: AsyncSession, schedule: models.EmailSchedule) -> models.ScheduledJob:
+    return await put_job(
+        session,
+        email_job_id(schedule.id),
+        EMAIL_HANDLER,
+        schedule.cron,
+        {"tag_id": schedule.tag_id},
+        email_schedule_id=schedule.id,
+    )
+
+
+async def remove_job(session: AsyncSession, job_id: str) -> bool:
+    """Remove one job (a run in progress finishes); does not commit."""
+    res = await session.execute(
+        delete(models.ScheduledJob).where(models.ScheduledJob.id == job_id)
+    )
+    return res.rowcount > 0
+
+
+async def sync(static_jobs: dict[str, str]) -> None:
+    """
+    Startup: store the settings-driven jobs ({handler: cron}, job id = handler
+    name; an empty cron removes the job) and one job per active email
+    schedule, and drop the jobs of schedules that are inactive or gone. Every
+    worker runs this; losing an insert race to another one retries.
+    """
+    J = models.ScheduledJob
+    for attempt in range(3):
+        async with SessionLocal() as s:
+            try:
+                for handler, cron in static_jobs.items():
+                    if cron:
+                        await put_job(s, handler, handler, cron)
+                    else:
+                        await remove_job(s, handler)
+                for sch in (await s.execute(select(models.EmailSchedule))).scalars().all():
+                    if sch.active:
+                        await put_email_job(s, sch)
+                    else:
+                        await remove_job(s, email_job_id(sch.id))
+                # ON DELETE CASCADE covers this where foreign keys are enforced
+                await s.execute(
+                    delete(J).where(
+                        J.email_schedule_id.is_not(None),
+                        J.email_schedule_id.not_in(select(models.EmailSchedule.id)),
+                    )
+                )
+                await s.commit()
+                jobs = (await s.execute(select(func.count()).select_from(J))).scalar_one()
+                log.info("Scheduler: jobs loaded", extra={"jobs": jobs})
+                return
+            except IntegrityError:
+                await s.rollback()
+                if attempt == 2:
+                    raise
+
+
+async def list_jobs(session: AsyncSession) -> list[dict]:
+    res = await session.execute(select(models.ScheduledJob).order_by(models.ScheduledJob.id))
+    return [
+        {
+            "id": j.id,
+            "handler": j.handler,
+            "kwargs": json.loads(j.kwargs or "{}"),
+            "cron": j.cron,
+            "next_run_at": j.next_run_at,
+            "running_on": j.locked_by,
+            "last_run_at": j.last_run_at,
+            "last_outcome": j.last_outcome,
+            "last_error": j.last_error,
+        }
+        for j in res.scalars().all()
+    ]
+
+
+# ---------- worker ----------
+
+async def _claim(session: AsyncSession, job: models.ScheduledJob, now: datetime) -> str | None:
+    """
+    Try to take this job's due run. Returns the claim's lock token, or None when
+    another worker got it first (or it misfired).
+    """
+    J = models.ScheduledJob
+    lease_until = now + timedelta(seconds=settings.SCHEDULER_LEASE)
+    # per claim, not per worker: a stalled run in this process that loses its lease
+    # to a takeover here must not keep renewing (or release) the new one
+    token = uuid.uuid4().hex
+    if job.lease_until is not None:
+        # the worker running it stopped renewing the lease: take the run over
+        res = await session.execute(
+            update(J)
+            .where(J.id == job.id, J.lease_until == job.lease_until)
+            .values(lease_until=lease_until, locked_by=WORKER_ID, lock_token=token)
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 1:
+            log.warning(
+                "Scheduler: taking over an abandoned run",
+                extra={"job": job.id, "previous_worker": job.locked_by},
+            )
+        return token if res.rowcount == 1 else None
+
+    due_at = _utc(job.next_run_at)
+    following = next_fire(job.cron, max(now, due_at + timedelta(seconds=1)))
+    misfired = (now - due_at).total_seconds() > settings.SCHEDULER_MISFIRE_GRACE
+    values = (
+        {"next_run_at": following, "last_outcome": "misfired"}
+        if misfired
+        else {
+            "next_run_at": following, "lease_until": lease_until, "locked_by": WORKER_ID,
+            "lock_token": token, "last_run_at": now,
+        }
+    )
+    # compare-and-set on the fire time: one worker moves it, the others match no row
+    res = await session.execute(
+        update(J)
+        .where(J.id == job.id, J.next_run_at == job.next_run_at, J.lease_until.is_(None))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount == 1 and misfired:
+        log.warning("Scheduler: run skipped (misfired)", extra={"job": job.id, "due_at": due_at.isoformat()})
+        return None
+    return token if res.rowcount == 1 else None
+
+
+# the lease lasts three beats: after two missed ones a run stops before it can expire
+_MAX_MISSED_BEATS = 2
+
+
+async def _renew(job_id: str, token: str) -> bool:
+    """Extend this run's lease; False when it no longer holds it."""
+    J = models.ScheduledJob
+    async with SessionLocal() as s:
+        res = await s.execute(
+            update(J)
+            .where(J.id == job_id, J.lock_token == token)
+            .values(lease_until=_now() + timedelta(seconds=settings.SCHEDULER_LEASE))
+            .execution_options(synchronize_session=False)
+        )
+        await s.commit()
+    return res.rowcount == 1
+
+
+async def _heartbeat(job_id: str, token: str) -> str:
+    """Renew the lease while the job runs; returns (why) once the run must stop."""
+    beat = settings.SCHEDULER_LEASE / 3
+    missed = 0
+    while True:
+        await asyncio.sleep(beat)
+        try:
+            held = await asyncio.wait_for(_renew(job_id, token), beat)
+        except Exception:
+            missed += 1
+            log.exception("Scheduler: lease renewal failed", extra={"job": job_id, "missed": missed})
+            if missed >= _MAX_MISSED_BEATS:
+                return "lease could not be renewed"
+            continue
+        missed = 0
+        if not held:
+            log.error("Scheduler: lease lost", extra={"job": job_id})
+            return "lease lost"
+
+
+async def _run(job_id: str, token: str, handler: str, kwargs: dict) -> None:
+    outcome, error = "ok", None
+    work = beat = None
+    try:
+        fn = _handlers.get(handler)
+        if fn is None:
+            raise LookupError(f"No scheduler handler '{handler}'")
+        work = asyncio.ensure_future(fn(**kwargs))
+        beat = asyncio.create_task(_heartbeat(job_id, token))
+        await asyncio.wait({work, beat}, return_when=asyncio.FIRST_COMPLETED)
+        if not work.done():
+            # without a lease another worker would start the same run: stop this one
+            work.cancel()
+            await asyncio.wait({work})
+            raise RuntimeError(f"Run stopped: {beat.result()}")
+        work.result()
+    except Exception as e:  # recorded on the job; the schedule keeps going
+        outcome, error = "error", repr(e)
+        log.exception("Scheduler: job failed", extra={"job": job_id})
+    finally:
+        # on cancellation (shutdown) the lease is left to expire: another worker re-runs it
+        for task in (work, beat):
+            if task is not None:
+                task.cancel()
+    async with SessionLocal() as s:
+        await s.execute(
+            update(models.ScheduledJob)
+            .where(models.ScheduledJob.id == job_id, models.ScheduledJob.lock_token == token)
+            .values(lease_until=None, locked_by=None, lock_token=None, last_outcome=outcome, last_error=error)
+        )
+        await s.commit()
+    wake()  # its next fire time may have passed while it ran
+
+
+async def run_due() -> list[str]:
+    """Claim and start (as tasks) the jobs due now that this worker wins. Returns their ids."""
+    J = models.ScheduledJob
+    now = _now()
+    started = []
+    async with SessionLocal() as s:
+        due = (
+            await s.execute(
+                select(J).where(
+                    or_(and_(J.lease_until.is_(None), J.next_run_at <= now), J.lease_until < now)
+                )
+            )
+        ).scalars().all()
+        claimed = []
+        for j in due:
+            token = await _claim(s, j, now)
+            if token is not None:
+                claimed.append((j.id, token, j.handler, json.loads(j.kwargs or "{}")))
+        await s.commit()
+    for job_id, token, handler, kwargs in claimed:
+        task = asyncio.create_task(_run(job_id, token, handler, kwargs))
+        _runs.add(task)
+        task.add_done_callback(_runs.discard)
+        started.append(job_id)
+    return started
+
+
+async def _seconds_to_next() -> float:
+    J = models.ScheduledJob
+    async with SessionLocal() as s:
+        nxt, lease = (
+            await s.execute(
+                select(
+                    func.min(case((J.lease_until.is_(None), J.next_run_at))),
+                    func.min(J.lease_until),
+                )
+            )
+        ).one()
+    times = [_utc(t) for t in (nxt, lease) if t is not None]
+    if not times:
+        return settings.SCHEDULER_POLL
+    # cron is minute-grained; the floor keeps a stuck row from spinning the loop
+    return min(settings.SCHEDULER_POLL, max(1.0, (min(times) - _now()).total_seconds()))
+
+
+async def _worker() -> None:
+    while _running:
+        _wakeup.clear()
+        try:
+            await run_due()
+            timeout = await _seconds_to_next()
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # keep polling; due rows stay due
+            log.exception("Scheduler: poll failed")
+            timeout = settings.SCHEDULER_POLL
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def wake() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def start() -> None:
+    global _task, _wakeup, _running
+    if _task is None:
+        _wakeup = asyncio.Event()
+        _running = True
+        _task = asyncio.create_task(_worker())
+        log.info("Scheduler: started", extra={"worker": WORKER_ID})
+
+
+async def stop(timeout: float = 30) -> None:
+    """Stop polling, give running jobs `timeout` to finish, cancel the rest."""
+    global _task, _running
+    if _task is None:
+        return
+    _running = False
+    wake()
+    with contextlib.suppress(asyncio.TimeoutError, asyncio.CancelledError):
+        await asyncio.wait_for(_task, timeout)
+    _task = None
+    if _runs:
+        _, pending = await asyncio.wait(set(_runs), timeout=timeout)
+        for task in pending:
+            task.cancel()
+    log.info("Scheduler: stopped")
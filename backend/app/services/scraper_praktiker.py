@@ -1,15 +1,25 @@
 """
-Minimal scraper for praktiker.bg search + product card parsing.
+Minimal scraper for praktiker.bg search + product card parsing, and the
+category listing pages walked by the catalogue crawl (services/catalogue.py).
 
 IMPORTANT: Always check robots.txt and the site's Terms of Service.
 Add rate limiting and proper headers for production use.
 """
-import httpx
 from bs4 import BeautifulSoup
 from typing import Optional
+from urllib.parse import urljoin
+
+from ..config import settings
+from . import http_client, parsing
+
+try:  # fast path; the bs4 parser below is the reference implementation
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover
+    lxml_html = None
 
 BASE = "https://praktiker.bg"
 SEARCH = BASE + "/bg/search?query={query}"
+CATALOGUE = BASE + "/bg/"  # category navigation: where the catalogue crawl starts
 
 HEADERS = {
     "User-Agent": "PriceCompareBot/1.0 (+contact@example.com)"
@@ -17,10 +27,7 @@ HEADERS = {
 
 
 async def _fetch(url: str) -> str:
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(url, headers=HEADERS)
-        r.raise_for_status()
-        return r.text
+    return await http_client.fetch_text(url, headers=HEADERS)
 
 
 async def search_by_barcode(barcode: str) -> Optional[dict]:
@@ -29,6 +36,100 @@ async def search_by_barcode(barcode: str) -> Optional[dict]:
     Returns dict with keys: sku, name, url, barcode, price (if parseable).
     """
     html = await _fetch(SEARCH.format(query=barcode))
+    # parsing is CPU-bound: run it in the parse pool, not on the event loop
+    return await parsing.run(parse_search, html, barcode)
+
+
+async def fetch_product(url: str) -> Optional[dict]:
+    """
+    Parse a product page (used by the price refresh crawler).
+    Returns dict with keys: sku, name, url, barcode, price — or None if the
+    page does not look like a product page.
+    """
+    html = await _fetch(url)
+    return await parsing.run(parse_product, html, url)
+
+
+async def list_categories() -> list[str]:
+    """Category listing URLs from the site navigation (catalogue crawl)."""
+    html = await _fetch(CATALOGUE)
+    return await parsing.run(parse_categories, html, CATALOGUE)
+
+
+async def fetch_listing(url: str) -> tuple[list[dict], Optional[str]]:
+    """
+    One page of a category listing (catalogue crawl). Returns the product
+    cards as dicts with keys: sku, name, url, barcode (None when the card does
+    not carry one), price — and the next page's URL, None on the last page.
+    """
+    html = await _fetch(url)
+    return await parsing.run(parse_listing, html, url)
+
+
+# ---------- Parsers (pure functions; picklable for the process pool) ----------
+
+def _abs(url: Optional[str]) -> Optional[str]:
+    if url and url.startswith("/"):
+        return BASE + url
+    return url
+
+
+def _use_lxml(parser: Optional[str]) -> bool:
+    return (parser or settings.SCRAPER_PARSER) == "lxml" and lxml_html is not None
+
+
+def parse_search(html: str, barcode: str, parser: Optional[str] = None) -> Optional[dict]:
+    if _use_lxml(parser):
+        return parse_search_lxml(html, barcode)
+    return parse_search_bs4(html, barcode)
+
+
+def parse_product(html: str, url: str, parser: Optional[str] = None) -> Optional[dict]:
+    if _use_lxml(parser):
+        return parse_product_lxml(html, url)
+    return parse_product_bs4(html, url)
+
+
+def parse_categories(html: str, url: str, parser: Optional[str] = None) -> list[str]:
+    if _use_lxml(parser):
+        return parse_categories_lxml(html, url)
+    return parse_categories_bs4(html, url)
+
+
+def parse_listing(
+    html: str, url: str, parser: Optional[str] = None
+) -> tuple[list[dict], Optional[str]]:
+    if _use_lxml(parser):
+        return parse_listing_lxml(html, url)
+    return parse_listing_bs4(html, url)
+
+
+def _listing_sku(sku: Optional[str], url: Optional[str]) -> Optional[str]:
+    # cards without a product code fall back to the last URL segment (unique per product)
+    if sku:
+        return sku
+    if url:
+        return url.rstrip("/").rsplit("/", 1)[-1].split("?", 1)[0][:64] or None
+    return None
+
+
+def _card_barcode(card, inner, text) -> Optional[str]:
+    # bs4 tags and lxml elements both have .get(attribute)
+    own = card.get("data-ean") or card.get("data-gtin")
+    if own or inner is None:
+        return own or None
+    return (inner.get("data-ean") or inner.get("data-gtin") or inner.get("content") or text(inner)) or None
+
+
+def _unique(urls) -> list[str]:
+    seen: dict[str, None] = {}
+    for u in urls:
+        if u:
+            seen.setdefault(u.split("#", 1)[0], None)
+    return list(seen)
+
+
+def parse_search_bs4(html: str, barcode: str) -> Optional[dict]:
     soup = BeautifulSoup(html, "html.parser")
 
     # These selectors are guesses; adjust to real DOM.
@@ -36,25 +137,239 @@ async def search_by_barcode(barcode: str) -> Optional[dict]:
     if not card:
         return None
 
-    name_el = card.select_one(".title a, .product-title a, a")
-    url = name_el.get("href") if name_el else None
-    if url and url.startswith("/"):
-        url = BASE + url
+    # in priority order (a selector list would pick the image link first)
+    name_el = (
+        card.select_one(".title a") or card.select_one(".product-title a") or card.select_one("a")
+    )
+    url = _abs(name_el.get("href") if name_el else None)
 
     sku_el = card.select_one("[data-sku], .sku, .product-code")
     sku = (sku_el.get_text(strip=True) if sku_el else None) or barcode
 
     price_el = card.select_one(".price, .product-price__current")
-    price_txt = price_el.get_text(strip=True).replace(",", ".") if price_el else None
-    price = None
-    if price_txt:
-        # Keep only digits and dot
-        num = "".join(ch for ch in price_txt if ch.isdigit() or ch == ".")
-        try:
-            price = float(num) if num else None
-        except Exception:
-            price = None
+    price = _parse_price(price_el.get_text(strip=True) if price_el else None)
 
     name = name_el.get_text(strip=True) if name_el else ""
 
     return {"sku": sku, "name": name, "url": url, "barcode": barcode, "price": price}
+
+
+def parse_product_bs4(html: str, url: str) -> Optional[dict]:
+    soup = BeautifulSoup(html, "html.parser")
+
+    # These selectors are guesses; adjust to real DOM.
+    price_el = soup.select_one("[itemprop=price], .product-price__current, .price")
+    if not price_el:
+        return None
+    price = _parse_price(price_el.get("content") or price_el.get_text(strip=True))
+
+    name_el = soup.select_one("h1, .product-title")
+    sku_el = soup.select_one("[itemprop=sku], [data-sku], .sku, .product-code")
+    barcode_el = soup.select_one("[itemprop=gtin13], [itemprop=gtin], .barcode, .ean")
+
+    return {
+        "sku": sku_el.get_text(strip=True) if sku_el else None,
+        "name": name_el.get_text(strip=True) if name_el else "",
+        "url": url,
+        "barcode": (barcode_el.get("content") or barcode_el.get_text(strip=True)) if barcode_el else None,
+        "price": price,
+    }
+
+
+# Listing pages: every card, unlike search (first card only). Nested card
+# markup (".product" inside ".product-card") is reported once, by URL.
+
+def parse_categories_bs4(html: str, url: str) -> list[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    # These selectors are guesses; adjust to real DOM.
+    return _unique(urljoin(url, a.get("href") or "") for a in soup.select("a[href*='/c/']"))
+
+
+def parse_listing_bs4(html: str, url: str) -> tuple[list[dict], Optional[str]]:
+    soup = BeautifulSoup(html, "html.parser")
+
+    # These selectors are guesses; adjust to real DOM.
+    products: dict[str, dict] = {}
+    for card in soup.select(".product-card, .product, .catalog__product"):
+        name_el = (
+            card.select_one(".title a") or card.select_one(".product-title a") or card.select_one("a")
+        )
+        href = name_el.get("href") if name_el else None
+        if not href:
+            continue
+        product_url = urljoin(url, href)
+        if product_url in products:
+            continue
+
+        sku_el = card.select_one("[data-sku], .sku, .product-code")
+        barcode_el = card.select_one("[data-ean], [data-gtin], [itemprop=gtin13], [itemprop=gtin]")
+        barcode = _card_barcode(card, barcode_el, lambda el: el.get_text(strip=True))
+        price_el = card.select_one(".price, .product-price__current")
+
+        products[product_url] = {
+            "sku": _listing_sku(sku_el.get_text(strip=True) if sku_el else None, product_url),
+            "name": name_el.get_text(strip=True),
+            "url": product_url,
+            "barcode": barcode,
+            "price": _parse_price(price_el.get_text(strip=True) if price_el else None),
+        }
+
+    next_el = soup.select_one("a[rel~=next], .pagination__next a, .pagination .next a")
+    next_url = urljoin(url, next_el.get("href")) if next_el and next_el.get("href") else None
+    return list(products.values()), next_url
+
+
+# The lxml parsers run the same selectors as compiled XPath. A selector list
+# ("a, b") matches the first element in document order, like select_one.
+
+def _cls(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+if lxml_html is not None:
+    from lxml import etree
+
+    _X_CARD = etree.XPath(
+        f"(//*[{_cls('product-card')} or {_cls('product')} or {_cls('catalog__product')}])[1]"
+    )
+    _X_CARD_LINKS = [
+        etree.XPath(f"(.//*[{_cls('title')}]//a)[1]"),
+        etree.XPath(f"(.//*[{_cls('product-title')}]//a)[1]"),
+        etree.XPath("(.//a)[1]"),
+    ]
+    _X_CARD_SKU = etree.XPath(f"(.//*[@data-sku or {_cls('sku')} or {_cls('product-code')}])[1]")
+    _X_CARD_PRICE = etree.XPath(f"(.//*[{_cls('price')} or {_cls('product-price__current')}])[1]")
+    _X_PRICE = etree.XPath(
+        f"(//*[@itemprop='price' or {_cls('product-price__current')} or {_cls('price')}])[1]"
+    )
+    _X_NAME = etree.XPath(f"(//*[self::h1 or {_cls('product-title')}])[1]")
+    _X_SKU = etree.XPath(
+        f"(//*[@itemprop='sku' or @data-sku or {_cls('sku')} or {_cls('product-code')}])[1]"
+    )
+    _X_BARCODE = etree.XPath(
+        f"(//*[@itemprop='gtin13' or @itemprop='gtin' or {_cls('barcode')} or {_cls('ean')}])[1]"
+    )
+    _X_CATEGORY_LINKS = etree.XPath("//a[contains(@href, '/c/')]/@href")
+    _X_CARDS = etree.XPath(
+        f"//*[{_cls('product-card')} or {_cls('product')} or {_cls('catalog__product')}]"
+    )
+    _X_CARD_BARCODE = etree.XPath(
+        "(.//*[@data-ean or @data-gtin or @itemprop='gtin13' or @itemprop='gtin'])[1]"
+    )
+    _X_NEXT = etree.XPath(
+        "(//a[contains(concat(' ', normalize-space(@rel), ' '), ' next ')]"
+        f" | //*[{_cls('pagination__next')}]//a"
+        f" | //*[{_cls('pagination')}]//*[{_cls('next')}]//a)[1]"
+    )
+
+
+def _first(xpath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+
+def _root(html: str):
+    try:
+        return lxml_html.fromstring(html)
+    except etree.ParserError:  # empty document
+        return None
+
+
+def _text(el) -> str:
+    # same as bs4 get_text(strip=True): each text node stripped, then joined
+    return "".join(t.strip() for t in el.itertext())
+
+
+def parse_search_lxml(html: str, barcode: str) -> Optional[dict]:
+    root = _root(html)
+    card = _first(_X_CARD, root) if root is not None else None
+    if card is None:
+        return None
+
+    name_el = next(
+        (el for el in (_first(x, card) for x in _X_CARD_LINKS) if el is not None), None
+    )
+    url = _abs(name_el.get("href") if name_el is not None else None)
+
+    sku_el = _first(_X_CARD_SKU, card)
+    sku = (_text(sku_el) if sku_el is not None else None) or barcode
+
+    price_el = _first(_X_CARD_PRICE, card)
+    price = _parse_price(_text(price_el) if price_el is not None else None)
+
+    name = _text(name_el) if name_el is not None else ""
+
+    return {"sku": sku, "name": name, "url": url, "barcode": barcode, "price": price}
+
+
+def parse_product_lxml(html: str, url: str) -> Optional[dict]:
+    root = _root(html)
+    price_el = _first(_X_PRICE, root) if root is not None else None
+    if price_el is None:
+        return None
+    price = _parse_price(price_el.get("content") or _text(price_el))
+
+    name_el = _first(_X_NAME, root)
+    sku_el = _first(_X_SKU, root)
+    barcode_el = _first(_X_BARCODE, root)
+
+    return {
+        "sku": _text(sku_el) if sku_el is not None else None,
+        "name": _text(name_el) if name_el is not None else "",
+        "url": url,
+        "barcode": (barcode_el.get("content") or _text(barcode_el)) if barcode_el is not None else None,
+        "price": price,
+    }
+
+
+def parse_categories_lxml(html: str, url: str) -> list[str]:
+    root = _root(html)
+    if root is None:
+        return []
+    return _unique(urljoin(url, href) for href in _X_CATEGORY_LINKS(root))
+
+
+def parse_listing_lxml(html: str, url: str) -> tuple[list[dict], Optional[str]]:
+    root = _root(html)
+    if root is None:
+        return [], None
+
+    products: dict[str, dict] = {}
+    for card in _X_CARDS(root):
+        name_el = next(
+            (el for el in (_first(x, card) for x in _X_CARD_LINKS) if el is not None), None
+        )
+        href = name_el.get("href") if name_el is not None else None
+        if not href:
+            continue
+        product_url = urljoin(url, href)
+        if product_url in products:
+            continue
+
+        sku_el = _first(_X_CARD_SKU, card)
+        barcode = _card_barcode(card, _first(_X_CARD_BARCODE, card), _text)
+        price_el = _first(_X_CARD_PRICE, card)
+
+        products[product_url] = {
+            "sku": _listing_sku(_text(sku_el) if sku_el is not None else None, product_url),
+            "name": _text(name_el),
+            "url": product_url,
+            "barcode": barcode,
+            "price": _parse_price(_text(price_el) if price_el is not None else None),
+        }
+
+    next_el = _first(_X_NEXT, root)
+    next_url = urljoin(url, next_el.get("href")) if next_el is not None and next_el.get("href") else None
+    return list(products.values()), next_url
+
+
+def _parse_price(price_txt: Optional[str]) -> Optional[float]:
+    if not price_txt:
+        return None
+    # Keep only digits and dot
+    num = "".join(ch for ch in price_txt.replace(",", ".") if ch.isdigit() or ch == ".")
+    num = num.strip(".")  # "лв." leaves a trailing dot
+    try:
+        return float(num) if num else None
+    except Exception:
+        return None
@@ -0,0 +1,110 @@
+"""
+Scraper registry keyed by `Competitor.code`.
+
+Each entry wraps a scraper module (`search_by_barcode`, `fetch_product`)
+behind its own semaphore, so everything that talks to one site (auto-match,
+price refresh, manual links) shares a single concurrency budget however many
+runs overlap, while different competitors proceed independently. The entry
+also owns that competitor's barcode cache.
+
+Adding a competitor = a scraper module with the two coroutines + one
+`register()` call below + its `competitors` row. Modules are registered by
+name and imported on first use, so their parsers (bs4, lxml) stay out of
+the app's startup. A module that also has
+`list_categories` and `fetch_listing` can be crawled as a whole catalogue
+(services/catalogue.py), which lets barcode matching run offline.
+"""
+import asyncio
+import importlib
+from types import ModuleType
+from typing import Optional
+
+from ..config import settings
+from .barcode_cache import BarcodeCache
+
+
+def _overrides() -> dict[str, int]:
+    out = {}
+    for part in settings.SCRAPER_CONCURRENCY_OVERRIDES.split(","):
+        code, _, n = part.partition("=")
+        if code.strip() and n.strip():
+            out[code.strip()] = int(n)
+    return out
+
+
+class Scraper:
+    def __init__(self, code: str, module: ModuleType | str, concurrency: int | None = None):
+        self.code = code
+        self._module = module
+        self.concurrency = max(1, concurrency or _overrides().get(code, settings.SCRAPER_CONCURRENCY))
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._in_flight = 0
+        self._waited = 0
+        self.cache = BarcodeCache(code, self.search_by_barcode)
+
+    async def _call(self, fn, *args):
+        if self._sem.locked():
+            self._waited += 1
+        async with self._sem:
+            self._in_flight += 1
+            try:
+                return await fn(*args)
+            finally:
+                self._in_flight -= 1
+
+    @property
+    def module(self) -> ModuleType:
+        if isinstance(self._module, str):
+            self._module = importlib.import_module(self._module, __package__)
+        return self._module
+
+    # module attributes are looked up per call so they can be swapped (tests, benchmarks)
+    async def search_by_barcode(self, barcode: str) -> Optional[dict]:
+        return await self._call(self.module.search_by_barcode, barcode)
+
+    async def fetch_product(self, url: str) -> Optional[dict]:
+        return await self._call(self.module.fetch_product, url)
+
+    @property
+    def can_crawl(self) -> bool:
+        return hasattr(self.module, "list_categories") and hasattr(self.module, "fetch_listing")
+
+    async def list_categories(self) -> list[str]:
+        return await self._call(self.module.list_categories)
+
+    async def fetch_listing(self, url: str) -> tuple[list[dict], Optional[str]]:
+        return await self._call(self.module.fetch_listing, url)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self._in_flight,
+            "waited": self._waited,
+            "cache": self.cache.stats(),
+        }
+
+
+_registry: dict[str, Scraper] = {}
+
+
+def register(code: str, module: ModuleType | str, concurrency: int | None = None) -> Scraper:
+    _registry[code] = Scraper(code, module, concurrency)
+    return _registry[code]
+
+
+def get(code: str) -> Optional[Scraper]:
+    return _registry.get(code)
+
+
+def require(code: str) -> Scraper:
+    scraper = _registry.get(code)
+    if scraper is None:
+        raise ValueError(f"No scraper registered for competitor '{code}'")
+    return scraper
+
+
+def all_scrapers() -> list[Scraper]:
+    return list(_registry.values())
+
+
+register("praktiker", ".scraper_praktiker")
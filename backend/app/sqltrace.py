@@ -0,0 +1,150 @@
+"""
+Per-scope SQL statement tracking: how many statements an HTTP request or a
+scheduled job ran, how long they took, which ones repeat (N+1) and which
+were slow.
+
+    with sqltrace.track("job:email_report") as q:
+        ...
+    q.count, q.seconds, q.repeated()
+
+Scopes nest (a budget around an ASGI call sees the statements of the request
+inside it) and are carried by a context var, so tasks spawned inside a scope
+(gather, pipelines) are counted too. `instrument()` installs the cursor hooks
+once per engine; `query_budget()` is the assertion helper for benchmarks and
+tests.
+"""
+import contextlib
+import contextvars
+import logging
+import time
+from collections import Counter
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import metrics
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+_scopes: contextvars.ContextVar[tuple["QueryStats", ...]] = contextvars.ContextVar(
+    "sqltrace_scopes", default=()
+)
+
+
+class QueryStats:
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        # statement text (parameters are bound separately) -> executions
+        self.statements: Counter[str] = Counter()
+        self.slow = 0
+
+    def add(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int | None = None) -> list[tuple[str, int]]:
+        """Statements run at least `threshold` times in this scope, most frequent first."""
+        threshold = threshold or settings.SQL_REPEAT_THRESHOLD
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def summary(self, top: int = 5) -> str:
+        lines = [f"{self.count} statements, {self.seconds * 1000:.1f} ms"]
+        for sql, n in self.statements.most_common(top):
+            lines.append(f"  {n:>6} x {_shorten(sql, 200)}")
+        return "\n".join(lines)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _operation(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    op = head[0].lower() if head else ""
+    return op if op in ("select", "insert", "update", "delete", "merge", "with") else "other"
+
+
+@contextlib.contextmanager
+def track(label: str = "", report: bool = True, stats: QueryStats | None = None) -> Iterator[QueryStats]:
+    """
+    Count statements for the duration of the block. With `report`, repeated
+    statements are logged (and counted in /metrics) when the scope closes;
+    `label` may be set on the yielded object until then. Pass `stats` to
+    count into an object the caller already holds.
+    """
+    if stats is None:
+        stats = QueryStats(label)
+    token = _scopes.set(_scopes.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _scopes.reset(token)
+        if report:
+            for sql, n in stats.repeated():
+                metrics.db_repeated_statements.inc(scope=stats.label)
+                log.warning(
+                    "SQL: statement repeated in one scope (possible N+1)",
+                    extra={"scope": stats.label, "executions": n, "statement": _shorten(sql, 500)},
+                )
+
+
+@contextlib.contextmanager
+def query_budget(max_queries: int, label: str = "") -> Iterator[QueryStats]:
+    """
+    Fail (QueryBudgetExceeded) when the block runs more than `max_queries`
+    statements; the message lists the most frequent ones.
+    """
+    with track(label, report=False) as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label or 'block'}: {stats.count} statements > budget {max_queries}\n{stats.summary()}"
+        )
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sqltrace_start = time.perf_counter()
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_sqltrace_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    operation = _operation(statement)
+    metrics.db_queries.observe(elapsed, operation=operation)
+    scopes = _scopes.get()
+    for stats in scopes:
+        stats.add(statement, elapsed)
+    if elapsed * 1000 >= settings.SQL_SLOW_QUERY_MS:
+        metrics.db_slow_queries.inc(operation=operation)
+        for stats in scopes:
+            stats.slow += 1
+        log.warning(
+            "SQL: slow statement",
+            extra={
+                "scope": scopes[-1].label if scopes else None,
+                "duration_ms": round(elapsed * 1000, 1),
+                "statement": _shorten(statement, 2000),
+                "parameters": _shorten(repr(parameters), 1000),
+                "executemany": executemany,
+            },
+        )
+
+
+def instrument(engine: Engine) -> None:
+    """Install the cursor hooks on `engine` (pass AsyncEngine.sync_engine); idempotent."""
+    if not event.contains(engine, "after_cursor_execute", _after):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
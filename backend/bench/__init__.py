@@ -0,0 +1 @@
+# offline benchmarks (SQLite + recorded HTML); see bench/README.md
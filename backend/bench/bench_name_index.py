@@ -0,0 +1,77 @@
+"""
+Name matching: index build and top-k scoring time for synthetic catalogues
+(N items x N competitor products), and how often an item finds its own
+product. No database.
+
+    cd backend && python -m bench.bench_name_index --sizes 10000 100000
+
+Half of the items are a re-spelling of a product (upper case, "2,5 л" ->
+"2,5Л", words in another order), the other half are unrelated names; `recall` is
+the share of the re-spelled items whose best candidate is their product.
+"""
+import argparse
+import random
+import time
+
+from app.config import settings
+from app.services.name_index import NameIndex
+
+NOUNS = (
+    "боя лак грунд винт болт дюбел плочки смесител крушка кабел шланг лепило силикон "
+    "мазилка четка валяк ключ отвертка бормашина трион"
+).split()
+ADJS = (
+    "бяла черна сива латекс акрилна водна мат гланц поцинкован неръждаем пластмасов "
+    "градински кухненски led енергоспестяваща универсален"
+).split()
+SIZES = ["2,5 л", "5 л", "750 мл", "4x40 мм", "6 x 60 мм", "10W E27", "1 кг", "25 кг", "30x60 см", "2 м", "50 бр"]
+
+
+def catalogue(n: int, rnd: random.Random) -> tuple[list[str], list[str], list[bool]]:
+    def words() -> list[str]:
+        return [
+            rnd.choice(NOUNS), rnd.choice(ADJS), rnd.choice(ADJS),
+            f"марка{rnd.randrange(3000)}", f"модел{rnd.randrange(20000)}",
+        ]
+
+    products, items, respelled = [], [], []
+    for _ in range(n):
+        w, size = words(), rnd.choice(SIZES)
+        products.append(" ".join(w + [size]))
+        if rnd.random() < 0.5:
+            rnd.shuffle(w)
+            items.append(" ".join(w + [size.replace(" л", "л").replace(" мм", "мм")]).upper())
+            respelled.append(True)
+        else:
+            items.append(" ".join(words() + [rnd.choice(SIZES)]))
+            respelled.append(False)
+    return items, products, respelled
+
+
+def run(n: int, threshold: float) -> dict:
+    items, products, respelled = catalogue(n, random.Random(n))
+    t = time.perf_counter()
+    index = NameIndex(list(range(n)), products)
+    build_s = time.perf_counter() - t
+    t = time.perf_counter()
+    best = index.top_k(items, k=1, min_score=threshold)
+    score_s = time.perf_counter() - t
+    hits = sum(1 for i, cand in enumerate(best) if respelled[i] and cand and cand[0][0] == i)
+    return {
+        "items": n,
+        "products": n,
+        "threshold": threshold,
+        "build_s": round(build_s, 2),
+        "score_s": round(score_s, 2),
+        "matched": sum(1 for cand in best if cand),
+        "recall": round(hits / max(1, sum(respelled)), 3),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--threshold", type=float, default=settings.FUZZY_MATCH_THRESHOLD)
+    args = ap.parse_args()
+    for n in args.sizes:
+        print(run(n, args.threshold))
@@ -0,0 +1,114 @@
+"""
+HTML parsing: bs4 (html.parser) vs. the lxml fast path on saved fixtures,
+and event-loop stall with parsing inline vs. in the thread / process pool.
+
+    cd backend && python -m bench.bench_parsers --iterations 200 --concurrent 64
+
+Exits non-zero when the two parsers disagree on any fixture.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.services import parsing
+from app.services import scraper_praktiker as sp
+
+FIXTURES = Path(__file__).parent / "fixtures"
+BARCODE = "3838000100000"
+URL = "https://praktiker.bg/bg/p/3838000100000"
+LISTING_URL = "https://praktiker.bg/bg/c/instrumenti/bormashini?page=2"
+
+# fixture -> (parser by name, extra argument)
+CASES = {
+    "praktiker_search.html": ({"bs4": sp.parse_search_bs4, "lxml": sp.parse_search_lxml}, BARCODE),
+    "praktiker_search_empty.html": ({"bs4": sp.parse_search_bs4, "lxml": sp.parse_search_lxml}, BARCODE),
+    "praktiker_product.html": ({"bs4": sp.parse_product_bs4, "lxml": sp.parse_product_lxml}, URL),
+    "praktiker_product_nomicrodata.html": (
+        {"bs4": sp.parse_product_bs4, "lxml": sp.parse_product_lxml}, URL
+    ),
+    "praktiker_home.html": (
+        {"bs4": sp.parse_categories_bs4, "lxml": sp.parse_categories_lxml}, sp.CATALOGUE
+    ),
+    "praktiker_category.html": (
+        {"bs4": sp.parse_listing_bs4, "lxml": sp.parse_listing_lxml}, LISTING_URL
+    ),
+}
+
+
+def check_equal(pages: dict[str, str]) -> bool:
+    ok = True
+    for name, (parsers, arg) in CASES.items():
+        ref = parsers["bs4"](pages[name], arg)
+        fast = parsers["lxml"](pages[name], arg)
+        same = ref == fast
+        ok &= same
+        print({"fixture": name, "same_output": same, "fields": sorted(ref) if isinstance(ref, dict) else None})
+        if not same:
+            print("  bs4: ", ref)
+            print("  lxml:", fast)
+    return ok
+
+
+def time_parsers(pages: dict[str, str], iterations: int) -> None:
+    for name, (parsers, arg) in CASES.items():
+        out = {"fixture": name, "kb": round(len(pages[name].encode()) / 1024, 1)}
+        for label, fn in parsers.items():
+            t = time.perf_counter()
+            for _ in range(iterations):
+                fn(pages[name], arg)
+            out[f"{label}_ms"] = round((time.perf_counter() - t) * 1000 / iterations, 3)
+        out["speedup"] = round(out["bs4_ms"] / out["lxml_ms"], 1)
+        print(out)
+
+
+async def loop_stall(html: str, parser: str, pool: str, concurrent: int) -> dict:
+    """`concurrent` search parses at once while a 1 ms ticker measures loop lag."""
+    settings.SCRAPER_PARSE_POOL = pool
+    await parsing.run(sp.parse_search, html, BARCODE, parser)  # warm the pool
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            t = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - t - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    t = time.perf_counter()
+    await asyncio.gather(
+        *(parsing.run(sp.parse_search, html, BARCODE, parser) for _ in range(concurrent))
+    )
+    wall = time.perf_counter() - t
+    done.set()
+    await tick
+    parsing.shutdown()
+    return {
+        "parser": parser,
+        "pool": pool,
+        "wall_ms": round(wall * 1000, 1),
+        "max_loop_lag_ms": round(max(lags, default=wall) * 1000, 1),
+    }
+
+
+async def main(iterations: int, concurrent: int, workers: int) -> int:
+    pages = {name: (FIXTURES / name).read_text(encoding="utf-8") for name in CASES}
+    ok = check_equal(pages)
+    time_parsers(pages, iterations)
+    settings.SCRAPER_PARSE_WORKERS = workers
+    for parser in ("bs4", "lxml"):
+        for pool in ("inline", "thread", "process"):
+            print(await loop_stall(pages["praktiker_search.html"], parser, pool, concurrent))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--concurrent", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=settings.SCRAPER_PARSE_WORKERS)
+    args = ap.parse_args()
+    sys.exit(asyncio.run(main(args.iterations, args.concurrent, args.workers)))
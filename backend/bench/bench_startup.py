@@ -0,0 +1,113 @@
+"""
+Cold start: a new interpreter importing the app, running its startup
+(schema check, seeding, scheduler) and answering a first request. Every run
+is a fresh process, so nothing is already imported or cached.
+
+    cd backend && python -m bench.bench_startup --runs 5
+
+The first run boots against an empty database (schema created), the others
+against the same database at the current schema version, which is what a
+restarted or newly scaled worker sees. Reported per run: `import_s` (import
+app.main), `startup_s` (lifespan startup), `first_request_s`, `total_s`
+(process start to first response, interpreter included) and the heavy
+optional libraries that ended up imported (ideally none).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "pricecompare_startup_bench.db")
+HEAVY = ("numpy", "pandas", "openpyxl", "bs4", "lxml", "httpx", "pyarrow")
+TARGET_S = 1.0
+
+
+async def _request(app, path: str) -> int:
+    """One GET through the raw ASGI interface (an HTTP client would add its own imports)."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def _child(path: str) -> None:
+    t = time.perf_counter()
+    from app import main
+    import_s = time.perf_counter() - t
+
+    from datetime import datetime, timezone
+    from sqlalchemy import event
+
+    # SQL Server's SYSUTCDATETIME() for the SQLite file (column defaults)
+    @event.listens_for(main.engine.sync_engine, "connect")
+    def _sqlite_functions(dbapi_conn, _record):
+        dbapi_conn.create_function(
+            "sysutcdatetime", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+        )
+
+    async def boot() -> dict:
+        t = time.perf_counter()
+        async with main.lifespan(main.app):
+            startup_s = time.perf_counter() - t
+            t = time.perf_counter()
+            status = await _request(main.app, path)
+            first_request_s = time.perf_counter() - t
+        return {"startup_s": startup_s, "first_request_s": first_request_s, "status": status}
+
+    out = {"import_s": import_s, **asyncio.run(boot())}
+    out["heavy_imports"] = [m for m in HEAVY if m in sys.modules]
+    print(json.dumps(out))
+
+
+def run_once(path: str) -> dict:
+    env = {**os.environ, "MSSQL_DSN": f"sqlite+aiosqlite:///{DB_PATH}", "LOG_LEVEL": "WARNING"}
+    t = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.bench_startup", "--child", "--path", path],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    total_s = time.perf_counter() - t
+    return {**json.loads(proc.stdout.strip().splitlines()[-1]), "total_s": total_s}
+
+
+def _summary(label: str, runs: list[dict]) -> dict:
+    out = {"boot": label, "runs": len(runs)}
+    for key in ("import_s", "startup_s", "first_request_s", "total_s"):
+        out[key] = round(statistics.median(r[key] for r in runs), 3)
+    out["heavy_imports"] = sorted({m for r in runs for m in r["heavy_imports"]})
+    out["target"] = f"{'ok' if out['total_s'] < TARGET_S else 'over'} (< {TARGET_S} s)"
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--path", default="/compare/praktiker", help="first request")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        _child(args.path)
+        sys.exit(0)
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    print(_summary("empty database", [run_once(args.path)]))
+    print(_summary("current schema", [run_once(args.path) for _ in range(args.runs)]))
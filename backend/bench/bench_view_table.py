@@ -0,0 +1,103 @@
+"""
+/match/view latency: legacy implementation (outer join + Python dedupe +
+second full `SELECT id, sku FROM items`) vs. the single window-function query.
+
+    cd backend && python -m bench.bench_view_table --sizes 10000 100000 500000
+"""
+import argparse
+import asyncio
+
+from bench.common import engine, seed, timed
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import models, pagination, queries  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+
+
+async def legacy_view(session, competitor_id: int) -> list[dict]:
+    """The pre-rewrite view_table body, verbatim apart from the session plumbing."""
+    q = await session.execute(
+        select(
+            models.Item.id.label("item_id"),
+            models.Item.sku.label("our_sku"),
+            models.CompetitorProduct.barcode.label("comp_barcode"),
+            models.CompetitorProduct.url.label("comp_url"),
+            func.coalesce(models.Match.approved, False).label("approved"),
+        )
+        .select_from(models.Item)
+        .join(models.Match, models.Match.item_id == models.Item.id, isouter=True)
+        .join(models.CompetitorProduct, models.CompetitorProduct.id == models.Match.competitor_product_id, isouter=True)
+        .where(
+            (models.Match.id.is_(None)) | (models.CompetitorProduct.competitor_id == competitor_id)
+        )
+        .order_by(models.Item.id.asc())
+    )
+    rows_map: dict[int, dict] = {}
+    for item_id, our_sku, comp_barcode, comp_url, approved in q.all():
+        cand = {"item_id": item_id, "our_sku": our_sku, "comp_barcode": comp_barcode,
+                "comp_url": comp_url, "approved": bool(approved)}
+        prev = rows_map.get(item_id)
+        if prev is None or (not prev["approved"] and cand["approved"]):
+            rows_map[item_id] = cand
+    all_items = (await session.execute(select(models.Item.id, models.Item.sku))).all()
+    for item_id, sku in all_items:
+        rows_map.setdefault(item_id, {"item_id": item_id, "our_sku": sku,
+                                      "comp_barcode": None, "comp_url": None, "approved": False})
+    return list(rows_map.values())
+
+
+async def window_full(session, competitor_id: int) -> int:
+    n = 0
+    result = await session.stream(
+        queries.match_view_select(competitor_id)
+        .order_by(models.Item.id)
+        .execution_options(yield_per=1000)
+    )
+    async for batch in result.partitions(1000):
+        n += len(batch)
+    return n
+
+
+async def window_page(session, competitor_id: int, cursor: str | None, limit: int = 200):
+    page = pagination.keyset(
+        select(models.Item.id, models.Item.sku), "id", cursor, limit
+    ).subquery("page")
+    rows = list(
+        (
+            await session.execute(
+                queries.match_view_select(competitor_id, page).order_by(page.c.id)
+            )
+        ).mappings().all()
+    )
+    return rows, pagination.next_cursor(rows, "id", limit, key=lambda r: r["item_id"])
+
+
+async def run(size: int) -> dict:
+    comps = await seed(size)
+    out: dict = {"items": size}
+    async with SessionLocal() as s:
+        with timed(out, "legacy_full_ms"):
+            legacy = await legacy_view(s, comps["praktiker"])
+        with timed(out, "window_full_ms"):
+            n = await window_full(s, comps["praktiker"])
+        with timed(out, "window_first_page_ms"):
+            _, cur = await window_page(s, comps["praktiker"], None)
+        deep = pagination.encode_cursor("id", size - 500)
+        with timed(out, "window_deep_page_ms"):
+            await window_page(s, comps["praktiker"], deep)
+    out["legacy_rows"] = len(legacy)
+    out["window_rows"] = n
+    return out
+
+
+async def main(sizes: list[int]) -> None:
+    for size in sizes:
+        print(await run(size))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    asyncio.run(main(ap.parse_args().sizes))
@@ -0,0 +1,109 @@
+"""
+Shared setup for the offline benchmarks.
+
+Points the app at a throwaway SQLite file (must be imported before any
+`app.*` module), provides SQL Server's SYSUTCDATETIME() to SQLite and
+bulk-seeds synthetic catalogues.
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+DB_PATH = os.environ.get("BENCH_DB", os.path.join(tempfile.gettempdir(), "pricecompare_bench.db"))
+os.environ["MSSQL_DSN"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import crud, models  # noqa: E402
+from app.db import Base, SessionLocal, engine  # noqa: E402
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _sqlite_functions(dbapi_conn, _record):
+    dbapi_conn.create_function(
+        "sysutcdatetime", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+    )
+    dbapi_conn.execute("PRAGMA journal_mode=WAL")
+    dbapi_conn.execute("PRAGMA synchronous=OFF")
+
+
+async def reset_db() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def seed(
+    n_items: int,
+    match_ratio: float = 0.6,
+    approved_ratio: float = 0.5,
+    other_competitor_ratio: float = 0.1,
+    seed_: int = 42,
+    chunk: int = 20000,
+) -> dict:
+    """
+    `n_items` items; `match_ratio` of them matched to "praktiker" (a share of
+    those approved, each with a price snapshot) and some matched only to a
+    second competitor; price_comparisons is rebuilt from them. Returns the
+    competitor ids.
+    """
+    rnd = random.Random(seed_)
+    now = datetime.now(timezone.utc)
+    await reset_db()
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(models.Competitor),
+            [
+                {"id": 1, "code": "praktiker", "name": "Praktiker", "base_url": "https://praktiker.bg"},
+                {"id": 2, "code": "other", "name": "Other", "base_url": "https://example.com"},
+            ],
+        )
+        cp_id = 0
+        for start in range(0, n_items, chunk):
+            ids = range(start + 1, min(n_items, start + chunk) + 1)
+            items, products, matches, prices = [], [], [], []
+            for i in ids:
+                barcode = f"380{i:010d}" if rnd.random() < 0.7 else None
+                items.append(
+                    {"id": i, "sku": f"SKU{i:07d}", "name": f"Item {i}", "barcode": barcode,
+                     "price": round(rnd.uniform(1, 500), 2), "created_at": now}
+                )
+                r = rnd.random()
+                comp = 1 if r < match_ratio else 2 if r < match_ratio + other_competitor_ratio else None
+                if comp:
+                    cp_id += 1
+                    products.append(
+                        {"id": cp_id, "competitor_id": comp, "sku": f"C{cp_id}", "name": f"Product {cp_id}",
+                         "url": f"https://praktiker.bg/p/{cp_id}", "barcode": barcode, "created_at": now}
+                    )
+                    matches.append(
+                        {"item_id": i, "competitor_product_id": cp_id, "approved": rnd.random() < approved_ratio,
+                         "auto_by_barcode": True, "created_at": now}
+                    )
+                    prices.append(
+                        {"competitor_product_id": cp_id, "price": round(rnd.uniform(1, 500), 2),
+                         "fetched_at": now, "checked_at": now}
+                    )
+            await conn.execute(insert(models.Item), items)
+            if products:
+                await conn.execute(insert(models.CompetitorProduct), products)
+                await conn.execute(insert(models.Match), matches)
+                await conn.execute(insert(models.CompetitorPrice), prices)
+    # rows are inserted around the ORM write paths: fill the precomputed comparison
+    async with SessionLocal() as s:
+        await crud.rebuild_comparisons(s)
+        await s.commit()
+    async with engine.begin() as conn:
+        # planner statistics, as SQL Server would have them
+        await conn.exec_driver_sql("ANALYZE")
+    return {"praktiker": 1, "other": 2}
+
+
+@contextmanager
+def timed(results: dict, key: str):
+    t = time.perf_counter()
+    yield
+    results[key] = round((time.perf_counter() - t) * 1000, 1)
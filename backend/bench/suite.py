@@ -0,0 +1,350 @@
+"""
+Hot-path benchmark suite: wall time, SQL statement count and peak Python
+memory per scenario and catalogue size, compared with a stored baseline.
+
+    cd backend && python -m bench.suite --sizes 1000 10000 100000
+    python -m bench.suite --sizes 1000 10000 --save-baseline   # after an intended change
+
+Scenarios go through the real code paths: HTTP endpoints via an in-process
+ASGI client, `auto_match_all` and `_run_email_job` called directly. Scraper
+traffic is served by an `httpx.MockTransport` from the recorded pages in
+`fixtures/` (every third barcode "not found"). Each scenario runs twice: once
+timed, once under tracemalloc for the memory peak, so tracing overhead does
+not leak into the wall time.
+
+A row regresses when wall time or peak memory exceed the baseline by more
+than --tolerance, when it issues more than 2% more SQL statements, or when
+it exceeds its statement budget (QUERY_BUDGETS); the exit code is 1 if any
+row regressed.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+from bench.common import engine, reset_db, seed
+
+import httpx  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+from app import crud, models, sqltrace  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.main import _run_email_job, app  # noqa: E402
+from app.routers.match import STREAM_BATCH  # noqa: E402
+from app.services import http_client, matcher, response_cache, scrapers  # noqa: E402
+# imported lazily by the app (first job / scrape): keep the import out of the timings
+from app.services import name_index, reports, scraper_praktiker  # noqa: E402,F401
+
+FIXTURES = Path(__file__).parent / "fixtures"
+BASELINE = Path(__file__).parent / "baseline.json"
+QUERY_SLACK = 1.02
+
+# ---------- recorded competitor site ----------
+
+SEARCH_PAGE = (FIXTURES / "praktiker_search_compact.html").read_text(encoding="utf-8")
+EMPTY_PAGE = (FIXTURES / "praktiker_search_empty.html").read_text(encoding="utf-8")
+
+
+def _mock_site(request: httpx.Request) -> httpx.Response:
+    barcode = request.url.params.get("query", "")
+    if zlib.crc32(barcode.encode()) % 3 == 0:
+        return httpx.Response(200, text=EMPTY_PAGE)
+    # the recorded page, re-keyed so every barcode maps to its own product
+    page = SEARCH_PAGE.replace("3838000100000", barcode).replace(
+        ">  300000  <", f">  P{barcode}  <", 1
+    )
+    return httpx.Response(200, text=page)
+
+
+# ---------- state ----------
+
+def catalogue(n: int, changed: float = 0.0, seed_: int = 7) -> list[dict]:
+    rnd = random.Random(seed_)
+    out = []
+    for i in range(1, n + 1):
+        price = round(rnd.uniform(1, 500), 2)
+        barcode = f"380{i:010d}" if rnd.random() < 0.7 else None
+        if changed and rnd.random() < changed:
+            price = round(price * 1.1, 2)
+        out.append({"sku": f"SKU{i:07d}", "name": f"Артикул {i}", "barcode": barcode, "price": price})
+    return out
+
+
+async def empty_db() -> None:
+    await reset_db()
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(models.Competitor),
+            [{"id": 1, "code": "praktiker", "name": "Praktiker", "base_url": "https://praktiker.bg"}],
+        )
+
+
+async def seeded_db(n: int) -> None:
+    """bench.common.seed + a tag (with email) on every other item, for the report job."""
+    await seed(n)
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(models.Tag), [{"id": 1, "name": "bench", "email": "bench@example.com"}]
+        )
+        for start in range(1, n + 1, 20000):
+            await conn.execute(
+                insert(models.ItemTag),
+                [{"item_id": i, "tag_id": 1} for i in range(start, min(n, start + 19999) + 1, 2)],
+            )
+
+
+async def post_items(items: list[dict]) -> None:
+    async with _asgi() as h:
+        r = await h.post("/items/upsert", json=items)
+        r.raise_for_status()
+
+
+def _asgi() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+
+# ---------- scenarios: (prepare(n), action(n)) ----------
+
+async def _prep_upsert_insert(n):
+    await empty_db()
+
+
+async def _upsert_insert(n):
+    await post_items(catalogue(n))
+
+
+async def _prep_upsert_update(n):
+    await empty_db()
+    await post_items(catalogue(n))
+
+
+async def _upsert_update(n):
+    await post_items(catalogue(n, changed=0.1))  # 10% new prices, rest unchanged
+
+
+async def _prep_auto_match(n):
+    await _prep_upsert_update(n)
+    scrapers.require("praktiker").cache.clear()
+
+
+async def _auto_match(n):
+    async with SessionLocal() as s:
+        comp = (
+            await s.execute(select(models.Competitor).where(models.Competitor.code == "praktiker"))
+        ).scalar_one()
+        await matcher.auto_match_all(s, comp)
+
+
+async def _prep_match_offline(n):
+    await _prep_upsert_update(n)
+    # a crawled catalogue: every item barcode, plus as many products we don't carry
+    rows = [
+        {
+            "competitor_id": 1,
+            "sku": f"C{i}",
+            "name": f"Продукт {i}",
+            "url": f"https://praktiker.bg/bg/p/{i}",
+            "barcode": f"380{i:010d}",
+        }
+        for i in range(1, 2 * n + 1)
+    ]
+    async with engine.begin() as conn:
+        for start in range(0, len(rows), 20000):
+            await conn.execute(insert(models.CompetitorProduct), rows[start:start + 20000])
+
+
+async def _match_offline(n):
+    async with SessionLocal() as s:
+        comp = (
+            await s.execute(select(models.Competitor).where(models.Competitor.code == "praktiker"))
+        ).scalar_one()
+        await matcher.match_offline(s, comp)
+
+
+async def _prep_tag_add(n):
+    await _prep_upsert_update(n)
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.Tag), [{"id": 1, "name": "bench"}])
+        # every other item is in the tag already: half the SKUs are duplicates
+        await conn.execute(insert(models.ItemTag), [{"item_id": i, "tag_id": 1} for i in range(1, n + 1, 2)])
+
+
+async def _tag_add(n):
+    async with _asgi() as h:
+        r = await h.post("/tags/1/items/add", json={"skus": [r["sku"] for r in catalogue(n)]})
+        r.raise_for_status()
+
+
+async def _prep_read(n):
+    response_cache.clear()
+
+
+async def _get(path: str) -> None:
+    async with _asgi() as h:
+        r = await h.get(path)
+        r.raise_for_status()
+        await r.aread()
+
+
+async def _view_table(n):
+    await _get("/match/view/praktiker?limit=200")
+
+
+async def _view_stream(n):
+    await _get("/match/view/praktiker/stream")
+
+
+async def _compare(n):
+    await _get("/compare/praktiker")
+
+
+async def _compare_export(n):
+    await _get("/compare/praktiker/export?format=xlsx")
+
+
+async def _compare_pivot(n):
+    await _get("/compare/pivot?limit=200")
+
+
+async def _email_job(n):
+    await _run_email_job(1)
+
+
+# hard ceilings on SQL statements per run (unlike the baseline, machine independent):
+# a constant per request, or per chunk / batch where the code works in chunks, so
+# a statement per row (N+1) fails at any size
+def _per(n: int, size: int) -> int:
+    return -(-n // size)
+
+
+QUERY_BUDGETS = {
+    "upsert_insert": lambda n: 2 + 2 * _per(n, crud.UPSERT_CHUNK),
+    # + the comparison refresh of the changed items
+    "upsert_update": lambda n: 2 + 4 * _per(n, crud.UPSERT_CHUNK),
+    # per batch: products, prices, matches, version bump; + the barcode cache flush
+    "auto_match": lambda n: 10 + 12 * _per(n, settings.MATCH_BATCH_SIZE) + 2 * _per(n, 1000),
+    # one INSERT ... SELECT + the version bump, whatever the size
+    "match_offline": lambda n: 3,
+    # tag lookup + per chunk a SKU lookup and one INSERT ... SELECT + the version bump
+    "tag_add": lambda n: 2 + 2 * _per(n, crud.UPSERT_CHUNK),
+    "view_table": lambda n: 3,
+    "view_stream": lambda n: 2 + _per(n, STREAM_BATCH),
+    "compare": lambda n: 3,
+    "compare_export": lambda n: 2 + _per(n, STREAM_BATCH),
+    "compare_pivot": lambda n: 3,
+    "email_job": lambda n: 4,
+}
+
+WRITE_SCENARIOS = {
+    "upsert_insert": (_prep_upsert_insert, _upsert_insert),
+    "upsert_update": (_prep_upsert_update, _upsert_update),
+    "auto_match": (_prep_auto_match, _auto_match),
+    "match_offline": (_prep_match_offline, _match_offline),
+    "tag_add": (_prep_tag_add, _tag_add),
+}
+# share one seeded database per size
+READ_SCENARIOS = {
+    "view_table": (_prep_read, _view_table),
+    "view_stream": (_prep_read, _view_stream),
+    "compare": (_prep_read, _compare),
+    "compare_export": (_prep_read, _compare_export),
+    "compare_pivot": (_prep_read, _compare_pivot),
+    "email_job": (_prep_read, _email_job),
+}
+
+
+async def measure(name: str, prepare, action, n: int) -> dict:
+    await prepare(n)
+    over_budget = None
+    try:
+        with sqltrace.query_budget(QUERY_BUDGETS[name](n), f"{name}@{n}") as q:
+            t = time.perf_counter()
+            await action(n)
+            wall = time.perf_counter() - t
+    except sqltrace.QueryBudgetExceeded as e:
+        over_budget = str(e)
+    queries = q.count
+
+    await prepare(n)
+    tracemalloc.start()
+    try:
+        await action(n)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall_ms": round(wall * 1000, 1),
+        "queries": queries,
+        "peak_mb": round(peak / 2**20, 2),
+        "over_budget": over_budget,
+    }
+
+
+def compare(key: str, row: dict, baseline: dict, tolerance: float) -> list[str]:
+    flags = ["query budget"] if row["over_budget"] else []
+    base = baseline.get(key)
+    if not base:
+        return flags
+    if row["wall_ms"] > base["wall_ms"] * (1 + tolerance):
+        flags.append(f"wall {base['wall_ms']}->{row['wall_ms']}ms")
+    # concurrent scrapes batch in arrival order: allow a little jitter
+    if row["queries"] > base["queries"] * QUERY_SLACK:
+        flags.append(f"queries {base['queries']}->{row['queries']}")
+    if row["peak_mb"] > base["peak_mb"] * (1 + tolerance):
+        flags.append(f"memory {base['peak_mb']}->{row['peak_mb']}MB")
+    return flags
+
+
+async def main(sizes: list[int], only: set[str] | None, save: bool, tolerance: float) -> int:
+    await http_client.start(httpx.MockTransport(_mock_site))
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    results, regressed = {}, 0
+    try:
+        for n in sizes:
+            groups = [(None, WRITE_SCENARIOS), (seeded_db, READ_SCENARIOS)]
+            for setup, scenarios in groups:
+                wanted = {k: v for k, v in scenarios.items() if not only or k in only}
+                if not wanted:
+                    continue
+                if setup:
+                    await setup(n)
+                for name, (prepare, action) in wanted.items():
+                    key = f"{name}@{n}"
+                    row = await measure(name, prepare, action, n)
+                    flags = compare(key, row, baseline, tolerance)
+                    regressed += bool(flags)
+                    over_budget = row.pop("over_budget")
+                    if over_budget:
+                        print(over_budget, file=sys.stderr)
+                    results[key] = row
+                    base = baseline.get(key, {})
+                    print(json.dumps({
+                        "scenario": name, "items": n, **row,
+                        "baseline_wall_ms": base.get("wall_ms"),
+                        "status": "REGRESSED: " + "; ".join(flags) if flags else "ok" if base else "new",
+                    }, ensure_ascii=False))
+    finally:
+        await http_client.close()
+        await engine.dispose()
+
+    if save:
+        BASELINE.write_text(json.dumps({**baseline, **results}, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written: {BASELINE}")
+        return 0
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--only", nargs="+", help="scenario names (default: all)")
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed wall/memory growth (0.25 = +25%%)")
+    args = ap.parse_args()
+    sys.exit(asyncio.run(main(args.sizes, set(args.only or ()), args.save_baseline, args.tolerance)))
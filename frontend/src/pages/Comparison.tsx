@@ -2,7 +2,7 @@ import React, { useEffect, useState } from 'react'
 import { api } from '../api'
 
 
-type Row = { our_sku:string; comp_sku?:string; our_name:string; comp_name?:string; our_price:number; comp_price?:number|null; diff?:number|null }
+type Row = { our_sku:string; comp_sku?:string; our_name:string; comp_name?:string; our_price:number; comp_price?:number|null; diff?:number|null; diff_pct?:number|null; price_age_s?:number|null }
 
 
 export default function Comparison(){
@@ -17,7 +17,7 @@ return (
 <thead>
 <tr>
 <th>Our SKU</th><th>Comp SKU</th><th>Our Name</th><th>Comp Name</th>
-<th>Our Price</th><th>Comp Price</th><th>Δ</th>
+<th>Our Price</th><th>Comp Price</th><th>Δ</th><th>Δ %</th>
 </tr>
 </thead>
 <tbody>
@@ -30,6 +30,7 @@ return (
 <td>{r.our_price.toFixed(2)}</td>
 <td>{r.comp_price?.toFixed(2) ?? '-'}</td>
 <td>{r.diff?.toFixed(2) ?? '-'}</td>
+<td>{r.diff_pct?.toFixed(1) ?? '-'}</td>
 </tr>
 ))}
 </tbody>
@@ -2,27 +2,54 @@ import React, { useEffect, useState } from 'react'
 import { api } from '../api'
 
 type Row = { item_id:number; our_sku:string; comp_barcode?:string|null; comp_url?:string|null; approved:boolean }
+type Page<T> = { items:T[]; next_cursor?:string|null; total?:number|null }
+
+const PAGE_SIZE = 200
 
 export default function MatchingNew(){
   const competitor = 'praktiker'
   const [rows, setRows] = useState<Row[]>([])
+  const [cursor, setCursor] = useState<string | null>(null)
+  const [total, setTotal] = useState<number | null>(null)
+  const [matched, setMatched] = useState<string>('')
+  const [skuPrefix, setSkuPrefix] = useState('')
   const [savingId, setSavingId] = useState<number | null>(null)
   const [inputs, setInputs] = useState<Record<number, string>>({})
 
+  function query(after: string | null){
+    const p = new URLSearchParams({ limit: String(PAGE_SIZE) })
+    if(after) p.set('cursor', after)
+    else p.set('with_total', 'true')
+    if(matched) p.set('matched', matched)
+    if(skuPrefix.trim()) p.set('sku_prefix', skuPrefix.trim())
+    return `/match/view/${competitor}?${p}`
+  }
+
   async function load(){
-    const data = await api<Row[]>(`/match/view/${competitor}`)
-    setRows(data)
+    const page = await api<Page<Row>>(query(null))
+    setRows(page.items)
+    setCursor(page.next_cursor ?? null)
+    setTotal(page.total ?? null)
+  }
+
+  async function loadMore(){
+    if(!cursor) return
+    const page = await api<Page<Row>>(query(cursor))
+    setRows(prev => [...prev, ...page.items])
+    setCursor(page.next_cursor ?? null)
   }
-  useEffect(()=>{ load() },[])
+  useEffect(()=>{ load() },[matched])
 
   async function saveManual(item_id:number){
     const barcode = (inputs[item_id] || '').trim()
     if(!barcode) return
     setSavingId(item_id)
     try{
-      await api(`/match/manual_by_barcode/${competitor}?item_id=${item_id}&competitor_barcode=${encodeURIComponent(barcode)}`, { method: 'POST' })
+      const r = await api<{comp_barcode:string; comp_url:string}>(`/match/manual_by_barcode/${competitor}?item_id=${item_id}&competitor_barcode=${encodeURIComponent(barcode)}`, { method: 'POST' })
       setInputs(p => ({...p, [item_id]: ''}))
-      await load()
+      // patch the row in place so the loaded pages are kept
+      setRows(prev => prev.map(x => x.item_id === item_id
+        ? { ...x, comp_barcode: r.comp_barcode, comp_url: r.comp_url, approved: true } : x))
     } finally {
       setSavingId(null)
     }
@@ -31,6 +58,16 @@ export default function MatchingNew(){
   return (
     <div style={{padding:16}}>
       <h2>Match items – Competitor: {competitor}</h2>
+      <div style={{display:'flex', gap:8, marginBottom:8}}>
+        <select value={matched} onChange={e=>setMatched(e.target.value)}>
+          <option value="">All items</option>
+          <option value="false">Unmatched</option>
+          <option value="true">Matched</option>
+        </select>
+        <input placeholder="SKU prefix" value={skuPrefix} onChange={e=>setSkuPrefix(e.target.value)}
+               onKeyDown={e=>{ if(e.key==='Enter') load() }} />
+        <span>{rows.length}{total !== null ? ` / ${total}` : ''} items</span>
+      </div>
       <table className="table">
         <thead>
           <tr>
@@ -66,6 +103,7 @@ export default function MatchingNew(){
           })}
         </tbody>
       </table>
+      {cursor && <button onClick={loadMore}>Load more</button>}
     </div>
   )
 }